@@ -1,16 +1,29 @@
 import streamlit as st
-import base64
-from PIL import Image
-import io
-from graph import ImageClassificationGraph
+from services import prepare_image, PreparedImage, render_metrics, ImageDownloader, ImageDownloadError
 import config
 from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel, HttpUrl
-import requests
+import atexit
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+import httpx
 import threading
 import uvicorn
-from io import BytesIO
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Union
+
+if TYPE_CHECKING:
+    from graph import ImageClassificationGraph
+
+# Streamlit re-executes this file on every widget interaction. Everything
+# expensive (the compiled graphs, model clients, caches, the API server) is
+# built behind st.cache_resource so it exists once per process and survives
+# reruns; module-level code below must stay cheap.
 
 # ==============================================================================
 # SECTION 1: FASTAPI BACKEND LOGIC
@@ -47,34 +60,43 @@ class ClassificationResponse(BaseModel):
     severity_level: str | None
     scale: str | None
 
-# Initialize Classification Logic (used by both apps)
-classifier = ImageClassificationGraph()
+# Initialize Classification Logic (used by both apps), once per process
+@st.cache_resource(show_spinner=False)
+def get_classifier() -> "ImageClassificationGraph":
+    """The compiled graphs with their result cache, duplicate index and quality filter"""
+    # langgraph, langchain and the OpenAI SDK load here, on first use, not on every rerun's import
+    from graph import ImageClassificationGraph
+    return ImageClassificationGraph()
 
 # Image Processing Helper Functions for FastAPI
-def process_image_to_base64(image_bytes: bytes) -> str:
+def process_image_bytes(image_bytes: Union[bytes, BinaryIO]) -> PreparedImage:
     try:
-        img = Image.open(BytesIO(image_bytes)).convert("RGB")
-        buffer = BytesIO()
-        img.save(buffer, format="JPEG")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+        return prepare_image(image_bytes)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image file: {e}")
 
-def download_image(image_url: str) -> bytes:
+# Pooled, size-capped downloads with a per-URL revalidation cache
+@st.cache_resource(show_spinner=False)
+def get_downloader() -> ImageDownloader:
+    return ImageDownloader.from_config(httpx.AsyncClient(
+        headers={'User-Agent': 'Mozilla/5.0'},
+        timeout=config.DOWNLOAD_TIMEOUT_SECONDS,
+        follow_redirects=True
+    ))
+
+async def download_image(image_url: str) -> PreparedImage:
     try:
-        response = requests.get(image_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-        response.raise_for_status()
-        return response.content
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=400, detail=f"Failed to download image: {e}")
+        return await get_downloader().fetch(image_url)
+    except ImageDownloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 # FastAPI Endpoints
 @fastapi_app.post("/classify", response_model=ClassificationResponse)
 async def classify_image_from_url(request: ImageRequest):
     try:
-        image_bytes = download_image(str(request.image_url))
-        image_base64 = process_image_to_base64(image_bytes)
-        result = classifier.process_image(image_base64)
+        # The download streams on the event loop and decodes in a worker thread
+        image = await download_image(str(request.image_url))
+        result = await get_classifier().aprocess_image(image.base64, detail=image.detail)
         return ClassificationResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -82,9 +104,9 @@ async def classify_image_from_url(request: ImageRequest):
 @fastapi_app.post("/classify-upload", response_model=ClassificationResponse)
 async def classify_image_from_upload(file: UploadFile = File(...)):
     try:
-        image_bytes = await file.read()
-        image_base64 = process_image_to_base64(image_bytes)
-        result = classifier.process_image(image_base64)
+        # Decode straight from the spooled upload rather than reading it into memory
+        image = await run_in_threadpool(process_image_bytes, file.file)
+        result = await get_classifier().aprocess_image(image.base64, detail=image.detail)
         return ClassificationResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -93,10 +115,32 @@ async def classify_image_from_upload(file: UploadFile = File(...)):
 async def health_check():
     return {"status": "healthy"}
 
+@fastapi_app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # ==============================================================================
 # SECTION 2: STREAMLIT UI LOGIC
 # ==============================================================================
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def prepare_upload(digest: str, _content: bytes) -> PreparedImage:
+    """
+    Preprocess an uploaded file, cached by its SHA-256 so analyzing the same
+    image again skips decoding and resizing. The bytes themselves are
+    excluded from Streamlit's argument hashing (leading underscore).
+    """
+    return prepare_image(_content)
+
+def analyze_upload(content: bytes) -> dict:
+    """
+    Classify an uploaded file. Results are left to the graph's own result
+    cache, which never keeps the "reject" of a failed model call.
+    """
+    image = prepare_upload(hashlib.sha256(content).hexdigest(), content)
+    return get_classifier().process_image(image.base64, detail=image.detail)
+
 def display_results_streamlit(result: dict):
     """Display classification results in Streamlit."""
     st.subheader("📋 Classification Result")
@@ -131,11 +175,8 @@ def streamlit_main():
             if st.button("🔍 Analyze Image", type="primary"):
                 with st.spinner("Analyzing..."):
                     try:
-                        image = Image.open(uploaded_file).convert("RGB")
-                        buffer = io.BytesIO()
-                        image.save(buffer, format="JPEG")
-                        img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                        result = classifier.process_image(img_base64)
+                        content = uploaded_file.getvalue()
+                        result = analyze_upload(content)
                         display_results_streamlit(result)
                     except Exception as e:
                         st.error(f"An error occurred: {e}")
@@ -146,12 +187,48 @@ def streamlit_main():
 
 def run_fastapi():
     """Function to run the FastAPI server."""
-    uvicorn.run(fastapi_app, host="0.0.0.0", port=8000)
+    uvicorn.run(fastapi_app, host=config.STREAMLIT_API_HOST, port=config.STREAMLIT_API_PORT)
+
+def _port_in_use(host: str, port: int) -> bool:
+    probe_host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.5)
+        return sock.connect_ex((probe_host, port)) == 0
+
+@st.cache_resource(show_spinner=False)
+def start_api_server() -> Dict[str, Any]:
+    """
+    Start the embedded API exactly once per Streamlit process.
+
+    "thread" serves it from this process (sharing the GIL with the UI),
+    "process" runs it under its own interpreter so UI reruns add no latency
+    to API requests, and "off" disables it. Nothing is started when the
+    port is already taken, e.g. by another Streamlit session's server.
+    """
+    mode = config.STREAMLIT_API_MODE
+    host, port = config.STREAMLIT_API_HOST, config.STREAMLIT_API_PORT
+    if mode == "off":
+        return {"mode": "off"}
+    if _port_in_use(host, port):
+        return {"mode": "external", "port": port}
+    
+    if mode == "process":
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:fastapi_app", "--host", host, "--port", str(port)],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        atexit.register(server.terminate)
+        return {"mode": "process", "port": port, "pid": server.pid}
+    
+    fastapi_thread = threading.Thread(target=run_fastapi, daemon=True, name="embedded-api")
+    fastapi_thread.start()
+    return {"mode": "thread", "port": port}
 
 if __name__ == "__main__":
-    # Run FastAPI in a separate thread
-    fastapi_thread = threading.Thread(target=run_fastapi, daemon=True)
-    fastapi_thread.start()
+    # Runs on every rerun; the server itself only starts on the first one
+    server = start_api_server()
     
     # Run the Streamlit app in the main thread
-    streamlit_main()
\ No newline at end of file
+    streamlit_main()
+    if server["mode"] != "off":
+        st.sidebar.caption(f"API on port {server['port']} ({server['mode']})")
\ No newline at end of file
@@ -0,0 +1 @@
+"""Offline load tests and micro-benchmarks; see the Benchmarks section of README.md"""
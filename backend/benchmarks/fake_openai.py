@@ -0,0 +1,232 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Answers /v1/chat/completions with valid structured outputs for the schemas
+the graph requests (ImageAnalysis, ClassificationResult, FastClassification),
+after a latency drawn from a log-normal distribution, and fails a
+configurable share of requests with 429 or 500 responses. Point the app at
+it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Run standalone:
+    python -m benchmarks.fake_openai --port 9100 --latency-ms 1500 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, get_args
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from models.schemas import ClassificationResult
+
+
+# Read from the schema rather than config, which must not be imported before the benchmark sets its environment
+CATEGORIES = [name for name in get_args(ClassificationResult.model_fields["category"].annotation) if name != "reject"]
+
+
+@dataclass
+class FakeOpenAISettings:
+    """Latency and failure behaviour of the fake API"""
+
+    # Median latency and log-normal spread; sigma 0 makes every call take exactly the median
+    latency_ms: float = 1500.0
+    latency_sigma: float = 0.35
+    # Share of requests answered with 429 (with Retry-After) and with 500
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    # Share of analyses flagged as indoor/household and of classifications that are "reject"
+    household_rate: float = 0.1
+    reject_rate: float = 0.15
+    prompt_tokens: int = 1100
+    completion_tokens: int = 180
+    seed: Optional[int] = None
+
+    def latency_seconds(self, rng: random.Random) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return rng.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+
+def _analysis(rng: random.Random, settings: FakeOpenAISettings) -> Dict[str, Any]:
+    household = rng.random() < settings.household_rate
+    return {
+        "description": "A roadside scene with scattered plastic waste" if not household else "A kitchen bin",
+        "objects_detected": ["plastic bags", "bottles", "road"],
+        "environment_type": "indoor household" if household else "urban outdoor",
+        "is_indoor_household": household,
+        "lighting_conditions": "daylight",
+        "image_quality": "clear",
+        "potential_issues": ["litter"],
+        "legitimacy_assessment": "Public space issue" if not household else "Personal household waste"
+    }
+
+
+def _classification(rng: random.Random, settings: FakeOpenAISettings) -> Dict[str, Any]:
+    confidence = round(rng.uniform(0.55, 0.98), 2)
+    if rng.random() < settings.reject_rate:
+        return {
+            "category": "reject",
+            "severity": None,
+            "severity_level": None,
+            "scale": None,
+            "confidence": confidence,
+            "reasoning": "No public environmental issue is visible."
+        }
+
+    severity = rng.randint(5, 95)
+    levels = ["low", "low-high", "moderate", "moderate-high", "high", "extreme"]
+    return {
+        "category": rng.choice(CATEGORIES),
+        "severity": severity,
+        "severity_level": levels[min(len(levels) - 1, severity * len(levels) // 100)],
+        "scale": rng.choice(["small pile", "large pothole", "single tree cut", "extensive dumping"]),
+        "confidence": confidence,
+        "reasoning": "Synthetic benchmark answer."
+    }
+
+
+def _structured_output(schema_name: str, rng: random.Random, settings: FakeOpenAISettings) -> Dict[str, Any]:
+    if schema_name == "ImageAnalysis":
+        return _analysis(rng, settings)
+    if schema_name == "ClassificationResult":
+        return _classification(rng, settings)
+    if schema_name == "FastClassification":
+        return {"analysis": _analysis(rng, settings), "classification": _classification(rng, settings)}
+    return {}
+
+
+def _schema_name(body: Dict[str, Any]) -> str:
+    """Which pydantic schema the client asked for, via json_schema response_format or a forced tool"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return response_format.get("json_schema", {}).get("name", "")
+    for tool in body.get("tools") or []:
+        return tool.get("function", {}).get("name", "")
+    return ""
+
+
+def create_app(settings: Optional[FakeOpenAISettings] = None) -> FastAPI:
+    """Build the fake API; counters are kept on app.state.counts"""
+    settings = settings or FakeOpenAISettings()
+    rng = random.Random(settings.seed)
+    app = FastAPI(title="Fake OpenAI API")
+    app.state.settings = settings
+    app.state.counts = {"requests": 0, "rate_limited": 0, "errors": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.counts["requests"] += 1
+        await asyncio.sleep(settings.latency_seconds(rng))
+
+        roll = rng.random()
+        if roll < settings.rate_limit_rate:
+            app.state.counts["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": "1", "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1s"}
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            app.state.counts["errors"] += 1
+            return JSONResponse({"error": {"message": "Internal error", "type": "server_error"}}, status_code=500)
+
+        schema_name = _schema_name(body)
+        arguments = json.dumps(_structured_output(schema_name, rng, settings))
+        message: Dict[str, Any] = {"role": "assistant", "content": arguments}
+        finish_reason = "stop"
+        if body.get("tools"):
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": schema_name, "arguments": arguments}
+                }]
+            }
+            finish_reason = "tool_calls"
+
+        return JSONResponse(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": {
+                    "prompt_tokens": settings.prompt_tokens,
+                    "completion_tokens": settings.completion_tokens,
+                    "total_tokens": settings.prompt_tokens + settings.completion_tokens
+                }
+            },
+            headers={
+                "x-ratelimit-limit-requests": "10000",
+                "x-ratelimit-remaining-requests": "9999",
+                "x-ratelimit-limit-tokens": "2000000",
+                "x-ratelimit-remaining-tokens": "1999000"
+            }
+        )
+
+    @app.get("/fixtures/{name}")
+    async def fixture(name: str):
+        """Serve fixture images so /classify can download them"""
+        fixtures = getattr(app.state, "fixtures", {})
+        if name not in fixtures:
+            return JSONResponse({"detail": "Not found"}, status_code=404)
+        content, content_type = fixtures[name]
+        return Response(content=content, media_type=content_type)
+
+    return app
+
+
+class ServerThread:
+    """Run an ASGI app with uvicorn on a background thread"""
+
+    def __init__(self, app: Any, port: int, host: str = "127.0.0.1"):
+        self.url = f"http://{host}:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "ServerThread":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=1500)
+    parser.add_argument("--latency-sigma", type=float, default=0.35)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = FakeOpenAISettings(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
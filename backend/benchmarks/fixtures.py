@@ -0,0 +1,88 @@
+"""
+Synthetic fixture images covering the sizes and formats users upload.
+
+Images are generated deterministically instead of being checked in: a
+colour gradient with textured noise and random shapes, which has the
+sharpness and colour spread of a photo, so it passes the quality gate and
+costs the encoders a realistic amount of work.
+"""
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+@dataclass(frozen=True)
+class Fixture:
+    name: str
+    size: Tuple[int, int]
+    format: str
+    mode: str = "RGB"
+    options: Tuple[Tuple[str, object], ...] = ()
+
+    @property
+    def content_type(self) -> str:
+        return f"image/{self.format.lower()}"
+
+
+FIXTURES: List[Fixture] = [
+    Fixture("small.jpg", (640, 480), "JPEG", options=(("quality", 85),)),
+    Fixture("phone-12mp.jpg", (4032, 3024), "JPEG", options=(("quality", 92),)),
+    Fixture("phone-12mp-progressive.jpg", (4032, 3024), "JPEG", options=(("quality", 90), ("progressive", True))),
+    Fixture("portrait-8mp.jpg", (2448, 3264), "JPEG", options=(("quality", 88),)),
+    Fixture("tall-lossless.png", (1170, 2532), "PNG"),
+    Fixture("transparent.png", (1600, 1200), "PNG", mode="RGBA"),
+    Fixture("photo.webp", (3000, 2000), "WEBP", options=(("quality", 85),)),
+    Fixture("palette.gif", (800, 600), "GIF", mode="P"),
+]
+
+
+def _photo_like(size: Tuple[int, int], seed: int) -> Image.Image:
+    """Gradient plus noise plus shapes, so sharpness and colour entropy look like a photo"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    # Build the texture small and upscale it, which keeps generation of 12 MP images fast
+    small = (max(1, width // 4), max(1, height // 4))
+    y, x = np.mgrid[0:small[1], 0:small[0]].astype(np.float32)
+    base = np.stack([
+        120 + 80 * np.sin(x / 37.0) * np.cos(y / 53.0),
+        110 + 60 * np.cos(x / 29.0 + y / 41.0),
+        90 + 50 * np.sin((x + y) / 61.0)
+    ], axis=-1)
+    base += rng.normal(0, 18, base.shape)
+    image = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB").resize(size, Image.Resampling.BILINEAR)
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        x1, y1 = x0 + int(rng.integers(10, width // 6 + 11)), y0 + int(rng.integers(10, height // 6 + 11))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), outline=color, width=int(rng.integers(2, 12)))
+    return image
+
+
+def render(fixture: Fixture, seed: int = 0) -> bytes:
+    """Encode one fixture to bytes"""
+    image = _photo_like(fixture.size, seed)
+    if fixture.mode == "RGBA":
+        alpha = Image.linear_gradient("L").resize(fixture.size)
+        image.putalpha(alpha)
+    elif fixture.mode == "P":
+        image = image.quantize(colors=256)
+
+    buffer = BytesIO()
+    image.save(buffer, format=fixture.format, **dict(fixture.options))
+    return buffer.getvalue()
+
+
+def build_fixtures(seed: int = 0) -> Dict[str, Tuple[bytes, str]]:
+    """Render every fixture, returning {name: (bytes, content type)}"""
+    return {
+        fixture.name: (render(fixture, seed + index), fixture.content_type)
+        for index, fixture in enumerate(FIXTURES)
+    }
@@ -0,0 +1,219 @@
+"""
+Offline load test for the FastAPI service.
+
+Starts the fake OpenAI API and fastapi_app on local ports, then drives
+/classify and /classify-upload with the fixture images at a fixed
+concurrency and reports throughput, latency percentiles, status codes and
+the server process's peak memory. No OpenAI credits are used.
+
+    python -m benchmarks.load_test --requests 200 --concurrency 20 --latency-ms 1500
+
+Caches and near-duplicate detection are disabled unless --keep-caches is
+given, since every fixture is requested many times.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_openai import FakeOpenAISettings, ServerThread, create_app
+from benchmarks.fixtures import build_fixtures
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (Linux), 0 when unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of an unsorted sample list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+async def _sample_memory(peak: Dict[str, int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        peak["rss"] = max(peak["rss"], rss_bytes())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120.0) -> None:
+    """Wait for /ready, so the background warm-up is not counted as request latency"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError(f"Service was not ready after {timeout:.0f}s")
+
+
+async def run_load(
+    base_url: str,
+    fixtures: Dict[str, Any],
+    fixture_base_url: str,
+    endpoint: str,
+    requests: int,
+    concurrency: int,
+    mode: Optional[str] = None
+) -> Dict[str, Any]:
+    """Send `requests` requests with `concurrency` in flight and summarize the outcome"""
+    names = sorted(fixtures)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    per_fixture: Dict[str, List[float]] = {name: [] for name in names}
+    peak = {"rss": rss_bytes()}
+    stop = asyncio.Event()
+    counter = iter(range(requests))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+
+        async def one(index: int) -> None:
+            name = names[index % len(names)]
+            use_upload = endpoint == "upload" or (endpoint == "both" and index % 2)
+            started = time.perf_counter()
+            try:
+                if use_upload:
+                    content, content_type = fixtures[name]
+                    response = await client.post(
+                        "/classify-upload",
+                        params={"mode": mode} if mode else None,
+                        files={"file": (name, content, content_type)}
+                    )
+                else:
+                    body = {"image_url": f"{fixture_base_url}/fixtures/{name}"}
+                    if mode:
+                        body["mode"] = mode
+                    response = await client.post("/classify", json=body)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            elapsed = time.perf_counter() - started
+            latencies.append(elapsed)
+            per_fixture[name].append(elapsed)
+
+        async def worker() -> None:
+            for index in counter:
+                await one(index)
+
+        await wait_ready(client)
+        sampler = asyncio.create_task(_sample_memory(peak, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(requests / duration, 2) if duration else 0.0,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+            "max": round(max(latencies), 4) if latencies else 0.0
+        },
+        "status_codes": {str(code): count for code, count in sorted(statuses.items(), key=str)},
+        "per_fixture_p50_seconds": {name: round(percentile(values, 50), 4) for name, values in per_fixture.items()},
+        "memory": {
+            "peak_rss_mb": round(peak["rss"] / 2**20, 1),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test against a fake OpenAI API")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoint", choices=["classify", "upload", "both"], default="both")
+    parser.add_argument("--mode", choices=["accurate", "fast"], default=None)
+    parser.add_argument("--latency-ms", type=float, default=1500, help="Median fake OpenAI latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="Log-normal spread of the latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 500")
+    parser.add_argument("--keep-caches", action="store_true", help="Leave the result cache and dedupe index on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON only")
+    args = parser.parse_args()
+
+    fake_settings = FakeOpenAISettings(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    fake_app = create_app(fake_settings)
+    fake_app.state.fixtures = build_fixtures(args.seed)
+    fake_port, app_port = _free_port(), _free_port()
+
+    # Settings are read at import time, so configure the service before importing it
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "JOB_DB_PATH": "",
+    })
+    if not args.keep_caches:
+        os.environ.update({"RESULT_CACHE_ENABLED": "false", "PHASH_ENABLED": "false"})
+    import fastapi_app
+
+    with ServerThread(fake_app, fake_port) as fake_server, ServerThread(fastapi_app.app, app_port) as app_server:
+        report = asyncio.run(run_load(
+            app_server.url,
+            fake_app.state.fixtures,
+            fake_server.url,
+            args.endpoint,
+            args.requests,
+            args.concurrency,
+            args.mode
+        ))
+        report["fake_openai"] = dict(fake_app.state.counts)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    latency = report["latency_seconds"]
+    print(f"{report['requests']} requests to {args.endpoint} at concurrency {args.concurrency}")
+    print(f"  throughput   {report['throughput_rps']} req/s over {report['duration_seconds']} s")
+    print(f"  latency      p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"  status codes {report['status_codes']}")
+    print(f"  memory       peak RSS {report['memory']['peak_rss_mb']} MB")
+    print(f"  fake OpenAI  {report['fake_openai']}")
+    for name, value in report["per_fixture_p50_seconds"].items():
+        print(f"  {name:<28} p50 {value}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Micro-benchmarks for the CPU-side image work done per request.
+
+Times prepare_image for every fixture and profile (from bytes, and from a
+spooled upload file as /classify-upload does), the perceptual hashes and the
+quality gate. Reports median/min milliseconds, output size, the peak Python
+heap allocated per call (tracemalloc; PIL's C-level pixel buffers are not
+traced, so this tracks copies of encoded bytes and NumPy arrays) and the
+peak resident memory one call adds, measured in a forked child so pixel
+buffers count too. That last column is the per-request memory budget of the
+image path; --budget-mb fails the run when any row exceeds it.
+
+    python -m benchmarks.preprocess_bench --repeat 7
+    python -m benchmarks.preprocess_bench --json > baseline.json
+    python -m benchmarks.preprocess_bench --budget-mb 80
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from benchmarks.fixtures import build_fixtures
+from benchmarks.load_test import rss_bytes
+from services import PROFILES, ImageQualityFilter, compute_hash, prepare_image
+
+
+def peak_rss_mb(func: Callable[[], Any]) -> Optional[float]:
+    """Peak resident memory one call adds, measured in a forked child; None where fork is unavailable"""
+    if not hasattr(os, "fork"):
+        return None
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # A forked child starts with a fresh high-water mark at its current RSS
+        try:
+            os.close(read_fd)
+            started = rss_bytes()
+            func()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            os.write(write_fd, str(max(0, peak - started)).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        value = pipe.read()
+    os.waitpid(pid, 0)
+    return round(int(value) / 2**20, 2) if value else None
+
+
+def spooled(content: bytes) -> BinaryIO:
+    """The content as a spooled upload that has rolled over to disk, like a large multipart file"""
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(content)
+    spool.seek(0)
+    return spool
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Median and min wall time over `repeat` runs, plus the peak heap of one extra traced run"""
+    func()  # Warm-up: imports, codec initialisation
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "peak_py_alloc_mb": round(peak / 2**20, 2),
+        "peak_rss_mb": peak_rss_mb(func)
+    }
+
+
+def run(repeat: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Benchmark every fixture and return one row per (fixture, operation)"""
+    rows = []
+    quality_filter = ImageQualityFilter()
+    for name, (content, _) in build_fixtures(seed).items():
+        for profile in PROFILES:
+            prepared = prepare_image(content, profile)
+            rows.append({
+                "fixture": name,
+                "operation": f"prepare_image[{profile}]",
+                "input_kb": round(len(content) / 1024, 1),
+                "output_kb": round(prepared.output_bytes / 1024, 1),
+                "passthrough": prepared.passthrough,
+                **measure(lambda: prepare_image(content, profile), repeat)
+            })
+
+        # Uploads are decoded straight from the spooled file
+        upload = spooled(content)
+        rows.append({
+            "fixture": name,
+            "operation": "prepare_image[spooled]",
+            "input_kb": round(len(content) / 1024, 1),
+            "output_kb": round(prepare_image(upload).output_bytes / 1024, 1),
+            "passthrough": False,
+            **measure(lambda: prepare_image(upload), repeat)
+        })
+        upload.close()
+
+        # Hashing and the quality gate run on the prepared payload, as in the graph
+        prepared = prepare_image(content)
+        for operation, func in (
+            ("phash", lambda: compute_hash(prepared.base64, "phash")),
+            ("dhash", lambda: compute_hash(prepared.base64, "dhash")),
+            ("quality_gate", lambda: quality_filter.measure(prepared.base64)),
+        ):
+            rows.append({
+                "fixture": name,
+                "operation": operation,
+                "input_kb": round(prepared.output_bytes / 1024, 1),
+                **measure(func, repeat)
+            })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for image preprocessing")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON for diffing against a baseline")
+    parser.add_argument("--budget-mb", type=float, default=None, help="Fail when a call's peak RSS exceeds this")
+    args = parser.parse_args()
+
+    rows = run(args.repeat, args.seed)
+    over_budget = [
+        row for row in rows
+        if args.budget_mb is not None and (row["peak_rss_mb"] or 0) > args.budget_mb
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(
+            f"{'fixture':<28} {'operation':<26} {'in KB':>8} {'out KB':>8} "
+            f"{'median ms':>10} {'min ms':>9} {'py MB':>8} {'rss MB':>8}"
+        )
+        for row in rows:
+            print(
+                f"{row['fixture']:<28} {row['operation']:<26} {row['input_kb']:>8} "
+                f"{row.get('output_kb', ''):>8} {row['median_ms']:>10} {row['min_ms']:>9} "
+                f"{row['peak_py_alloc_mb']:>8} {row['peak_rss_mb'] if row['peak_rss_mb'] is not None else '':>8}"
+            )
+
+    if over_budget:
+        for row in over_budget:
+            print(
+                f"over budget: {row['fixture']} {row['operation']} {row['peak_rss_mb']} MB > {args.budget_mb} MB",
+                file=sys.stderr
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Offline evaluation and profiling of the classification graph on a directory of images.
+
+Each image is preprocessed as the API does and run through
+ImageClassificationGraph with its OpenAI calls answered from a cassette
+(services/cassette.py), so runs need no network, cost nothing and give
+the same answers every time. Record the cassette once against the real
+API (or the benchmark fake), commit it, then replay it in CI:
+
+    python -m benchmarks.replay images/ --labels labels.csv --cassette-mode record
+    python -m benchmarks.replay images/ --labels labels.csv --min-accuracy 0.85
+    python -m benchmarks.replay images/ --json > baseline.json
+
+Labels come from a CSV of path,category[,severity] rows (paths relative
+to the image directory) or, without one, from an image's parent directory
+when it is named after a category (images/potholes/a.jpg). Images are
+spread over worker processes that classify one image at a time, so a
+node's CPU time (process time, which counts the OpenAI client's helper
+threads) belongs to that image alone. The report gives accuracy with a
+confusion matrix, severity error, per-node wall and CPU time,
+preprocessing time and sizes, cassette hits and misses, and each
+worker's peak RSS. Prompt changes alter the requests, so they show up as
+cassette misses until re-recorded with --cassette-mode auto.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.load_test import percentile
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+LABELS = ("garbage", "potholes", "deforestation", "reject")
+
+# Set in each worker process by _start_worker
+_graph: Any = None
+_settings: Dict[str, Any] = {}
+
+
+def find_images(directory: str) -> List[str]:
+    """Image paths under directory, relative to it, in a stable order"""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(found)
+
+
+def load_labels(directory: str, images: List[str], labels_path: Optional[str]) -> Dict[str, Tuple[str, Optional[int]]]:
+    """(category, severity) per image, from the CSV or the images' parent directory names"""
+    labels: Dict[str, Tuple[str, Optional[int]]] = {}
+    if labels_path:
+        with open(labels_path, newline="") as file:
+            for row in csv.reader(file):
+                if len(row) < 2 or row[1].strip().lower() not in LABELS:
+                    continue  # Header or malformed row
+                severity = row[2].strip() if len(row) > 2 else ""
+                labels[os.path.normpath(row[0].strip())] = (
+                    row[1].strip().lower(), int(severity) if severity.isdigit() else None
+                )
+        return labels
+    for image in images:
+        parent = os.path.basename(os.path.dirname(image)).lower()
+        if parent in LABELS:
+            labels[image] = (parent, None)
+    return labels
+
+
+def _start_worker(settings: Dict[str, Any]) -> None:
+    """Build the graph once per worker; config.py reads the environment set up by main()"""
+    global _graph, _settings
+    from graph import ImageClassificationGraph
+
+    _settings = settings
+    _graph = ImageClassificationGraph(mode=settings["mode"])
+
+
+def _classify(directory: str, image: str) -> Dict[str, Any]:
+    """Preprocess and classify one image in this worker, with its timings and cassette use"""
+    from services import DeadlineExceeded, ImagePreprocessingError, get_llm_registry, prepare_image, trace_run
+
+    cassette = get_llm_registry().cassette
+    before = cassette.stats() if cassette is not None else {}
+    with open(os.path.join(directory, image), "rb") as file:
+        data = file.read()
+
+    outcome: Dict[str, Any] = {"image": image, "pid": os.getpid(), "mode": _graph.mode, "error": None}
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        prepared = prepare_image(data, _settings["profile"])
+    except ImagePreprocessingError as e:
+        outcome.update(result=None, error=f"preprocessing: {e}")
+        return outcome
+    outcome["preprocess"] = {
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+        "cpu_ms": round((time.process_time() - cpu_started) * 1000, 2),
+        "input_bytes": prepared.input_bytes,
+        "output_bytes": prepared.output_bytes,
+        "passthrough": prepared.passthrough
+    }
+
+    started = time.perf_counter()
+    # One image at a time per process, so process CPU time covers the nodes' helper threads
+    with trace_run(time.process_time) as trace:
+        try:
+            outcome["result"] = _graph.process_image(
+                prepared.base64, detail=prepared.detail, source_size=prepared.original_size
+            )
+        except DeadlineExceeded as e:
+            outcome.update(result=None, error=f"deadline: {e}")
+    outcome["ms"] = round((time.perf_counter() - started) * 1000, 2)
+    outcome["nodes"] = trace.nodes
+    outcome["model_calls"] = trace.model_calls
+    if cassette is not None:
+        after = cassette.stats()
+        outcome["cassette"] = {key: after[key] - before[key] for key in ("hits", "misses", "recorded")}
+    outcome["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return outcome
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    return {
+        "p50": round(statistics.median(samples), 2),
+        "p95": round(percentile(samples, 95), 2),
+        "mean": round(statistics.fmean(samples), 2),
+        "total": round(sum(samples), 1)
+    }
+
+
+def evaluate(outcomes: List[Dict[str, Any]], labels: Dict[str, Tuple[str, Optional[int]]]) -> Dict[str, Any]:
+    """Accuracy, per-category precision and recall, confusion matrix and severity error"""
+    confusion: Dict[str, Counter] = defaultdict(Counter)
+    severity_errors = []
+    for outcome in outcomes:
+        label = labels.get(os.path.normpath(outcome["image"]))
+        if label is None:
+            continue
+        predicted = (outcome.get("result") or {}).get("category") or "error"
+        confusion[label[0]][predicted] += 1
+        severity = (outcome.get("result") or {}).get("severity")
+        if label[1] is not None and severity is not None:
+            severity_errors.append(abs(severity - label[1]))
+
+    labelled = sum(sum(row.values()) for row in confusion.values())
+    correct = sum(confusion[category][category] for category in confusion)
+    per_category = {}
+    for category in LABELS:
+        row = confusion.get(category, Counter())
+        predicted = sum(other[category] for other in confusion.values())
+        actual = sum(row.values())
+        if predicted or actual:
+            per_category[category] = {
+                "precision": round(row[category] / predicted, 3) if predicted else None,
+                "recall": round(row[category] / actual, 3) if actual else None,
+                "support": actual
+            }
+    return {
+        "labelled": labelled,
+        "accuracy": round(correct / labelled, 4) if labelled else None,
+        "per_category": per_category,
+        "confusion": {label: dict(row) for label, row in sorted(confusion.items())},
+        "severity_mae": round(statistics.fmean(severity_errors), 2) if severity_errors else None
+    }
+
+
+def profile(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-node wall and CPU time, model calls, preprocessing cost, cassette use and peak memory"""
+    node_ms: Dict[str, List[float]] = defaultdict(list)
+    node_cpu_ms: Dict[str, List[float]] = defaultdict(list)
+    calls: Counter = Counter()
+    tokens: Counter = Counter()
+    cassette: Counter = Counter()
+    peak_rss: Dict[int, float] = {}
+    preprocess = [outcome["preprocess"] for outcome in outcomes if "preprocess" in outcome]
+    for outcome in outcomes:
+        for node in outcome.get("nodes", []):
+            node_ms[node["node"]].append(node["ms"])
+            if node["cpu_ms"] is not None:
+                node_cpu_ms[node["node"]].append(node["cpu_ms"])
+        for call in outcome.get("model_calls", []):
+            calls[call["model"]] += 1
+            tokens["input"] += call["input_tokens"] or 0
+            tokens["output"] += call["output_tokens"] or 0
+        cassette.update(outcome.get("cassette", {}))
+        if "peak_rss_mb" in outcome:
+            peak_rss[outcome["pid"]] = max(peak_rss.get(outcome["pid"], 0), outcome["peak_rss_mb"])
+
+    return {
+        "graph_ms": _summary([outcome["ms"] for outcome in outcomes if "ms" in outcome]),
+        "nodes": {
+            node: {"runs": len(node_ms[node]), "ms": _summary(node_ms[node]), "cpu_ms": _summary(node_cpu_ms[node])}
+            for node in node_ms
+        },
+        "model_calls": dict(calls),
+        "tokens": dict(tokens),
+        "preprocess": {
+            "ms": _summary([item["ms"] for item in preprocess]),
+            "cpu_ms": _summary([item["cpu_ms"] for item in preprocess]),
+            "mean_input_kb": round(statistics.fmean(item["input_bytes"] for item in preprocess) / 1024, 1) if preprocess else None,
+            "mean_output_kb": round(statistics.fmean(item["output_bytes"] for item in preprocess) / 1024, 1) if preprocess else None,
+            "passthrough": sum(1 for item in preprocess if item["passthrough"])
+        },
+        "cassette": dict(cassette),
+        "peak_rss_mb": {"max": max(peak_rss.values(), default=None), "workers": len(peak_rss)}
+    }
+
+
+def run(directory: str, labels_path: Optional[str], workers: int, mode: Optional[str], image_profile: Optional[str]) -> Dict[str, Any]:
+    images = find_images(directory)
+    labels = load_labels(directory, images, labels_path)
+    settings = {"mode": mode, "profile": image_profile}
+
+    started = time.perf_counter()
+    # Spawned workers start from the environment main() set, with no state shared with this process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_worker, initargs=(settings,)) as pool:
+        outcomes = list(pool.map(_classify, [directory] * len(images), images))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "images": len(images),
+        "workers": workers,
+        "mode": outcomes[0]["mode"] if outcomes else mode,
+        "cassette_mode": os.environ["LLM_CASSETTE_MODE"],
+        "seconds": round(elapsed, 2),
+        "errors": sum(1 for outcome in outcomes if outcome["error"]),
+        "evaluation": evaluate(outcomes, labels),
+        "profile": profile(outcomes),
+        "results": outcomes
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    evaluation, measured = report["evaluation"], report["profile"]
+    print(f"{report['images']} images, {report['workers']} workers, {report['mode']} mode, "
+          f"cassette {report['cassette_mode']}: {report['seconds']}s, {report['errors']} errors")
+    print(f"cassette: {measured['cassette']}")
+    if evaluation["labelled"]:
+        print(f"accuracy {evaluation['accuracy']:.1%} on {evaluation['labelled']} labelled images, "
+              f"severity MAE {evaluation['severity_mae']}")
+        for category, scores in evaluation["per_category"].items():
+            print(f"  {category:<14} precision {scores['precision']}  recall {scores['recall']}  n={scores['support']}")
+        print(f"confusion (label -> predicted): {evaluation['confusion']}")
+    print(f"{'node':<16} {'runs':>5} {'wall p50':>9} {'wall p95':>9} {'cpu p50':>8} {'cpu p95':>8} {'cpu total':>10}")
+    for node, timing in measured["nodes"].items():
+        cpu = timing["cpu_ms"]
+        print(f"{node:<16} {timing['runs']:>5} {timing['ms']['p50']:>9} {timing['ms']['p95']:>9} "
+              f"{cpu.get('p50', '-'):>8} {cpu.get('p95', '-'):>8} {cpu.get('total', '-'):>10}")
+    preprocess = measured["preprocess"]
+    print(f"preprocess: wall p50 {preprocess['ms'].get('p50')} ms, cpu p50 {preprocess['cpu_ms'].get('p50')} ms, "
+          f"{preprocess['mean_input_kb']} KB -> {preprocess['mean_output_kb']} KB, {preprocess['passthrough']} passthrough")
+    print(f"model calls {measured['model_calls']}, tokens {measured['tokens']}, "
+          f"peak RSS {measured['peak_rss_mb']['max']} MB per worker")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a directory of images through the graph from a cassette")
+    parser.add_argument("images", help="Directory of images, searched recursively")
+    parser.add_argument("--labels", default=None, help="CSV of path,category[,severity]; defaults to parent directory names")
+    parser.add_argument("--cassettes", default=None, help="Cassette directory (default: LLM_CASSETTE_DIR)")
+    parser.add_argument("--cassette-mode", choices=("replay", "record", "auto"), default="replay")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=("accurate", "fast"), default=None, help="Graph topology (default: CLASSIFICATION_MODE)")
+    parser.add_argument("--profile", default=None, help="Preprocessing profile (default: IMAGE_PROFILE)")
+    parser.add_argument("--json", action="store_true", help="Print the report, with every image's result, as JSON")
+    parser.add_argument("--min-accuracy", type=float, default=None, help="Fail when accuracy on labelled images is lower")
+    parser.add_argument("--allow-misses", action="store_true", help="Do not fail when a replayed request has no cassette entry")
+    args = parser.parse_args()
+
+    # Workers read these through config.py. Caches, duplicate and incident reuse would make a
+    # result depend on what ran before it, and hedging would double the model calls
+    os.environ["LLM_CASSETTE_MODE"] = args.cassette_mode
+    if args.cassettes:
+        os.environ["LLM_CASSETTE_DIR"] = args.cassettes
+    if args.cassette_mode == "replay":
+        os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+    for name in ("RESULT_CACHE_ENABLED", "PHASH_ENABLED", "INCIDENT_CLUSTERING_ENABLED",
+                 "ANALYSIS_LOG_ENABLED", "LLM_HEDGING_ENABLED"):
+        os.environ[name] = "false"
+    os.environ["METRICS_ENABLED"] = "true"
+
+    report = run(args.images, args.labels, max(1, args.workers), args.mode, args.profile)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failures = []
+    accuracy = report["evaluation"]["accuracy"]
+    if args.min_accuracy is not None and (accuracy is None or accuracy < args.min_accuracy):
+        failures.append(f"accuracy {accuracy} < {args.min_accuracy}")
+    misses = report["profile"]["cassette"].get("misses", 0)
+    if args.cassette_mode == "replay" and misses and not args.allow_misses:
+        failures.append(f"{misses} requests had no cassette entry; re-record with --cassette-mode auto")
+    for failure in failures:
+        print(f"failed: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
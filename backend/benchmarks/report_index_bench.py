@@ -0,0 +1,166 @@
+"""
+Query latency of the map's report index on a large synthetic dataset.
+
+Loads N reports scattered around a few cities (dense centres, sparse
+outskirts) into a ReportIndex, then times the queries the map issues:
+bounding-box pages at street and city scale, filtered pages, deep
+pagination, cluster summaries at low zoom, and the dashboard rollups
+and leaderboard, whose cost should not grow with N. A budget on the slowest
+p95 turns it into a regression guard:
+
+    python -m benchmarks.report_index_bench --reports 1000000
+    python -m benchmarks.report_index_bench --reports 200000 --max-p95-ms 50
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from services.report_index import CLUSTER_CELL_SHIFT, ReportIndex
+
+# (lat, lng, share of reports)
+CITIES = [
+    (22.5726, 88.3639, 0.4),   # Kolkata
+    (19.0760, 72.8777, 0.25),  # Mumbai
+    (28.6139, 77.2090, 0.2),   # Delhi
+    (12.9716, 77.5946, 0.15),  # Bengaluru
+]
+CATEGORIES = ["garbage", "potholes", "deforestation"]
+
+
+def synthetic_reports(count: int, seed: int = 7):
+    """Reports normally distributed around the cities, ~15 km standard deviation, newest last"""
+    rng = random.Random(seed)
+    weights = [share for _, _, share in CITIES]
+    started = time.time() - count
+    for index in range(count):
+        lat, lng, _ = rng.choices(CITIES, weights)[0]
+        yield {
+            "report_id": f"report-{index}",
+            "lat": rng.gauss(lat, 0.15),
+            "lng": rng.gauss(lng, 0.15),
+            "category": rng.choice(CATEGORIES),
+            "severity": rng.randint(0, 100),
+            "severity_level": "moderate",
+            "scale": "medium",
+            "author_id": f"user-{rng.randrange(count // 20 + 1)}",
+            "created_at": started + index
+        }
+
+
+def load(index: ReportIndex, count: int, batch_size: int = 10000) -> float:
+    """Reports indexed per second when loading in batches"""
+    started = time.perf_counter()
+    batch = []
+    for report in synthetic_reports(count):
+        batch.append(report)
+        if len(batch) == batch_size:
+            index.upsert_many(batch)
+            batch = []
+    index.upsert_many(batch)
+    return count / (time.perf_counter() - started)
+
+
+def viewport(rng: random.Random, zoom: int, width_px: int = 1280, height_px: int = 800) -> Tuple[float, float, float, float]:
+    """Bounding box of a map view of the given size at `zoom`, centred near a random city"""
+    lat, lng, _ = rng.choice(CITIES)
+    lat, lng = rng.gauss(lat, 0.1), rng.gauss(lng, 0.1)
+    degrees_per_px = 360.0 / (256 * 2 ** zoom)
+    half_width = width_px * degrees_per_px / 2
+    half_height = height_px * degrees_per_px * math.cos(math.radians(lat)) / 2
+    return lng - half_width, lat - half_height, lng + half_width, lat + half_height
+
+
+def time_queries(run: Callable[[random.Random], Any], samples: int, seed: int = 11) -> Dict[str, float]:
+    rng = random.Random(seed)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        run(rng)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        "max_ms": round(timings[-1], 2)
+    }
+
+
+def paged(index: ReportIndex, bbox, pages: int, **filters) -> None:
+    cursor = None
+    for _ in range(pages):
+        page = index.query(bbox, cursor=cursor, **filters)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+
+def run(reports: int, samples: int, db_path: str) -> Dict[str, Any]:
+    index = ReportIndex(db_path, max_zoom=14)
+    report: Dict[str, Any] = {"reports": reports, "load_per_second": round(load(index, reports))}
+    cluster_max = index.max_zoom - CLUSTER_CELL_SHIFT
+
+    cases: List[Tuple[str, Callable[[random.Random], Any]]] = [
+        ("street view z16, 100/page", lambda rng: index.query(viewport(rng, 16), limit=100)),
+        ("city view z12, 100/page", lambda rng: index.query(viewport(rng, 12), limit=100)),
+        ("city view z12, category+severity>=80", lambda rng: index.query(
+            viewport(rng, 12), category=rng.choice(CATEGORIES), min_severity=80, limit=100
+        )),
+        ("district view z14, 5 pages", lambda rng: paged(index, viewport(rng, 14), 5, limit=100)),
+        ("clusters z4 (country)", lambda rng: index.clusters(viewport(rng, 4), 4)),
+        ("clusters z8 (region)", lambda rng: index.clusters(viewport(rng, 8), 8)),
+        (f"clusters z{cluster_max} (city)", lambda rng: index.clusters(viewport(rng, cluster_max), cluster_max)),
+        (f"clusters z{cluster_max}, category", lambda rng: index.clusters(
+            viewport(rng, cluster_max), cluster_max, category=rng.choice(CATEGORIES)
+        )),
+        ("rollup summary", lambda rng: index.summary()),
+        ("rollup regions", lambda rng: index.regions()),
+        ("rollup last 30 days, category", lambda rng: index.days(category=rng.choice(CATEGORIES))),
+        ("leaderboard top 10", lambda rng: index.leaderboard(10)),
+        ("leaderboard page at random offset", lambda rng: index.leaderboard(
+            50, offset=rng.randrange(max(reports // 20, 1))
+        )),
+        ("contributor rank", lambda rng: index.contributor(f"user-{rng.randrange(reports // 20 + 1)}")),
+    ]
+    report["queries"] = {name: time_queries(query, samples) for name, query in cases}
+    report["index"] = index.stats()
+    index.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency of bounding-box, cluster and rollup queries on the report index")
+    parser.add_argument("--reports", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=200, help="Queries timed per case")
+    parser.add_argument("--db", default=None, help="SQLite file to build the index in (default: a temporary file)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON for diffing against a baseline")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Fail when any query case's p95 is slower")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = run(args.reports, args.samples, args.db or os.path.join(directory, "reports.db"))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['reports']} reports loaded at {report['load_per_second']}/s")
+        print(f"{'query':<40} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, timing in report["queries"].items():
+            print(f"{name:<40} {timing['p50_ms']:>8} {timing['p95_ms']:>8} {timing['max_ms']:>8}")
+        stats = report["index"]
+        print(f"index: {stats['cells']} summary cells, {stats['queries_rtree']} R*Tree / {stats['queries_scan']} scan queries")
+
+    slowest = max(timing["p95_ms"] for timing in report["queries"].values())
+    if args.max_p95_ms is not None and slowest > args.max_p95_ms:
+        print(f"over budget: slowest p95 {slowest} ms > {args.max_p95_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
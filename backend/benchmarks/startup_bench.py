@@ -0,0 +1,145 @@
+"""
+Cold-start benchmark for the API process.
+
+Measures, in fresh interpreters, how long importing fastapi_app and app
+takes (with the heaviest modules from -X importtime), and how long a
+uvicorn process takes to answer /health (liveness) and /ready (graph and
+model clients warm). Budgets turn it into a regression guard:
+
+    python -m benchmarks.startup_bench --repeat 5
+    python -m benchmarks.startup_bench --max-import-seconds 1.5 --max-ready-seconds 6
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.load_test import _free_port
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep the measured process off the network and away from local state files
+BENCH_ENV = {
+    "OPENAI_API_KEY": "sk-benchmark",
+    "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+    "JOB_DB_PATH": "",
+    "RESULT_CACHE_DB_PATH": "",
+    "PHASH_INDEX_PATH": "",
+    "REPORT_INDEX_DB_PATH": "",
+    "ANALYSIS_LOG_DB_PATH": "",
+}
+
+
+def _env() -> Dict[str, str]:
+    return {**os.environ, **BENCH_ENV}
+
+
+def import_profile(module: str, top: int = 8) -> Tuple[float, List[Dict[str, Any]]]:
+    """Seconds to import `module` in a fresh interpreter, and its heaviest imports by cumulative time"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, raw_name = line.split("|")
+        # Nesting is encoded as two spaces per level after the separator's own space
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        entries.append((raw_name.strip(), depth, int(cumulative_us)))
+
+    total = next((cumulative for name, depth, cumulative in entries if name == module and depth == 0), 0)
+    # Direct imports of the module only, so nested entries are not counted twice
+    heaviest = sorted((entry for entry in entries if entry[1] == 1), key=lambda entry: entry[2], reverse=True)[:top]
+    return total / 1e6, [{"module": name, "seconds": round(cumulative / 1e6, 3)} for name, _, cumulative in heaviest]
+
+
+def server_startup(timeout: float = 60.0) -> Dict[str, Optional[float]]:
+    """Seconds from spawning uvicorn until /health and then /ready first answer 200"""
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fastapi_app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_env()
+    )
+    timings: Dict[str, Optional[float]] = {"health_seconds": None, "ready_seconds": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - started < timeout and timings["ready_seconds"] is None:
+                for key, path in (("health_seconds", "/health"), ("ready_seconds", "/ready")):
+                    if timings[key] is not None:
+                        continue
+                    try:
+                        if client.get(path).status_code == 200:
+                            timings[key] = round(time.perf_counter() - started, 3)
+                    except httpx.HTTPError:
+                        pass
+                    break
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return timings
+
+
+def run(repeat: int) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"imports": {}, "server": {}}
+    for module in ("fastapi_app", "app"):
+        samples, heaviest = [], []
+        for _ in range(repeat):
+            seconds, heaviest = import_profile(module)
+            samples.append(seconds)
+        report["imports"][module] = {
+            "median_seconds": round(statistics.median(samples), 3),
+            "min_seconds": round(min(samples), 3),
+            "heaviest": heaviest
+        }
+
+    runs = [server_startup() for _ in range(repeat)]
+    for key in ("health_seconds", "ready_seconds"):
+        values = [run[key] for run in runs if run[key] is not None]
+        report["server"][key] = round(statistics.median(values), 3) if values else None
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import time and time-to-ready of the API process")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON for diffing against a baseline")
+    parser.add_argument("--max-import-seconds", type=float, default=None, help="Fail when importing fastapi_app takes longer")
+    parser.add_argument("--max-ready-seconds", type=float, default=None, help="Fail when /ready takes longer to answer 200")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for module, result in report["imports"].items():
+            print(f"import {module:<12} median {result['median_seconds']}s  min {result['min_seconds']}s")
+            for entry in result["heaviest"]:
+                print(f"    {entry['module']:<32} {entry['seconds']}s")
+        server = report["server"]
+        print(f"uvicorn fastapi_app  /health {server['health_seconds']}s  /ready {server['ready_seconds']}s")
+
+    failures = []
+    import_seconds = report["imports"]["fastapi_app"]["median_seconds"]
+    if args.max_import_seconds is not None and import_seconds > args.max_import_seconds:
+        failures.append(f"import fastapi_app took {import_seconds}s > {args.max_import_seconds}s")
+    ready_seconds = report["server"]["ready_seconds"]
+    if args.max_ready_seconds is not None and (ready_seconds is None or ready_seconds > args.max_ready_seconds):
+        failures.append(f"/ready took {ready_seconds}s > {args.max_ready_seconds}s")
+    for failure in failures:
+        print(f"over budget: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,165 @@ load_dotenv()
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_MODEL = "gpt-4o"
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # Any OpenAI-compatible endpoint, e.g. the benchmark fake
+
+# Request deadlines: end-to-end budget per image, measured from when the handler starts.
+# Clients may shorten (never extend) it with an X-Request-Timeout header
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+
+# Model call policy: per-attempt timeout and retries of transient errors within the deadline
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))  # Doubled per retry, with full jitter
+# Hedging: send a duplicate request once an attempt outlives this latency percentile (costs extra calls)
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Latencies observed before hedging starts
+
+# Shared OpenAI HTTP connection pool (one pool for every model client)
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "50"))
+OPENAI_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+# Record/replay of OpenAI calls (cassette files keyed by a hash of the request, in LLM_CASSETTE_DIR):
+# "record" saves every response, "replay" answers only from the files (offline and deterministic;
+# unknown requests fail), "auto" replays what it has and records the rest, "off" disables it
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "cassettes")
 
 # Classification Categories
 CATEGORIES = ["garbage", "potholes", "deforestation"]
+
+# Async HTTP client pool used for image downloads
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", "30"))
+DOWNLOAD_MAX_MB = float(os.getenv("DOWNLOAD_MAX_MB", "20"))  # Downloads abort once the body exceeds this
+
+# Uploads are spooled (in memory up to UPLOAD_SPOOL_KB, then to a temporary file) and size-capped
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "20"))  # Per image
+UPLOAD_MAX_REQUEST_MB = float(os.getenv("UPLOAD_MAX_REQUEST_MB", "100"))  # Whole body, refused before it is read
+UPLOAD_SPOOL_KB = int(os.getenv("UPLOAD_SPOOL_KB", "1024"))
+
+# In-flight images live in a process-local blob store; the graph state only carries a handle.
+# Requests beyond this budget of encoded image bytes get 503 (0 disables the cap)
+BLOB_STORE_MAX_MB = float(os.getenv("BLOB_STORE_MAX_MB", "256"))
+
+# Prepared images cached per URL and revalidated with ETag/Last-Modified
+DOWNLOAD_CACHE_ENABLED = os.getenv("DOWNLOAD_CACHE_ENABLED", "true").lower() == "true"
+DOWNLOAD_CACHE_MAX_MB = float(os.getenv("DOWNLOAD_CACHE_MAX_MB", "64"))
+DOWNLOAD_CACHE_MAX_FRESH_SECONDS = float(os.getenv("DOWNLOAD_CACHE_MAX_FRESH_SECONDS", "3600"))  # Cap on the server's max-age
+
+# Prompt version - bump whenever the analysis or classification prompts change
+# so cached results produced by the old prompts are no longer served
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")
+
+# Classification result cache
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+RESULT_CACHE_DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", "")  # Empty disables the SQLite tier
+
+
+def _parse_category_map(value: str, defaults: dict, cast=int) -> dict:
+    """Parse "garbage=8,potholes=6" style overrides on top of per-category defaults"""
+    parsed = dict(defaults)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        category, _, setting = item.partition("=")
+        parsed[category.strip()] = cast(setting)
+    return parsed
+
+
+# Perceptual-hash near-duplicate detection
+PHASH_ENABLED = os.getenv("PHASH_ENABLED", "true").lower() == "true"
+PHASH_ALGORITHM = os.getenv("PHASH_ALGORITHM", "phash")  # "phash" or "dhash"
+PHASH_MAX_ENTRIES = int(os.getenv("PHASH_MAX_ENTRIES", "500000"))
+PHASH_INDEX_PATH = os.getenv("PHASH_INDEX_PATH", "")  # Empty keeps the index in memory only
+# Max Hamming distance (out of 64 bits) for reusing a stored result, per category
+PHASH_THRESHOLDS = _parse_category_map(
+    os.getenv("PHASH_THRESHOLDS", ""),
+    {"garbage": 8, "potholes": 6, "deforestation": 10, "reject": 4}
+)
+
+# Image preprocessing profile: "fast", "standard" or "accurate"
+IMAGE_PROFILE = os.getenv("IMAGE_PROFILE", "standard")
+
+# Graph topology: "accurate" (analysis + classification calls) or "fast" (one fused call)
+CLASSIFICATION_MODE = os.getenv("CLASSIFICATION_MODE", "accurate")
+
+# Model cascade: answer with a small model first, escalate to OPENAI_MODEL when unsure
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "false").lower() == "true"
+CASCADE_SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "gpt-4o-mini")
+# Minimum small-model confidence accepted without escalation, per category
+CASCADE_CONFIDENCE_THRESHOLDS = _parse_category_map(
+    os.getenv("CASCADE_CONFIDENCE_THRESHOLDS", ""),
+    {"garbage": 0.75, "potholes": 0.8, "deforestation": 0.8},
+    cast=float
+)
+
+# Batch classification
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+
+# Background classification jobs (POST /jobs)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "1000"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")  # Empty keeps jobs in memory only
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "604800"))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "60"))  # Long-poll cap for GET /jobs/{id}
+
+# Spatial index of classified reports for the map (GET /reports, GET /reports/clusters)
+REPORT_INDEX_DB_PATH = os.getenv("REPORT_INDEX_DB_PATH", "reports.db")  # Empty keeps the index in memory only
+REPORT_CLUSTER_MAX_ZOOM = int(os.getenv("REPORT_CLUSTER_MAX_ZOOM", "14"))  # Finest pre-aggregated cell level
+REPORT_PAGE_MAX = int(os.getenv("REPORT_PAGE_MAX", "500"))  # Largest page GET /reports returns
+# Dashboard rollups (GET /stats/*): regions are map tiles at this zoom (8 is ~150 km across),
+# days are calendar days at this offset from UTC (e.g. 330 for India)
+REPORT_REGION_ZOOM = int(os.getenv("REPORT_REGION_ZOOM", "8"))
+REPORT_DAY_UTC_OFFSET_MINUTES = int(os.getenv("REPORT_DAY_UTC_OFFSET_MINUTES", "0"))
+
+# Write-behind log of every classification run (final graph state without the image, node
+# timings, model calls), queried with GET /analyses/{report_id}
+ANALYSIS_LOG_ENABLED = os.getenv("ANALYSIS_LOG_ENABLED", "true").lower() == "true"
+ANALYSIS_LOG_DB_PATH = os.getenv("ANALYSIS_LOG_DB_PATH", "analyses.db")  # Empty keeps the log in memory only
+ANALYSIS_LOG_QUEUE_MAX = int(os.getenv("ANALYSIS_LOG_QUEUE_MAX", "10000"))  # Runs awaiting a write; more are dropped
+ANALYSIS_LOG_BATCH_SIZE = int(os.getenv("ANALYSIS_LOG_BATCH_SIZE", "500"))  # Most runs written per transaction
+ANALYSIS_LOG_RETENTION_SECONDS = float(os.getenv("ANALYSIS_LOG_RETENTION_SECONDS", "0"))  # 0 keeps runs forever
+
+# Incident clustering: reports of a category within a radius and time window form one incident.
+# A photo of an incident with a recent confident result is answered from it ("reuse"),
+# checked by CASCADE_SMALL_MODEL instead of the full pipeline ("confirm"), or classified as usual ("off")
+INCIDENT_CLUSTERING_ENABLED = os.getenv("INCIDENT_CLUSTERING_ENABLED", "true").lower() == "true"
+INCIDENT_RADIUS_METERS = float(os.getenv("INCIDENT_RADIUS_METERS", "75"))
+INCIDENT_WINDOW_SECONDS = float(os.getenv("INCIDENT_WINDOW_SECONDS", "259200"))
+INCIDENT_MAX_ENTRIES = int(os.getenv("INCIDENT_MAX_ENTRIES", "100000"))
+INCIDENT_REUSE_MODE = os.getenv("INCIDENT_REUSE_MODE", "off")  # Opt-in: it changes which model answers
+INCIDENT_REUSE_CONFIDENCE = float(os.getenv("INCIDENT_REUSE_CONFIDENCE", "0.85"))
+INCIDENT_REUSE_SECONDS = float(os.getenv("INCIDENT_REUSE_SECONDS", "86400"))  # Max age of a reused result
+
+# Local image quality pre-filter: rejects clearly unusable images before any model call
+QUALITY_FILTER_ENABLED = os.getenv("QUALITY_FILTER_ENABLED", "true").lower() == "true"
+QUALITY_MIN_EDGE = int(os.getenv("QUALITY_MIN_EDGE", "160"))  # Shortest side in pixels
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "15"))  # Laplacian variance at 256px
+QUALITY_MAX_DARK_FRACTION = float(os.getenv("QUALITY_MAX_DARK_FRACTION", "0.95"))
+QUALITY_MAX_BRIGHT_FRACTION = float(os.getenv("QUALITY_MAX_BRIGHT_FRACTION", "0.95"))
+QUALITY_MIN_COLOR_ENTROPY = float(os.getenv("QUALITY_MIN_COLOR_ENTROPY", "3.0"))  # Bits, out of 12
+
+# API embedded in the Streamlit app (app.py): "thread", "process" (own interpreter, so UI
+# reruns never add API latency) or "off"
+STREAMLIT_API_MODE = os.getenv("STREAMLIT_API_MODE", "thread")
+STREAMLIT_API_HOST = os.getenv("STREAMLIT_API_HOST", "0.0.0.0")
+STREAMLIT_API_PORT = int(os.getenv("STREAMLIT_API_PORT", "8000"))
+
+# Prometheus instrumentation served on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Client-side OpenAI rate limiting: request and token buckets plus a concurrency cap.
+# A limit of 0 is learned from the API's x-ratelimit-limit-* headers
+OPENAI_RATE_LIMIT_ENABLED = os.getenv("OPENAI_RATE_LIMIT_ENABLED", "true").lower() == "true"
+OPENAI_RPM_LIMIT = float(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", "0"))
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "16"))
+OPENAI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OPENAI_QUEUE_TIMEOUT_SECONDS", "60"))  # Max wait for a slot, 429 retries included
+OPENAI_RATE_LIMIT_DB_PATH = os.getenv("OPENAI_RATE_LIMIT_DB_PATH", "")  # SQLite file shared by worker processes; empty = per process
@@ -1,18 +1,89 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, List, Literal, Optional, get_args
+import asyncio
+import json
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from fastapi import FastAPI, HTTPException, File, Form, UploadFile, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
-import requests
-import base64
-from io import BytesIO
-from PIL import Image
-from graph import ImageClassificationGraph
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
+from starlette.formparsers import MultiPartParser
+import httpx
+from services import (
+    prepare_image,
+    PreparedImage,
+    ImagePreprocessingError,
+    ImageDownloader,
+    ImageDownloadError,
+    sniff_image_format,
+    map_bounded,
+    combine_report_results,
+    JobQueue,
+    JobQueueFullError,
+    render_metrics,
+    DeadlineExceeded,
+    get_call_policy,
+    BlobStoreFullError,
+    get_blob_store,
+    ReportIndex,
+    InvalidQueryError,
+    parse_bbox,
+)
 import config
 
+if TYPE_CHECKING:
+    from graph import ImageClassificationGraph
+
+# Multipart file parts stay in memory up to this size, larger ones are spooled to disk
+MultiPartParser.spool_max_size = config.UPLOAD_SPOOL_KB * 1024
+
+# Headers sent with image downloads to mimic a browser request
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the pooled HTTP clients on startup and close them on shutdown"""
+    # Load the graph and the shared OpenAI clients in the background; /health answers meanwhile
+    start_warmup()
+    app.state.http_client = httpx.AsyncClient(
+        headers=DOWNLOAD_HEADERS,
+        timeout=config.DOWNLOAD_TIMEOUT_SECONDS,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+    app.state.downloader = ImageDownloader.from_config(app.state.http_client)
+    # Classified reports with a location, queried by the map per bounding box
+    app.state.report_index = ReportIndex.from_config()
+    # Background job workers share the download client for images and callbacks
+    app.state.job_queue = JobQueue.from_config(run_job, http_client=app.state.http_client)
+    await app.state.job_queue.start()
+    try:
+        yield
+    finally:
+        await app.state.job_queue.stop()
+        await app.state.http_client.aclose()
+        app.state.report_index.close()
+        if _classifier is not None:
+            from services.llm_clients import close_llm_registry
+            await close_llm_registry()
+            _classifier.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Environmental Image Classification API",
     description="API for classifying images into garbage, potholes, deforestation, or reject categories",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for React frontend
@@ -24,119 +95,196 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RequestSizeLimitMiddleware:
+    """
+    Refuse request bodies whose Content-Length exceeds the limit with 413,
+    before any of the body is read or spooled. Chunked uploads without a
+    length are still bounded per file once spooled (UPLOAD_MAX_MB).
+    """
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.max_bytes > 0:
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                    response = JSONResponse(
+                        {"detail": f"Request body exceeds the {config.UPLOAD_MAX_REQUEST_MB:g} MB limit"},
+                        status_code=413
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=int(config.UPLOAD_MAX_REQUEST_MB * 1024 * 1024))
+
+# Classification graph topologies: "accurate" (two model calls) or "fast" (one fused call)
+ClassificationMode = Literal["accurate", "fast"]
+
+# Where a report was filed; reports with a location are added to the map index once classified
+class Location(BaseModel):
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+
 # Request model
 class ImageRequest(BaseModel):
     image_url: HttpUrl
+    mode: Optional[ClassificationMode] = None
+    declared_category: Optional[str] = None
+    location: Optional[Location] = None
+    report_id: Optional[str] = None
+    author_id: Optional[str] = None
+
+# Batch request models
+class BatchImage(BaseModel):
+    image_url: HttpUrl
+    report_id: Optional[str] = None
+    declared_category: Optional[str] = None
+    location: Optional[Location] = None
+    author_id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    images: List[BatchImage] = Field(min_length=1, max_length=config.BATCH_MAX_ITEMS)
+    mode: Optional[ClassificationMode] = None
     
+# Background job request model
+class JobRequest(BaseModel):
+    image_url: HttpUrl
+    mode: Optional[ClassificationMode] = None
+    declared_category: Optional[str] = None
+    report_id: Optional[str] = None
+    location: Optional[Location] = None
+    author_id: Optional[str] = None
+    callback_url: Optional[HttpUrl] = None
+    
+# Report written straight to the map index, e.g. when backfilling or after a status change
+class ReportRecord(BaseModel):
+    report_id: str
+    location: Location
+    category: str
+    severity: Optional[int] = Field(None, ge=0, le=100)
+    severity_level: Optional[str] = None
+    scale: Optional[str] = None
+    status: Optional[str] = None
+    author_id: Optional[str] = None
+    created_at: Optional[float] = None
+
 # Response model
 class ClassificationResponse(BaseModel):
     category: str
     severity: int | None
     severity_level: str | None
     scale: str | None
+    incident_id: str | None = None
 
-# Initialize the classification graph
-classifier = ImageClassificationGraph()
+# The classification graph (with langgraph, langchain and the OpenAI SDK behind it) is built by
+# a background warm-up started in the lifespan, so the process answers /health at once and
+# /ready once the graph and model clients are loaded
+_classifier: Optional["ImageClassificationGraph"] = None
+_warmup: Optional[asyncio.Future] = None
+_warmup_seconds: Optional[float] = None
 
-def process_uploaded_file(file_content: bytes) -> str:
-    """Process uploaded file and convert to base64"""
-    try:
-        # Create BytesIO object from file content
-        image_bytes = BytesIO(file_content)
-        
-        # Open and verify it's a valid image
+def build_classifier() -> "ImageClassificationGraph":
+    """Import the heavy modules, create the shared OpenAI client registry and compile the graphs"""
+    global _warmup_seconds
+    started = time.perf_counter()
+    from graph import ImageClassificationGraph
+    from services.llm_clients import get_llm_registry
+    get_llm_registry()
+    graph = ImageClassificationGraph()
+    _warmup_seconds = round(time.perf_counter() - started, 3)
+    return graph
+
+def start_warmup() -> asyncio.Future:
+    """Start building the classifier on a worker thread, once per process"""
+    global _warmup
+    if _warmup is None:
+        _warmup = asyncio.ensure_future(asyncio.to_thread(build_classifier))
+    return _warmup
+
+async def get_classifier() -> "ImageClassificationGraph":
+    """The classification graph; requests arriving during the warm-up wait for it"""
+    global _classifier
+    if _classifier is None:
+        _classifier = await asyncio.shield(start_warmup())
+    return _classifier
+
+def request_deadline(http_request: Optional[Request], timeout: float = config.REQUEST_TIMEOUT_SECONDS) -> Optional[float]:
+    """
+    Absolute deadline for one classification, starting now.
+    
+    The server budget applies unless the client's X-Request-Timeout header (seconds) asks for less.
+    """
+    budgets = [timeout] if timeout > 0 else []
+    header = http_request.headers.get("x-request-timeout") if http_request is not None else None
+    if header:
         try:
-            image = Image.open(image_bytes)
-            image.verify()  # Verify the image
-            
-            # Reopen the image since verify() closes it
-            image_bytes.seek(0)
-            image = Image.open(image_bytes)
-            
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Cannot open image file: {str(e)}")
-        
-        # Convert to RGB if necessary (for PNG with transparency)
-        if image.mode in ('RGBA', 'LA'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to base64
-        buffer = BytesIO()
-        image.save(buffer, format='JPEG', quality=95)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return image_base64
-        
-    except HTTPException:
-        raise
+            if float(header) > 0:
+                budgets.append(float(header))
+        except ValueError:
+            pass
+    return time.time() + min(budgets) if budgets else None
+
+DEADLINE_DETAIL = "Classification did not finish within the request deadline"
+
+def report_place(image: PreparedImage, location: Optional[Location] = None) -> Dict[str, Any]:
+    """
+    Where and when a photo was taken, for incident clustering: the location the client
+    sent, else the photo's EXIF GPS, plus its EXIF capture time (None means now)
+    """
+    point = (location.lat, location.lng) if location is not None else image.metadata.location
+    return {"location": point, "captured_at": image.metadata.captured_at}
+
+def check_spooled_image(spooled: BinaryIO) -> BinaryIO:
+    """
+    Check a spooled upload's size and magic bytes and return it rewound.
+    
+    Nothing beyond the first few bytes is read; the image is later decoded straight from the file.
+    """
+    spooled.seek(0, 2)
+    size = spooled.tell()
+    if not size:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    if size > config.UPLOAD_MAX_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"Image exceeds the {config.UPLOAD_MAX_MB:g} MB upload limit")
+    
+    spooled.seek(0)
+    head = spooled.read(32)
+    spooled.seek(0)
+    if sniff_image_format(head) is None:
+        raise HTTPException(status_code=400, detail="File must be an image (jpg, png, gif, webp, etc.)")
+    return spooled
+
+def copy_upload(file: UploadFile) -> BinaryIO:
+    """Copy an upload into a spooled file that outlives the request's form (for streamed batch responses)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=config.UPLOAD_SPOOL_KB * 1024)
+    file.file.seek(0)
+    shutil.copyfileobj(file.file, spooled)
+    return spooled
+
+def process_uploaded_file(file_content: BinaryIO) -> PreparedImage:
+    """Process an uploaded (spooled) file into a bounded base64 JPEG"""
+    try:
+        return prepare_image(file_content)
+    except ImagePreprocessingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Unexpected error processing image: {str(e)}")
 
-def download_and_encode_image(image_url: str) -> str:
-    """Download image from URL and convert to base64"""
+async def download_and_encode_image(
+    downloader: ImageDownloader,
+    image_url: str,
+    deadline: Optional[float] = None
+) -> PreparedImage:
+    """Fetch an image URL (streamed, size-capped, cached) and prepare it for the model"""
     try:
-        # Set headers to mimic a browser request
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Download the image
-        response = requests.get(image_url, timeout=30, headers=headers)
-        response.raise_for_status()
-        
-        # Check if we have content
-        if not response.content:
-            raise HTTPException(status_code=400, detail="Downloaded content is empty")
-        
-        # Check content type
-        content_type = response.headers.get('content-type', '').lower()
-        if not any(img_type in content_type for img_type in ['image/', 'jpeg', 'jpg', 'png', 'gif', 'webp']):
-            # Try to detect if it's still an image despite wrong content-type
-            try:
-                test_image = Image.open(BytesIO(response.content))
-                test_image.verify()  # Verify it's a valid image
-            except:
-                raise HTTPException(status_code=400, detail=f"URL does not contain a valid image. Content-Type: {content_type}")
-        
-        # Create a fresh BytesIO object for PIL
-        image_bytes = BytesIO(response.content)
-        
-        # Open and verify it's a valid image
-        try:
-            image = Image.open(image_bytes)
-            image.verify()  # Verify the image
-            
-            # Reopen the image since verify() closes it
-            image_bytes.seek(0)
-            image = Image.open(image_bytes)
-            
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Cannot open image file: {str(e)}")
-        
-        # Convert to RGB if necessary (for PNG with transparency)
-        if image.mode in ('RGBA', 'LA'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to base64
-        buffer = BytesIO()
-        image.save(buffer, format='JPEG', quality=95)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return image_base64
-        
-    except HTTPException:
-        # Re-raise HTTPExceptions as they are
-        raise
-    except requests.RequestException as e:
-        raise HTTPException(status_code=400, detail=f"Failed to download image: {str(e)}")
+        return await downloader.fetch(image_url, deadline)
+    except ImageDownloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ImagePreprocessingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Unexpected error processing image: {str(e)}")
 
@@ -148,21 +296,57 @@ async def root():
         "description": "Classify images using URL or direct upload",
         "endpoints": {
             "POST /classify": "Classify image from URL - send {\"image_url\": \"https://...\"}",
-            "POST /classify-upload": "Classify uploaded image file - send multipart/form-data with 'file' field"
+            "POST /classify-upload": "Classify uploaded image file - send multipart/form-data with 'file' field",
+            "POST /classify-stream": "Classify image from URL, streaming per-stage progress as Server-Sent Events (GET with ?image_url= for EventSource)",
+            "POST /classify-batch": "Classify many image URLs - send {\"images\": [{\"image_url\": \"https://...\", \"report_id\": \"...\"}]}, streams NDJSON",
+            "POST /classify-batch-upload": "Classify many uploaded files - send multipart/form-data with repeated 'files' fields, streams NDJSON",
+            "POST /jobs": "Queue an image URL for background classification - returns a job id immediately",
+            "GET /jobs/{id}": "Job status and result - add ?wait=seconds to long-poll",
+            "GET /jobs/stats": "Job queue depth, wait time and run time",
+            "GET /reports": "Indexed reports in a bounding box - ?bbox=west,south,east,north&category=&min_severity=, paginated by cursor",
+            "GET /reports/clusters": "Clustered report counts for a map view at low zoom - ?bbox=...&zoom=",
+            "POST /reports": "Add or update a report in the map index (backfill, status changes)",
+            "DELETE /reports/{id}": "Remove a report from the map index",
+            "GET /reports/stats": "Map index size and query counters",
+            "GET /stats/summary": "Report totals, mean severity and severity histograms per category (ETag)",
+            "GET /stats/regions": "Report rollups per map region, busiest first (ETag)",
+            "GET /stats/days": "Report rollups per day - ?start=YYYY-MM-DD&end=YYYY-MM-DD&category= (ETag)",
+            "GET /stats/leaderboard": "Top contributors by classified reports - ?limit=&offset= (ETag)",
+            "GET /stats/contributors/{author_id}": "A contributor's leaderboard rank and report totals (ETag)",
+            "GET /incidents/{id}": "Incident of nearby same-category reports (centroid, time span, report ids)",
+            "GET /incidents/stats": "Incident clustering counters and how often an incident's result was reused",
+            "GET /analyses/{report_id}": "Full analysis, confidence, reasoning, timings and model calls of a report's runs",
+            "GET /analyses/stats": "Analysis log queue depth and write counters",
+            "GET /metrics": "Prometheus metrics (node latency, tokens, image bytes, errors, download/preprocess time)",
+            "GET /cache/stats": "Classification result cache hit/miss/eviction counters",
+            "GET /quality/stats": "Quality pre-filter reject counters per reason (blurry, too_dark, ...)",
+            "GET /duplicates/stats": "Near-duplicate index size and hit/miss counters",
+            "GET /downloads/stats": "Image URL cache outcomes (fresh, 304, miss) and rejected downloads",
+            "GET /images/stats": "Images held by in-flight classifications against the memory budget",
+            "GET /llm/stats": "Shared OpenAI client registry, rate limiter budget, retries, hedges and model latency",
+            "GET /cascade/stats": "Which model tier answered and how often the cascade escalated"
         },
         "categories": ["garbage", "potholes", "deforestation", "reject"],
         "severity_range": "0-100 (null for rejected images)",
-        "fields": ["category", "severity", "severity_level", "scale"]
+        "fields": ["category", "severity", "severity_level", "scale", "incident_id"],
+        "modes": list(get_args(ClassificationMode))
     }
 
 @app.post("/classify", response_model=ClassificationResponse)
-async def classify_image(request: ImageRequest):
+async def classify_image(request: ImageRequest, http_request: Request):
     """
     Classify an image from a URL
     
     - **image_url**: Direct URL to an image file (jpg, png, etc.)
+    - **mode**: Optional "fast" (single model call) or "accurate" (two-stage analysis); defaults to server config
+    - **declared_category**: Optional category the user reported; lets the model cascade catch disagreements
+    - **location**: Optional {"lat", "lng"} of the report; defaults to the photo's EXIF GPS position
+    - **report_id**: Optional id of the report, remembered by its incident; a located report is
+      also written to the map index
+    - **author_id**: Optional id of the reporting user, for the contributor leaderboard
     
-    Returns classification with category, severity (0-100), severity_level, and scale
+    Returns classification with category, severity (0-100), severity_level, and scale, plus the
+    incident_id of located reports (nearby reports of the same category share one)
     """
     # Check if API key is configured
     if not config.OPENAI_API_KEY:
@@ -171,35 +355,74 @@ async def classify_image(request: ImageRequest):
             detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
         )
     
+    # The deadline covers the download too
+    deadline = request_deadline(http_request)
+    
     try:
         # Download and encode the image
-        image_base64 = download_and_encode_image(str(request.image_url))
+        image = await download_and_encode_image(
+            http_request.app.state.downloader, str(request.image_url), deadline
+        )
         
         # Process through the classification workflow
-        result = classifier.process_image(image_base64)
+        place = report_place(image, request.location)
+        classifier = await get_classifier()
+        result = await classifier.aprocess_image(
+            image.base64,
+            detail=image.detail,
+            source_size=image.original_size,
+            mode=request.mode,
+            declared_category=request.declared_category,
+            deadline=deadline,
+            report_id=request.report_id,
+            **place
+        )
+        await index_place(http_request.app.state.report_index, request.report_id, result, place, request.author_id)
         
         return ClassificationResponse(
             category=result["category"],
             severity=result["severity"],
             severity_level=result["severity_level"],
-            scale=result["scale"]
+            scale=result["scale"],
+            incident_id=result.get("incident_id")
         )
         
     except HTTPException:
         # Re-raise HTTPExceptions as they are
         raise
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail=DEADLINE_DETAIL)
+    except BlobStoreFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         # Handle any other unexpected errors
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/classify-upload", response_model=ClassificationResponse)
-async def classify_uploaded_image(file: UploadFile = File(...)):
+async def classify_uploaded_image(
+    http_request: Request,
+    file: UploadFile = File(...),
+    mode: Optional[ClassificationMode] = Query(None),
+    declared_category: Optional[str] = Query(None),
+    report_id: Optional[str] = Form(None),
+    lat: Optional[float] = Form(None, ge=-90, le=90),
+    lng: Optional[float] = Form(None, ge=-180, le=180),
+    author_id: Optional[str] = Form(None)
+):
     """
     Classify an uploaded image file
     
     - **file**: Image file (jpg, png, gif, webp, etc.)
+    - **mode**: Optional query parameter, "fast" or "accurate"; defaults to server config
+    - **declared_category**: Optional query parameter with the category the user reported
+    - **report_id**: Optional form field with the id of the report; a located report is also
+      written to the map index
+    - **lat**, **lng**: Optional form fields with the report's location; default to the photo's
+      EXIF GPS position
+    - **author_id**: Optional form field with the id of the reporting user
     
-    Returns classification with category, severity (0-100), severity_level, and scale
+    Returns classification with category, severity (0-100), severity_level, and scale, plus the
+    incident_id of located reports
     """
     # Check if API key is configured
     if not config.OPENAI_API_KEY:
@@ -215,38 +438,755 @@ async def classify_uploaded_image(file: UploadFile = File(...)):
             detail="File must be an image (jpg, png, gif, webp, etc.)"
         )
     
+    location = form_location(lat, lng)
+    deadline = request_deadline(http_request)
+    
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        if not file_content:
-            raise HTTPException(status_code=400, detail="Uploaded file is empty")
-        
-        # Process the uploaded file
-        image_base64 = process_uploaded_file(file_content)
+        # Decode straight from the spooled upload instead of reading it into memory
+        spooled = check_spooled_image(file.file)
+        image = await run_in_threadpool(process_uploaded_file, spooled)
         
         # Process through the classification workflow
-        result = classifier.process_image(image_base64)
+        place = report_place(image, location)
+        classifier = await get_classifier()
+        result = await classifier.aprocess_image(
+            image.base64,
+            detail=image.detail,
+            source_size=image.original_size,
+            mode=mode,
+            declared_category=declared_category,
+            deadline=deadline,
+            report_id=report_id,
+            **place
+        )
+        await index_place(http_request.app.state.report_index, report_id, result, place, author_id)
         
         return ClassificationResponse(
             category=result["category"],
             severity=result["severity"],
             severity_level=result["severity_level"],
-            scale=result["scale"]
+            scale=result["scale"],
+            incident_id=result.get("incident_id")
         )
         
     except HTTPException:
         # Re-raise HTTPExceptions as they are
         raise
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail=DEADLINE_DETAIL)
+    except BlobStoreFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         # Handle any other unexpected errors
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_classification(
+    downloader: ImageDownloader,
+    image_url: str,
+    mode: Optional[str],
+    declared_category: Optional[str],
+    deadline: Optional[float] = None,
+    location: Optional[Location] = None,
+    report_id: Optional[str] = None,
+    report_index: Optional[ReportIndex] = None,
+    author_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Run one classification and yield SSE messages as it progresses.
+    
+    Emits "image" once the download is prepared, "node" as each graph node finishes
+    (with a provisional category when one is known early), then "result". A located
+    report is written to report_index before its result is sent. Failures end the
+    stream with an "error" event carrying the usual detail and status code.
+    """
+    try:
+        image = await download_and_encode_image(downloader, image_url, deadline)
+        yield _sse("image", {
+            "width": image.width,
+            "height": image.height,
+            "input_bytes": image.input_bytes,
+            "output_bytes": image.output_bytes
+        })
+        
+        place = report_place(image, location)
+        classifier = await get_classifier()
+        async for event in classifier.astream_image(
+            image.base64,
+            detail=image.detail,
+            source_size=image.original_size,
+            mode=mode,
+            declared_category=declared_category,
+            deadline=deadline,
+            report_id=report_id,
+            **place
+        ):
+            if event["event"] == "result" and report_index is not None:
+                await index_place(report_index, report_id, event["result"], place, author_id)
+            yield _sse(event.pop("event"), event)
+    except Exception as e:
+        yield _sse("error", _error_detail(e))
+
+def _stream_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """SSE response that proxies must not buffer"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/classify-stream")
+async def classify_image_stream(request: ImageRequest, http_request: Request):
+    """
+    Classify an image from a URL, streaming progress as Server-Sent Events
+    
+    Takes the same body as /classify. Each graph node emits an event when it completes,
+    so clients get early feedback (e.g. a provisional reject for household scenes) before
+    the final "result" event.
+    """
+    if not config.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=500, 
+            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        )
+    
+    return _stream_response(stream_classification(
+        http_request.app.state.downloader,
+        str(request.image_url),
+        request.mode,
+        request.declared_category,
+        request_deadline(http_request),
+        request.location,
+        request.report_id,
+        http_request.app.state.report_index,
+        request.author_id
+    ))
+
+@app.get("/classify-stream")
+async def classify_image_stream_get(
+    http_request: Request,
+    image_url: HttpUrl = Query(...),
+    mode: Optional[ClassificationMode] = Query(None),
+    declared_category: Optional[str] = Query(None)
+):
+    """GET variant of /classify-stream for browser EventSource clients, parameters in the query string"""
+    if not config.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=500, 
+            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        )
+    
+    return _stream_response(stream_classification(
+        http_request.app.state.downloader,
+        str(image_url),
+        mode,
+        declared_category,
+        request_deadline(http_request)
+    ))
+
+def _error_detail(error: Exception) -> Dict[str, Any]:
+    """Per-item error payload for batch results"""
+    if isinstance(error, HTTPException):
+        return {"error": error.detail, "status_code": error.status_code}
+    if isinstance(error, DeadlineExceeded):
+        return {"error": DEADLINE_DETAIL, "status_code": 504}
+    if isinstance(error, BlobStoreFullError):
+        return {"error": str(error), "status_code": 503}
+    return {"error": f"Internal server error: {str(error)}", "status_code": 500}
+
+async def index_report(
+    report_index: ReportIndex,
+    report_id: str,
+    result: Optional[Dict[str, Any]],
+    location: Optional[Dict[str, float]],
+    author_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Put a classified report on the map index (a reject takes it off); returns fields for its report line"""
+    if result is None or location is None:
+        return {}
+    try:
+        await asyncio.to_thread(
+            report_index.index_result, report_id, result, location["lat"], location["lng"], author_id
+        )
+    except sqlite3.Error as e:
+        return {"indexed": False, "index_error": str(e)}
+    return {"indexed": True}
+
+async def index_place(
+    report_index: ReportIndex,
+    report_id: Optional[str],
+    result: Optional[Dict[str, Any]],
+    place: Dict[str, Any],
+    author_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Index one classified photo under its report when it has a report_id and a location (sent or EXIF).
+    
+    A single photo only adds or updates its report. Its reject may come from a failed model
+    call, or the report may be mapped from other photos, so only a batch's combined verdict
+    takes a report off the map.
+    """
+    if not report_id or place["location"] is None:
+        return {}
+    if result is None or result.get("category", "reject") == "reject":
+        return {}
+    lat, lng = place["location"]
+    return await index_report(report_index, report_id, result, {"lat": lat, "lng": lng}, author_id)
+
+def form_location(lat: Optional[float], lng: Optional[float]) -> Optional[Location]:
+    """A Location from separate lat and lng form fields, which must be sent together"""
+    if lat is None and lng is None:
+        return None
+    if lat is None or lng is None:
+        raise HTTPException(status_code=400, detail="lat and lng must be sent together")
+    return Location(lat=lat, lng=lng)
+
+async def stream_batch(
+    items: List[Dict[str, Any]],
+    classify_item,
+    concurrency: int,
+    on_report: Optional[Callable[[str, Optional[Dict[str, Any]]], Awaitable[Dict[str, Any]]]] = None
+) -> AsyncIterator[str]:
+    """
+    Classify batch items with bounded concurrency and yield NDJSON lines as they finish.
+    
+    Each item yields an "item" line with its result or error. Once every photo of a
+    report_id has finished, a "report" line with the combined verdict follows (extended
+    with whatever on_report returns for it), and a final "summary" line closes the stream.
+    """
+    remaining = Counter(item["report_id"] for item in items if item.get("report_id"))
+    report_results: Dict[str, List[Dict[str, Any]]] = {}
+    failed = 0
+    
+    async for index, result, error in map_bounded(items, classify_item, concurrency):
+        item = items[index]
+        line = {"type": "item", "index": index, **{k: v for k, v in item.items() if k != "content"}}
+        if error is None:
+            line["result"] = result
+        else:
+            failed += 1
+            line.update(_error_detail(error))
+        yield json.dumps(line) + "\n"
+        
+        report_id = item.get("report_id")
+        if report_id:
+            if error is None:
+                report_results.setdefault(report_id, []).append(result)
+            remaining[report_id] -= 1
+            if remaining[report_id] == 0:
+                photos = report_results.pop(report_id, [])
+                report = {
+                    "type": "report",
+                    "report_id": report_id,
+                    "images": sum(1 for other in items if other.get("report_id") == report_id),
+                    "classified": len(photos),
+                    "result": combine_report_results(photos) if photos else None
+                }
+                if on_report is not None:
+                    report.update(await on_report(report_id, report["result"]))
+                yield json.dumps(report) + "\n"
+    
+    yield json.dumps({
+        "type": "summary",
+        "total": len(items),
+        "succeeded": len(items) - failed,
+        "failed": failed
+    }) + "\n"
+
+@app.post("/classify-batch")
+async def classify_batch(request: BatchRequest, http_request: Request):
+    """
+    Classify many images from URLs, streaming NDJSON results as each one completes
+    
+    - **images**: List of {"image_url", optional "report_id", optional "declared_category",
+      optional "location" {"lat", "lng"}, optional "author_id"}
+    - **mode**: Optional "fast" or "accurate"; defaults to server config
+    
+    Items run at most BATCH_CONCURRENCY at a time. A failed item produces an error line
+    without failing the batch. Photos sharing a report_id also get a combined "report" line;
+    when they carry a location, the combined verdict is also written to the map index.
+    """
+    if not config.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=500, 
+            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        )
+    
+    downloader = http_request.app.state.downloader
+    items = [
+        {
+            "image_url": str(image.image_url),
+            "report_id": image.report_id,
+            "declared_category": image.declared_category,
+            "location": image.location.model_dump() if image.location else None
+        }
+        for image in request.images
+    ]
+    
+    # Photos of a report share its location; the first photo that carries one is used
+    located: Dict[str, BatchImage] = {}
+    for image in request.images:
+        if image.report_id and image.location:
+            located.setdefault(image.report_id, image)
+    
+    async def on_report(report_id: str, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        image = located.get(report_id)
+        if image is None:
+            return {}
+        return await index_report(
+            http_request.app.state.report_index, report_id, result, image.location.model_dump(), image.author_id
+        )
+    
+    async def classify_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        # Each item's deadline starts when it leaves the batch queue
+        deadline = request_deadline(http_request)
+        image = await download_and_encode_image(downloader, item["image_url"], deadline)
+        classifier = await get_classifier()
+        return await classifier.aprocess_image(
+            image.base64,
+            detail=image.detail,
+            source_size=image.original_size,
+            mode=request.mode,
+            declared_category=item["declared_category"],
+            deadline=deadline,
+            report_id=item["report_id"],
+            **report_place(image, Location(**item["location"]) if item["location"] else None)
+        )
+    
+    return StreamingResponse(
+        stream_batch(items, classify_item, config.BATCH_CONCURRENCY, on_report),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/classify-batch-upload")
+async def classify_batch_upload(
+    http_request: Request,
+    files: List[UploadFile] = File(...),
+    mode: Optional[ClassificationMode] = Query(None),
+    report_id: Optional[str] = Query(None),
+    declared_category: Optional[str] = Query(None)
+):
+    """
+    Classify many uploaded image files, streaming NDJSON results as each one completes
+    
+    - **files**: Image files (multipart/form-data, repeated 'files' field)
+    - **mode**: Optional query parameter, "fast" or "accurate"
+    - **report_id**: Optional query parameter; when set, a combined report verdict is streamed
+    - **declared_category**: Optional query parameter with the category the user reported
+    """
+    if not config.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=500, 
+            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        )
+    if len(files) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {config.BATCH_MAX_ITEMS} files per batch")
+    
+    # Move uploads into spooled files owned by the stream; the form is closed once the handler returns
+    items = [
+        {
+            "filename": file.filename,
+            "content_type": file.content_type,
+            "report_id": report_id,
+            "content": await run_in_threadpool(copy_upload, file)
+        }
+        for file in files
+    ]
+    
+    async def classify_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        deadline = request_deadline(http_request)
+        try:
+            if not item["content_type"] or not item["content_type"].startswith('image/'):
+                raise HTTPException(status_code=400, detail="File must be an image (jpg, png, gif, webp, etc.)")
+            spooled = check_spooled_image(item["content"])
+            image = await run_in_threadpool(process_uploaded_file, spooled)
+        finally:
+            item["content"].close()
+        classifier = await get_classifier()
+        return await classifier.aprocess_image(
+            image.base64,
+            detail=image.detail,
+            source_size=image.original_size,
+            mode=mode,
+            declared_category=declared_category,
+            deadline=deadline,
+            report_id=report_id,
+            **report_place(image)
+        )
+    
+    return StreamingResponse(
+        stream_batch(items, classify_item, config.BATCH_CONCURRENCY),
+        media_type="application/x-ndjson"
+    )
+
+async def run_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job handler: download, prepare and classify one queued image, indexing it when it has a
+    location (the payload's, else the photo's EXIF GPS position)
+    """
+    deadline = request_deadline(None, config.JOB_TIMEOUT_SECONDS)
+    image = await download_and_encode_image(app.state.downloader, payload["image_url"], deadline)
+    place = report_place(image, Location(**payload["location"]) if payload.get("location") else None)
+    classifier = await get_classifier()
+    result = await classifier.aprocess_image(
+        image.base64,
+        detail=image.detail,
+        source_size=image.original_size,
+        mode=payload.get("mode"),
+        declared_category=payload.get("declared_category"),
+        deadline=deadline,
+        report_id=payload.get("report_id"),
+        **place
+    )
+    await index_place(app.state.report_index, payload.get("report_id"), result, place, payload.get("author_id"))
+    return result
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest, http_request: Request):
+    """
+    Queue an image for classification and return a job id immediately
+    
+    - **image_url**: Direct URL to an image file
+    - **mode**: Optional "fast" or "accurate"; defaults to server config
+    - **declared_category**: Optional category the user reported
+    - **report_id**: Optional id echoed back with the job, e.g. the Firestore report id
+    - **location**: Optional {"lat", "lng"}, defaulting to the photo's EXIF GPS position; with a report_id,
+      the result is written to the map index
+    - **author_id**: Optional id of the reporting user, stored in the map index
+    - **callback_url**: Optional URL that receives a POST with the finished job
+    
+    Poll GET /jobs/{id} (optionally with ?wait=seconds) for the result.
+    """
+    if not config.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=500, 
+            detail="OpenAI API key not configured. Please set OPENAI_API_KEY environment variable."
+        )
+    
+    payload = {
+        "image_url": str(request.image_url),
+        "mode": request.mode,
+        "declared_category": request.declared_category,
+        "report_id": request.report_id,
+        "location": request.location.model_dump() if request.location else None,
+        "author_id": request.author_id
+    }
+    callback_url = str(request.callback_url) if request.callback_url else None
+    
+    try:
+        job_id = await http_request.app.state.job_queue.submit(payload, callback_url=callback_url)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    
+    return {"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/stats")
+async def job_stats(http_request: Request):
+    """Job queue depth, throughput and wait/run time percentiles"""
+    return http_request.app.state.job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    http_request: Request,
+    wait: float = Query(0, ge=0, description="Seconds to long-poll for an unfinished job")
+):
+    """
+    Fetch a classification job
+    
+    - **wait**: Optional seconds to hold the request open until the job finishes (capped by JOB_MAX_WAIT_SECONDS)
+    
+    Status is one of queued, running, succeeded or failed; result is set once it succeeded.
+    """
+    queue = http_request.app.state.job_queue
+    job = await queue.get(job_id, wait=min(wait, config.JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return queue.public_view(job)
+
+@app.get("/reports")
+async def list_reports(
+    http_request: Request,
+    bbox: str = Query(..., description="west,south,east,north in degrees, e.g. Leaflet's getBounds().toBBoxString()"),
+    category: Optional[str] = Query(None),
+    min_severity: Optional[int] = Query(None, ge=0, le=100),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None)
+):
+    """
+    Indexed reports inside a bounding box, newest first
+    
+    - **bbox**: west,south,east,north (longitude/latitude degrees)
+    - **category**: Optional category filter
+    - **min_severity**: Optional minimum severity (0-100)
+    - **limit**: Page size, capped by REPORT_PAGE_MAX
+    - **cursor**: next_cursor from the previous page
+    """
+    try:
+        return await asyncio.to_thread(
+            http_request.app.state.report_index.query, parse_bbox(bbox), category, min_severity, limit, cursor
+        )
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/reports/clusters")
+async def report_clusters(
+    http_request: Request,
+    bbox: str = Query(..., description="west,south,east,north in degrees"),
+    zoom: int = Query(..., ge=0, description="Map zoom level"),
+    category: Optional[str] = Query(None),
+    min_severity: Optional[int] = Query(None, ge=0, le=100)
+):
+    """
+    Clustered report summaries for a map view at low zoom
+    
+    - **bbox**: west,south,east,north (longitude/latitude degrees)
+    - **zoom**: Map zoom, up to REPORT_CLUSTER_MAX_ZOOM - 2; query /reports above that
+    - **category**: Optional category filter
+    - **min_severity**: Optional minimum severity, applied in 10-point bands
+    
+    Each cluster has its count, centroid, per-category counts, mean severity and severity histogram.
+    """
+    try:
+        return await asyncio.to_thread(
+            http_request.app.state.report_index.clusters, parse_bbox(bbox), zoom, category, min_severity
+        )
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/reports/stats")
+async def report_stats(http_request: Request):
+    """Map index size and query counters per access path"""
+    return await asyncio.to_thread(http_request.app.state.report_index.stats)
+
+@app.post("/reports")
+async def upsert_report(report: ReportRecord, http_request: Request):
+    """
+    Add or update a report in the map index directly
+    
+    For backfilling reports filed before the index existed and for status changes
+    (e.g. in_progress, completed); classified reports with a location are indexed automatically.
+    """
+    return await asyncio.to_thread(http_request.app.state.report_index.upsert, {
+        **report.model_dump(exclude={"location"}),
+        "lat": report.location.lat,
+        "lng": report.location.lng
+    })
+
+@app.delete("/reports/{report_id}")
+async def delete_report(report_id: str, http_request: Request):
+    """Remove a report from the map index"""
+    if not await asyncio.to_thread(http_request.app.state.report_index.delete, report_id):
+        raise HTTPException(status_code=404, detail="Report not found")
+    return {"report_id": report_id, "deleted": True}
+
+async def etag_json(
+    http_request: Request,
+    compute: Callable[..., Optional[Dict[str, Any]]],
+    *args: Any,
+    missing: str = "Not found"
+) -> Response:
+    """
+    Serve a dashboard rollup tagged with the report index's write version.
+    
+    A client sending that ETag back in If-None-Match gets 304 without the rollup being
+    read; any write to the index changes the tag. compute returning None is a 404.
+    """
+    etag = await asyncio.to_thread(http_request.app.state.report_index.etag)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    try:
+        body = await asyncio.to_thread(compute, *args)
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=404, detail=missing)
+    return JSONResponse(body, headers=headers)
+
+@app.get("/stats/summary")
+async def stats_summary(http_request: Request):
+    """
+    Indexed report totals: count, per-category counts, mean severity and severity
+    histogram, overall and per category, plus the number of contributors
+    """
+    return await etag_json(http_request, http_request.app.state.report_index.summary)
+
+@app.get("/stats/regions")
+async def stats_regions(
+    http_request: Request,
+    category: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Report rollups per region, busiest first
+    
+    - **category**: Optional category filter
+    - **limit**: Optional number of regions, capped by REPORT_PAGE_MAX
+    
+    A region is a map tile at REPORT_REGION_ZOOM, named "zoom/x/y", with its centroid.
+    """
+    return await etag_json(http_request, http_request.app.state.report_index.regions, category, limit)
+
+@app.get("/stats/days")
+async def stats_days(
+    http_request: Request,
+    start: Optional[str] = Query(None, description="First day, YYYY-MM-DD"),
+    end: Optional[str] = Query(None, description="Last day, YYYY-MM-DD"),
+    category: Optional[str] = Query(None)
+):
+    """
+    Report rollups per day, empty days included
+    
+    - **start** / **end**: Inclusive YYYY-MM-DD range (at most 366 days); defaults to the last 30 days
+    - **category**: Optional category filter
+    
+    Days are calendar days at REPORT_DAY_UTC_OFFSET_MINUTES from UTC.
+    """
+    return await etag_json(http_request, http_request.app.state.report_index.days, start, end, category)
+
+@app.get("/stats/leaderboard")
+async def stats_leaderboard(
+    http_request: Request,
+    limit: int = Query(10, ge=1),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Top contributors by classified reports on the map, ties broken by total severity
+    
+    - **limit**: Entries to return, capped by REPORT_PAGE_MAX
+    - **offset**: Rank to start after, for paging
+    """
+    return await etag_json(http_request, http_request.app.state.report_index.leaderboard, limit, offset)
+
+@app.get("/stats/contributors/{author_id}")
+async def stats_contributor(author_id: str, http_request: Request):
+    """A contributor's leaderboard rank and report totals"""
+    return await etag_json(
+        http_request, http_request.app.state.report_index.contributor, author_id, missing="Contributor not found"
+    )
+
+@app.get("/incidents/stats")
+async def incident_stats():
+    """Live incidents, clustering settings and how often an incident's result was reused"""
+    classifier = await get_classifier()
+    if classifier.incident_index is None:
+        return {"enabled": False}
+    return {"enabled": True, "reuse_mode": classifier.incident_reuse, **classifier.incident_index.stats()}
+
+@app.get("/incidents/{incident_id}")
+async def get_incident(incident_id: str):
+    """
+    Fetch an incident: its centroid, time span, report count and ids, and the
+    confident result new photos of it are checked against
+    """
+    classifier = await get_classifier()
+    incident = classifier.incident_index.get(incident_id) if classifier.incident_index is not None else None
+    if incident is None:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    return incident
+
+@app.get("/analyses/stats")
+async def analysis_log_stats():
+    """Analysis log queue depth, records written and dropped, and batch sizes"""
+    classifier = await get_classifier()
+    if classifier.analysis_log is None:
+        return {"enabled": False}
+    return {"enabled": True, **classifier.analysis_log.stats()}
+
+@app.get("/analyses/{report_id}")
+async def get_analyses(report_id: str, limit: int = Query(20, ge=1, le=100)):
+    """
+    Full record of a report's classification runs, newest first
+    
+    - **limit**: Most runs to return (default 20, at most 100)
+    
+    Each run carries the final graph state without the image (analysis, confidence,
+    reasoning, quality and cascade details), node timings, the OpenAI calls made and
+    the settings used. Runs are written in the background, so a run appears shortly
+    after its response.
+    """
+    classifier = await get_classifier()
+    if classifier.analysis_log is None:
+        raise HTTPException(status_code=404, detail="Analysis log is disabled")
+    runs = await asyncio.to_thread(classifier.analysis_log.get, report_id, limit)
+    if not runs:
+        raise HTTPException(status_code=404, detail="No analyses for this report")
+    return {"report_id": report_id, "runs": runs}
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check: answers as soon as the process serves requests, before the warm-up ends"""
     return {"status": "healthy", "api_key_configured": bool(config.OPENAI_API_KEY)}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check: 200 once the graph and model clients are warm, 503 until then or if the warm-up failed"""
+    if _warmup is None or not _warmup.done():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    if _warmup.cancelled() or _warmup.exception() is not None:
+        error = "cancelled" if _warmup.cancelled() else str(_warmup.exception())
+        return JSONResponse({"status": "failed", "error": error}, status_code=503)
+    return {"status": "ready", "warmup_seconds": _warmup_seconds}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-node latency, token usage, image bytes, errors, download and preprocessing time"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Classification result cache counters"""
+    classifier = await get_classifier()
+    if classifier.result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **classifier.result_cache.stats()}
+
+@app.get("/cascade/stats")
+async def cascade_stats():
+    """Model cascade tier usage and escalation rates"""
+    classifier = await get_classifier()
+    return classifier.cascade_stats()
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Shared OpenAI client registry, connection pool usage, rate limiter budget and call policy (retries, hedges, latency)"""
+    from services.llm_clients import get_llm_registry
+    # The rate limiter's budget may be read from its shared SQLite store
+    registry = await asyncio.to_thread(get_llm_registry().stats)
+    return {**registry, "call_policy": get_call_policy().stats()}
+
+@app.get("/quality/stats")
+async def quality_stats():
+    """Quality pre-filter checks and per-reason reject counters"""
+    classifier = await get_classifier()
+    if classifier.quality_filter is None:
+        return {"enabled": False}
+    return {"enabled": True, **classifier.quality_filter.stats()}
+
+@app.get("/duplicates/stats")
+async def duplicate_stats():
+    """Perceptual-hash near-duplicate index counters"""
+    classifier = await get_classifier()
+    if classifier.duplicate_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **classifier.duplicate_index.stats()}
+
+@app.get("/downloads/stats")
+async def download_stats(http_request: Request):
+    """Image URL cache outcomes and download rejections by reason"""
+    return http_request.app.state.downloader.stats()
+
+@app.get("/images/stats")
+async def image_stats():
+    """In-flight image blob store: live blobs, bytes against the budget and rejected admissions"""
+    return get_blob_store().stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
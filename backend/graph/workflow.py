@@ -1,41 +1,426 @@
-from typing import Dict, Any
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Any, Iterator, Optional, Tuple
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
-from models.schemas import GraphState
-from nodes import analyze_image_node, classify_image_node
+from models.schemas import GraphState, ClassificationResult
+from nodes import (
+    analyze_image_node,
+    aanalyze_image_node,
+    classify_image_node,
+    aclassify_image_node,
+    fast_classify_node,
+    afast_classify_node,
+)
+from services import (
+    ResultCache,
+    PerceptualHashIndex,
+    ImageQualityFilter,
+    IncidentIndex,
+    AnalysisLog,
+    instrument_node,
+    trace_run,
+    RunTrace,
+    graph_run_config,
+    record_result,
+    DeadlineExceeded,
+    get_blob_store,
+)
+import config
+
+
+@dataclass
+class _Run:
+    """One call of an entry point: its arguments, result cache key and start time"""
+
+    image_base64: str
+    detail: Optional[str]
+    mode: str
+    declared_category: Optional[str]
+    deadline: Optional[float]
+    location: Optional[Tuple[float, float]]
+    captured_at: Optional[float]
+    report_id: Optional[str]
+    source_size: Optional[Tuple[int, int]]
+    cache_key: Optional[str]
+    started: float
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
 
 
 class ImageClassificationGraph:
     """
     LangGraph workflow for image classification with analysis and severity scoring.
+    
+    Two topologies are compiled side by side:
+    - "accurate": separate analysis and classification calls (two round trips)
+    - "fast": one structured-output call returning both (one round trip)
     """
     
-    def __init__(self):
-        self.graph = self._build_graph()
+    MODES = ("accurate", "fast")
+    INCIDENT_REUSE_MODES = ("reuse", "confirm", "off")
+    
+    def __init__(
+        self,
+        result_cache: Optional[ResultCache] = None,
+        duplicate_index: Optional[PerceptualHashIndex] = None,
+        mode: Optional[str] = None,
+        cascade: Optional[bool] = None,
+        quality_filter: Optional[ImageQualityFilter] = None,
+        incident_index: Optional[IncidentIndex] = None,
+        analysis_log: Optional[AnalysisLog] = None
+    ):
+        # Results are cached by image content unless caching is disabled in config
+        if result_cache is None and config.RESULT_CACHE_ENABLED:
+            result_cache = ResultCache.from_config()
+        self.result_cache = result_cache
+        
+        # Blurry, black, tiny and flat images are rejected locally before any model call
+        if quality_filter is None and config.QUALITY_FILTER_ENABLED:
+            quality_filter = ImageQualityFilter.from_config()
+        self.quality_filter = quality_filter
+        
+        # Near-duplicate photos of the same scene reuse a stored classification
+        if duplicate_index is None and config.PHASH_ENABLED:
+            duplicate_index = PerceptualHashIndex.from_config()
+        self.duplicate_index = duplicate_index
+        
+        # In-flight images; the graph state only carries a handle into this store
+        self.blob_store = get_blob_store()
+        
+        # Located reports of a category close in place and time form incidents, whose
+        # recent confident result can answer (or shortcut) another photo of the same scene
+        if incident_index is None and config.INCIDENT_CLUSTERING_ENABLED:
+            incident_index = IncidentIndex.from_config()
+        self.incident_index = incident_index
+        self.incident_reuse = config.INCIDENT_REUSE_MODE if incident_index is not None else "off"
+        if self.incident_reuse not in self.INCIDENT_REUSE_MODES:
+            raise ValueError(f"Unknown incident reuse mode: {self.incident_reuse}")
+        
+        # Every run's full state, timings and model calls, written behind the response
+        if analysis_log is None and config.ANALYSIS_LOG_ENABLED:
+            analysis_log = AnalysisLog.from_config()
+        self.analysis_log = analysis_log
+        
+        # Model cascade: small model first, large model only when the answer is doubtful
+        self.cascade = config.CASCADE_ENABLED if cascade is None else cascade
+        self.cascade_thresholds = dict(config.CASCADE_CONFIDENCE_THRESHOLDS)
+        self._cascade_counts: Counter = Counter()
+        self._cascade_lock = threading.Lock()
+        
+        # Default topology, overridable per call
+        self.mode = self._resolve_mode(mode or config.CLASSIFICATION_MODE)
+        self.graphs = {name: self._build_graph(name) for name in self.MODES}
+        self.graph = self.graphs[self.mode]
+    
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        """Validate a requested mode, falling back to the default"""
+        mode = mode or self.mode
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown classification mode: {mode}")
+        return mode
     
-    def _build_graph(self) -> StateGraph:
-        """Build the LangGraph workflow"""
+    def _build_graph(self, mode: str = "accurate") -> StateGraph:
+        """Build the LangGraph workflow for the given mode"""
         
         # Create the state graph
         workflow = StateGraph(GraphState)
         
-        # Add nodes
-        workflow.add_node("analyze", analyze_image_node)
-        workflow.add_node("classify", classify_image_node)
-        workflow.add_node("format_output", self._format_output_node)
+        # Add nodes (sync variants serve invoke, async variants serve ainvoke)
+        self._add_node(workflow, "quality_gate", self._quality_gate_node)
+        self._add_node(workflow, "dedupe", self._dedupe_node)
+        self._add_node(workflow, "incident", self._incident_node)
+        if mode == "fast":
+            self._add_node(workflow, "fast_classify", fast_classify_node, afast_classify_node)
+        else:
+            self._add_node(workflow, "analyze", analyze_image_node, aanalyze_image_node)
+            self._add_node(workflow, "classify", classify_image_node, aclassify_image_node)
+        self._add_node(workflow, "remember", self._remember_node)
+        self._add_node(workflow, "format_output", self._format_output_node)
         
         # Define the flow
-        workflow.set_entry_point("analyze")
-        workflow.add_edge("analyze", "classify")
-        workflow.add_edge("classify", "format_output")
+        first_llm_node = "fast_classify" if mode == "fast" else "analyze"
+        last_llm_node = "fast_classify" if mode == "fast" else "classify"
+        workflow.set_entry_point("quality_gate")
+        workflow.add_conditional_edges(
+            "quality_gate",
+            self._route_after_quality_gate,
+            {"continue": "dedupe", "unusable": "format_output"}
+        )
+        workflow.add_conditional_edges(
+            "dedupe",
+            self._route_after_dedupe,
+            {"continue": "incident", "duplicate": "format_output"}
+        )
+        workflow.add_conditional_edges(
+            "incident",
+            self._route_after_incident,
+            {"continue": first_llm_node, "reused": "format_output"}
+        )
+        if mode != "fast":
+            workflow.add_edge("analyze", "classify")
+        if self.cascade or self.incident_reuse == "confirm":
+            # Doubtful small-model answers (cascade or incident confirmations) loop back
+            # through the LLM nodes on the large model
+            self._add_node(workflow, "escalate", self._escalate_node)
+            workflow.add_conditional_edges(
+                last_llm_node,
+                self._route_after_llm,
+                {"escalate": "escalate", "accept": "remember"}
+            )
+            workflow.add_edge("escalate", first_llm_node)
+        else:
+            workflow.add_edge(last_llm_node, "remember")
+        workflow.add_edge("remember", "format_output")
         workflow.add_edge("format_output", END)
         
         # Compile the graph
         return workflow.compile()
     
+    @staticmethod
+    def _add_node(workflow: StateGraph, name: str, func, afunc=None) -> None:
+        """Add a node timed by the metrics layer, with an async variant when it has one"""
+        func = instrument_node(name, func)
+        if afunc is None:
+            workflow.add_node(name, func)
+        else:
+            workflow.add_node(name, RunnableLambda(func, afunc=instrument_node(name, afunc)))
+    
+    def _quality_gate_node(self, state: GraphState) -> GraphState:
+        """
+        Entry node that measures image quality locally.
+        Clearly unusable images are rejected here without any model call.
+        """
+        if self.quality_filter is None:
+            return state
+        
+        try:
+            source_size = (state.source_width, state.source_height) if state.source_width else None
+            report = self.quality_filter.assess(self.blob_store.get(state.image_ref), source_size)
+        except Exception:
+            # The gate is an optimization; let the model judge images it cannot measure
+            return state
+        
+        state.quality_metrics = report.metrics()
+        if not report.usable:
+            state.quality_issues = report.issues
+            state.classification = ClassificationResult(
+                category="reject",
+                severity=None,
+                severity_level=None,
+                scale=None,
+                confidence=0.9,
+                reasoning=f"Image rejected by the quality pre-filter: {', '.join(report.issues)}."
+            )
+        return state
+    
+    def _route_after_quality_gate(self, state: GraphState) -> str:
+        """Skip straight to the output when the image is unusable"""
+        return "unusable" if state.quality_issues else "continue"
+    
+    def _dedupe_node(self, state: GraphState) -> GraphState:
+        """
+        Entry node that looks the image up in the perceptual-hash index.
+        A close enough match reuses the stored classification and skips the LLM calls.
+        """
+        if self.duplicate_index is None:
+            return state
+        
+        try:
+            image_hash = self.duplicate_index.compute_hash(self.blob_store.get(state.image_ref))
+            state.perceptual_hash = f"{image_hash:016x}"
+            
+            match = self.duplicate_index.lookup(image_hash)
+            if match is not None:
+                state.classification, state.duplicate_distance = match
+                with self._cascade_lock:
+                    self._cascade_counts["answered:duplicate"] += 1
+                
+        except Exception:
+            # Deduplication is an optimization; fall through to the full analysis
+            state.perceptual_hash = None
+        
+        return state
+    
+    def _route_after_dedupe(self, state: GraphState) -> str:
+        """Skip straight to the output when a near-duplicate was found"""
+        return "duplicate" if state.classification is not None else "continue"
+    
+    def _incident_node(self, state: GraphState) -> GraphState:
+        """
+        Node that looks a located report up among the known incidents.
+        A recent confident result of its incident either answers the image ("reuse")
+        or is checked by the small model instead of the full pipeline ("confirm").
+        """
+        if (
+            self.incident_reuse == "off"
+            or state.latitude is None
+            or state.longitude is None
+            or not state.declared_category
+        ):
+            return state
+        
+        try:
+            match = self.incident_index.reusable(
+                state.latitude, state.longitude, state.declared_category, state.captured_at
+            )
+        except Exception:
+            # Incident reuse is an optimization; fall through to the full analysis
+            return state
+        if match is None:
+            return state
+        
+        state.incident_id, classification = match
+        if self.incident_reuse == "reuse":
+            state.classification = classification
+            state.incident_action = "reused"
+            with self._cascade_lock:
+                self._cascade_counts["answered:incident"] += 1
+        else:
+            # The cascade's escalation rules send disagreements and doubtful answers to the large model
+            state.incident_action = "confirm"
+            state.model = config.CASCADE_SMALL_MODEL
+            state.model_tier = "small"
+        return state
+    
+    def _route_after_incident(self, state: GraphState) -> str:
+        """Skip straight to the output when the incident's result was reused"""
+        return "reused" if state.incident_action == "reused" else "continue"
+    
+    def _attach_incident(
+        self,
+        result: Dict[str, Any],
+        location: Optional[Tuple[float, float]],
+        captured_at: Optional[float],
+        report_id: Optional[str],
+        final_state: Any = None
+    ) -> Dict[str, Any]:
+        """Add a located, non-rejected report to its incident and return the result with its incident_id"""
+        if self.incident_index is None or location is None or result.get("category") in (None, "reject"):
+            return result
+        
+        # Only a fresh model answer may become the incident's reusable result
+        classification = None
+        if (
+            final_state is not None
+            and self._is_cacheable(final_state)
+            and self._state_value(final_state, "duplicate_distance") is None
+        ):
+            classification = self._state_value(final_state, "classification")
+        try:
+            incident = self.incident_index.add(
+                location[0], location[1], result["category"], captured_at, report_id, classification
+            )
+        except Exception:
+            return result
+        return {**result, "incident_id": incident["id"]}
+    
+    def _escalation_reason(self, state: GraphState) -> Optional[str]:
+        """Why a small-model answer should be re-run on the large model, if it should"""
+        if state.model_tier != "small":
+            return None
+        # Out of time: keep whatever the small model produced rather than start another call
+        if state.error_type == "DeadlineExceeded" or (state.deadline and time.time() >= state.deadline):
+            return None
+        if state.error or state.classification is None:
+            return "error"
+        
+        category = state.classification.category
+        if category == "reject":
+            return "reject"
+        if state.declared_category and category != state.declared_category:
+            return "declared_mismatch"
+        if state.classification.confidence < self.cascade_thresholds.get(category, 1.0):
+            return "low_confidence"
+        return None
+    
+    def _route_after_llm(self, state: GraphState) -> str:
+        """Accept the classification or send it up to the large model"""
+        return "escalate" if self._escalation_reason(state) else "accept"
+    
+    def _escalate_node(self, state: GraphState) -> GraphState:
+        """Discard the small-model answer and switch the state to the large model"""
+        reason = self._escalation_reason(state)
+        with self._cascade_lock:
+            self._cascade_counts["escalations"] += 1
+            self._cascade_counts[f"escalation_reason:{reason}"] += 1
+        
+        state.escalation_reason = reason
+        state.analysis = None
+        state.classification = None
+        state.error = None
+        state.error_type = None
+        state.model = config.OPENAI_MODEL
+        state.model_tier = "large"
+        return state
+    
+    def cascade_stats(self) -> Dict[str, Any]:
+        """Which tier answered and how often the cascade escalated"""
+        with self._cascade_lock:
+            counts = dict(self._cascade_counts)
+        
+        answered = counts.get("answered:small", 0) + counts.get("answered:large", 0)
+        escalations = counts.get("escalations", 0)
+        return {
+            "enabled": self.cascade,
+            "small_model": config.CASCADE_SMALL_MODEL,
+            "large_model": config.OPENAI_MODEL,
+            "confidence_thresholds": self.cascade_thresholds,
+            "answered_by": {
+                "small": counts.get("answered:small", 0),
+                "large": counts.get("answered:large", 0),
+                "duplicate_index": counts.get("answered:duplicate", 0),
+                "incident": counts.get("answered:incident", 0)
+            },
+            "escalations": escalations,
+            "escalation_reasons": {
+                key.split(":", 1)[1]: value
+                for key, value in counts.items()
+                if key.startswith("escalation_reason:")
+            },
+            "escalation_rate": escalations / answered if answered else 0.0
+        }
+    
+    def _remember_node(self, state: GraphState) -> GraphState:
+        """
+        Store a fresh classification in the perceptual-hash index and record which tier answered.
+        A small-model confirmation of an incident's result is not stored: it was only trusted
+        because of where the photo was taken, which a later near-duplicate need not share.
+        """
+        with self._cascade_lock:
+            self._cascade_counts[f"answered:{state.model_tier}"] += 1
+        
+        if (
+            self.duplicate_index is not None
+            and state.perceptual_hash is not None
+            and state.classification is not None
+            and not state.error
+            and not (state.incident_action == "confirm" and state.model_tier == "small")
+        ):
+            try:
+                self.duplicate_index.add(int(state.perceptual_hash, 16), state.classification)
+            except Exception:
+                pass
+        
+        return state
+    
+    def close(self) -> None:
+        """Persist indexes and release resources on shutdown"""
+        if self.duplicate_index is not None:
+            self.duplicate_index.close()
+        if self.result_cache is not None:
+            self.result_cache.close()
+        if self.analysis_log is not None:
+            self.analysis_log.close()
+    
     def _format_output_node(self, state: GraphState) -> GraphState:
         """
         Final node that formats the output as minimal JSON response.
-        All detailed analysis is kept in backend for precision.
+        All detailed analysis stays in the state, which the analysis log persists.
         """
         try:
             if state.error:
@@ -68,13 +453,14 @@ class ImageClassificationGraph:
             
             # Keep all detailed data in backend for accuracy
             # This includes: confidence, reasoning, analysis details, etc.
-            # These are still available in state.classification and state.analysis
-            # but are not exposed in the final output
+            # These are still available in state.classification and state.analysis,
+            # and written to the analysis log, but are not exposed in the final output
             
             return state
             
         except Exception as e:
             state.error = f"Error formatting output: {str(e)}"
+            state.error_type = type(e).__name__
             state.formatted_result = {
                 "category": "reject",
                 "severity": None,
@@ -83,31 +469,381 @@ class ImageClassificationGraph:
             }
             return state
     
-    def process_image(self, image_base64: str) -> Dict[str, Any]:
+    def process_image(
+        self,
+        image_base64: str,
+        detail: Optional[str] = None,
+        mode: Optional[str] = None,
+        declared_category: Optional[str] = None,
+        deadline: Optional[float] = None,
+        location: Optional[Tuple[float, float]] = None,
+        captured_at: Optional[float] = None,
+        report_id: Optional[str] = None,
+        source_size: Optional[Tuple[int, int]] = None
+    ) -> Dict[str, Any]:
         """
         Process an image through the full classification workflow
         
         Args:
-            image_base64: Base64 encoded image data
+            image_base64: Base64 encoded image data, held in the blob store only while the graph runs
+            detail: Vision detail level ("low", "high" or "auto") from the preprocessing profile
+            mode: "accurate" or "fast"; defaults to the graph's configured mode
+            declared_category: Category the user reported, used by the cascade to spot disagreements
+            deadline: Epoch seconds by which the result is due; defaults to REQUEST_TIMEOUT_SECONDS from now
+            location: (latitude, longitude) of the report; located reports are clustered into incidents
+            captured_at: Epoch seconds the photo was taken (e.g. from its EXIF); defaults to now
+            report_id: Report the photo belongs to, remembered by its incident
+            source_size: (width, height) of the image before preprocessing, for the resolution check
             
         Returns:
-            Dictionary containing minimal classification results (category, severity, severity_level, scale)
+            Dictionary containing minimal classification results (category, severity, severity_level, scale),
+            plus the incident_id of a located report
         """
-        # Create initial state
-        initial_state = GraphState(image_data=image_base64)
+        run = self._prepare_run(
+            image_base64, detail, mode, declared_category, deadline, location, captured_at, report_id, source_size
+        )
+        if run.cache_key is not None:
+            cached = self._serve_cached(run, self.result_cache.get(run.cache_key))
+            if cached is not None:
+                return cached
         
-        # Run the graph
-        final_state = self.graph.invoke(initial_state)
-
-        # Support both dict-like and BaseModel state objects
-        formatted_result = None
+        with self._graph_input(run) as (initial_state, trace):
+            final_state = self.graphs[run.mode].invoke(initial_state, config=graph_run_config())
+        
+        result, cacheable = self._finish_run(run, final_state, trace)
+        if cacheable is not None:
+            self.result_cache.set(run.cache_key, cacheable)
+        return result
+    
+    async def aprocess_image(
+        self,
+        image_base64: str,
+        detail: Optional[str] = None,
+        mode: Optional[str] = None,
+        declared_category: Optional[str] = None,
+        deadline: Optional[float] = None,
+        location: Optional[Tuple[float, float]] = None,
+        captured_at: Optional[float] = None,
+        report_id: Optional[str] = None,
+        source_size: Optional[Tuple[int, int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of process_image driven by graph.ainvoke, so the
+        OpenAI calls never block the event loop. Takes the same arguments
+        and returns the same result as process_image.
+        """
+        run = self._prepare_run(
+            image_base64, detail, mode, declared_category, deadline, location, captured_at, report_id, source_size
+        )
+        if run.cache_key is not None:
+            cached = self._serve_cached(run, await self.result_cache.aget(run.cache_key))
+            if cached is not None:
+                return cached
+        
+        with self._graph_input(run) as (initial_state, trace):
+            final_state = await self.graphs[run.mode].ainvoke(initial_state, config=graph_run_config())
+        
+        result, cacheable = self._finish_run(run, final_state, trace)
+        if cacheable is not None:
+            await self.result_cache.aset(run.cache_key, cacheable)
+        return result
+    
+    async def astream_image(
+        self,
+        image_base64: str,
+        detail: Optional[str] = None,
+        mode: Optional[str] = None,
+        declared_category: Optional[str] = None,
+        deadline: Optional[float] = None,
+        location: Optional[Tuple[float, float]] = None,
+        captured_at: Optional[float] = None,
+        report_id: Optional[str] = None,
+        source_size: Optional[Tuple[int, int]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of aprocess_image that yields an event as each node completes.
+        Takes the same arguments as process_image.
+        
+        Events are dicts with an "event" key:
+        - "node": a node finished; carries the node name, elapsed milliseconds and
+          a small node-specific summary. After "analyze" flags an indoor/household
+          scene it also carries a provisional reject result.
+        - "result": the final minimal result, always the last event.
+        """
+        run = self._prepare_run(
+            image_base64, detail, mode, declared_category, deadline, location, captured_at, report_id, source_size
+        )
+        if run.cache_key is not None:
+            cached = self._serve_cached(run, await self.result_cache.aget(run.cache_key))
+            if cached is not None:
+                yield {"event": "result", "result": cached, "cached": True, "elapsed_ms": run.elapsed_ms()}
+                return
+        
+        # The blob is released when the run ends, or when the client disconnects and the stream is closed
+        final_state = None
+        with self._graph_input(run) as (initial_state, trace):
+            # "updates" mode yields {node_name: state_after_node} as each node returns
+            async for update in self.graphs[run.mode].astream(
+                initial_state, config=graph_run_config(), stream_mode="updates"
+            ):
+                for node, node_state in update.items():
+                    final_state = node_state
+                    yield {
+                        "event": "node",
+                        "node": node,
+                        "elapsed_ms": run.elapsed_ms(),
+                        **self._node_summary(node, node_state)
+                    }
+        
+        result, cacheable = self._finish_run(run, final_state, trace)
+        if cacheable is not None:
+            await self.result_cache.aset(run.cache_key, cacheable)
+        yield {"event": "result", "result": result, "cached": False, "elapsed_ms": run.elapsed_ms()}
+    
+    def _prepare_run(
+        self,
+        image_base64: str,
+        detail: Optional[str],
+        mode: Optional[str],
+        declared_category: Optional[str],
+        deadline: Optional[float],
+        location: Optional[Tuple[float, float]],
+        captured_at: Optional[float],
+        report_id: Optional[str],
+        source_size: Optional[Tuple[int, int]]
+    ) -> "_Run":
+        """Resolve an entry point's arguments into a run, with its result cache key"""
+        started = time.perf_counter()
+        mode = self._resolve_mode(mode)
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.make_key(image_base64, variant=self._cache_variant(mode, declared_category))
+        return _Run(
+            image_base64=image_base64,
+            detail=detail,
+            mode=mode,
+            declared_category=declared_category,
+            deadline=deadline,
+            location=location,
+            captured_at=captured_at,
+            report_id=report_id,
+            source_size=source_size,
+            cache_key=cache_key,
+            started=started
+        )
+    
+    def _serve_cached(self, run: "_Run", cached: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Finish a run answered by the result cache; None on a miss"""
+        if cached is None:
+            return None
+        record_result(cached, "cache")
+        cached = self._attach_incident(cached, run.location, run.captured_at, run.report_id)
+        self._log_run(run, result=cached)
+        return cached
+    
+    @contextmanager
+    def _graph_input(self, run: "_Run") -> Iterator[Tuple[GraphState, RunTrace]]:
+        """Hold the image in the blob store and trace the run while the graph runs; the state only carries its handle"""
+        with self.blob_store.hold(run.image_base64) as image_ref, trace_run() as trace:
+            yield self._initial_state(
+                image_ref,
+                run.detail,
+                run.declared_category,
+                run.deadline,
+                run.location,
+                run.captured_at,
+                run.source_size
+            ), trace
+    
+    def _finish_run(
+        self,
+        run: "_Run",
+        final_state: Any,
+        trace: RunTrace
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Log a graph run and turn its final state into the result to return, raising
+        DeadlineExceeded when it ran out of time. Also returns the result to store
+        in the cache, or None when it must not be cached.
+        """
+        self._log_run(run, final_state=final_state, trace=trace)
+        self._raise_if_timed_out(final_state)
+        
+        result = self._extract_result(final_state)
+        record_result(result, "graph")
+        cacheable = result if run.cache_key is not None and self._is_cacheable(final_state) else None
+        return self._attach_incident(result, run.location, run.captured_at, run.report_id, final_state), cacheable
+    
+    @classmethod
+    def _node_summary(cls, node: str, node_state: Any) -> Dict[str, Any]:
+        """What a client may learn from a finished node, without exposing internal reasoning"""
+        error = cls._state_value(node_state, "error")
+        if error:
+            return {"error": True}
+        
+        analysis = cls._state_value(node_state, "analysis")
+        classification = cls._state_value(node_state, "classification")
+        
+        if node == "quality_gate":
+            issues = cls._state_value(node_state, "quality_issues") or []
+            summary = {"usable": not issues, "issues": issues}
+            if issues:
+                summary["provisional"] = {
+                    "category": "reject",
+                    "severity": None,
+                    "severity_level": None,
+                    "scale": None
+                }
+            return summary
+        
+        if node == "dedupe":
+            distance = cls._state_value(node_state, "duplicate_distance")
+            return {"duplicate": distance is not None, "distance": distance}
+        
+        if node == "analyze" and analysis is not None:
+            summary = {
+                "environment_type": analysis.environment_type,
+                "is_indoor_household": analysis.is_indoor_household
+            }
+            if analysis.is_indoor_household:
+                # The classification node rejects household scenes without a model call,
+                # so the verdict is known now; the cascade may still re-check it
+                summary["provisional"] = {
+                    "category": "reject",
+                    "severity": None,
+                    "severity_level": None,
+                    "scale": None
+                }
+            return summary
+        
+        if node in ("classify", "fast_classify") and classification is not None:
+            return {
+                "model_tier": cls._state_value(node_state, "model_tier"),
+                "provisional": {
+                    "category": classification.category,
+                    "severity": classification.severity,
+                    "severity_level": classification.severity_level,
+                    "scale": classification.scale
+                }
+            }
+        
+        if node == "incident":
+            return {
+                "incident_id": cls._state_value(node_state, "incident_id"),
+                "action": cls._state_value(node_state, "incident_action")
+            }
+        
+        if node == "escalate":
+            return {"reason": cls._state_value(node_state, "escalation_reason")}
+        
+        return {}
+    
+    def _log_run(
+        self,
+        run: "_Run",
+        final_state: Any = None,
+        trace: Optional[RunTrace] = None,
+        result: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Queue a finished run (or a cache hit, given its result) for the analysis log"""
+        if self.analysis_log is None:
+            return
+        timings: Dict[str, Any] = {"total_ms": run.elapsed_ms()}
+        if trace is not None:
+            timings["nodes"] = trace.nodes
+        self.analysis_log.record(
+            result if final_state is None else self._state_value(final_state, "formatted_result"),
+            final_state,
+            report_id=run.report_id,
+            source="graph" if final_state is not None else "cache",
+            timings=timings,
+            model_calls=trace.model_calls if trace is not None else None,
+            settings={
+                "mode": run.mode,
+                "cascade": self.cascade,
+                "incident_reuse": self.incident_reuse,
+                "large_model": config.OPENAI_MODEL,
+                "small_model": config.CASCADE_SMALL_MODEL if self.cascade or self.incident_reuse == "confirm" else None,
+                "prompt_version": config.PROMPT_VERSION
+            }
+        )
+    
+    def _cache_variant(self, mode: str, declared_category: Optional[str] = None) -> str:
+        """
+        Results from different topologies or cascade settings are cached separately. A cascade
+        result also depends on its small model and on the declared category, whose mismatch
+        escalates to the large model.
+        """
+        if not self.cascade:
+            return mode
+        declared = declared_category.lower() if declared_category else "-"
+        return f"{mode}:cascade:{config.CASCADE_SMALL_MODEL}:{declared}"
+    
+    def _initial_state(
+        self,
+        image_ref: str,
+        detail: Optional[str],
+        declared_category: Optional[str],
+        deadline: Optional[float] = None,
+        location: Optional[Tuple[float, float]] = None,
+        captured_at: Optional[float] = None,
+        source_size: Optional[Tuple[int, int]] = None
+    ) -> GraphState:
+        """Build the starting state, on the small model when the cascade is enabled"""
+        if deadline is None and config.REQUEST_TIMEOUT_SECONDS > 0:
+            deadline = time.time() + config.REQUEST_TIMEOUT_SECONDS
+        latitude, longitude = location if location is not None else (None, None)
+        source_width, source_height = source_size if source_size is not None else (None, None)
+        return GraphState(
+            image_ref=image_ref,
+            image_detail=detail,
+            declared_category=declared_category.lower() if declared_category else None,
+            deadline=deadline,
+            latitude=latitude,
+            longitude=longitude,
+            captured_at=captured_at,
+            source_width=source_width,
+            source_height=source_height,
+            model=config.CASCADE_SMALL_MODEL if self.cascade else config.OPENAI_MODEL,
+            model_tier="small" if self.cascade else "large"
+        )
+    
+    @staticmethod
+    def _state_value(final_state: Any, name: str) -> Any:
+        """Read a field from the final state, which may be dict-like or a BaseModel"""
         try:
-            if hasattr(final_state, "formatted_result"):
-                formatted_result = final_state.formatted_result
+            if hasattr(final_state, name):
+                return getattr(final_state, name)
             elif isinstance(final_state, dict):
-                formatted_result = final_state.get("formatted_result")
+                return final_state.get(name)
         except Exception:
-            formatted_result = None
+            pass
+        return None
+    
+    @classmethod
+    def _raise_if_timed_out(cls, final_state: Any) -> None:
+        """A run cut short by its deadline is an error for the caller, not a "reject" verdict"""
+        if cls._state_value(final_state, "error_type") == "DeadlineExceeded":
+            raise DeadlineExceeded(cls._state_value(final_state, "error"))
+    
+    @classmethod
+    def _is_cacheable(cls, final_state: Any) -> bool:
+        """
+        Only results produced without errors, and from the image rather than its incident, are worth caching.
+        A too_small reject depends on the submitted size, which the key (the prepared image) does not cover.
+        """
+        return (
+            cls._state_value(final_state, "error") is None
+            and cls._state_value(final_state, "classification") is not None
+            and cls._state_value(final_state, "incident_action") is None
+            and "too_small" not in (cls._state_value(final_state, "quality_issues") or [])
+        )
+    
+    @classmethod
+    def _extract_result(cls, final_state: Any) -> Dict[str, Any]:
+        """Pull the formatted result out of the final graph state"""
+        # Support both dict-like and BaseModel state objects
+        formatted_result = cls._state_value(final_state, "formatted_result")
 
         # Return formatted result
         if formatted_result is not None:
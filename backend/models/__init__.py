@@ -1,3 +1,3 @@
-from .schemas import ImageAnalysis, ClassificationResult, GraphState
+from .schemas import ImageAnalysis, ClassificationResult, FastClassification, GraphState
 
-__all__ = ["ImageAnalysis", "ClassificationResult", "GraphState"]
+__all__ = ["ImageAnalysis", "ClassificationResult", "FastClassification", "GraphState"]
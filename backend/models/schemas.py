@@ -61,11 +61,88 @@ class ClassificationResult(BaseModel):
     )
 
 
+class FastClassification(BaseModel):
+    """Structured output for fast mode: analysis and classification from a single vision call"""
+    
+    analysis: ImageAnalysis = Field(
+        description="Detailed analysis of the image"
+    )
+    classification: ClassificationResult = Field(
+        description="Classification and severity assessment based on that analysis"
+    )
+
+
 class GraphState(BaseModel):
     """State object for the LangGraph workflow"""
     
-    image_data: str = Field(description="Base64 encoded image data")
+    image_ref: str = Field(description="Handle of the base64 image in the process-local blob store")
+    image_detail: Optional[Literal["low", "high", "auto"]] = Field(
+        default=None,
+        description="Vision detail level chosen by the preprocessing profile"
+    )
+    declared_category: Optional[str] = Field(
+        default=None,
+        description="Category the reporting user selected, if known"
+    )
+    model: Optional[str] = Field(
+        default=None,
+        description="OpenAI model for the LLM nodes; defaults to config.OPENAI_MODEL"
+    )
+    model_tier: Literal["small", "large"] = Field(
+        default="large",
+        description="Cascade tier that produced the classification"
+    )
+    escalation_reason: Optional[str] = Field(
+        default=None,
+        description="Why the cascade re-ran the image on the large model"
+    )
+    deadline: Optional[float] = Field(
+        default=None,
+        description="Epoch seconds by which the result is due; model calls give up once it passes"
+    )
     analysis: Optional[ImageAnalysis] = None
     classification: Optional[ClassificationResult] = None
     error: Optional[str] = None
+    error_type: Optional[str] = Field(
+        default=None,
+        description="Exception class behind error, for per-node error metrics"
+    )
+    quality_issues: List[str] = Field(
+        default_factory=list,
+        description="Reasons the quality pre-filter found the image unusable"
+    )
+    source_width: Optional[int] = Field(
+        default=None,
+        description="Width of the submitted image before preprocessing downscaled it"
+    )
+    source_height: Optional[int] = None
+    quality_metrics: Optional[Dict[str, float]] = Field(
+        default=None,
+        description="Sharpness, exposure, resolution and colour entropy measured by the pre-filter"
+    )
+    perceptual_hash: Optional[str] = Field(
+        default=None,
+        description="Hex-encoded 64-bit perceptual hash of the image"
+    )
+    duplicate_distance: Optional[int] = Field(
+        default=None,
+        description="Hamming distance to the stored near-duplicate whose result was reused"
+    )
+    latitude: Optional[float] = Field(
+        default=None,
+        description="Where the report was filed, from the request or the photo's EXIF GPS"
+    )
+    longitude: Optional[float] = None
+    captured_at: Optional[float] = Field(
+        default=None,
+        description="Epoch seconds the photo was taken, from its EXIF"
+    )
+    incident_id: Optional[str] = Field(
+        default=None,
+        description="Incident of nearby same-category reports whose result was reused or confirmed"
+    )
+    incident_action: Optional[Literal["reused", "confirm"]] = Field(
+        default=None,
+        description="Whether the incident's result answered the image or a cheaper model checked it"
+    )
     formatted_result: Optional[Dict[str, Any]] = None
@@ -1,4 +1,12 @@
-from .analysis_node import analyze_image_node
-from .classification_node import classify_image_node
+from .analysis_node import analyze_image_node, aanalyze_image_node
+from .classification_node import classify_image_node, aclassify_image_node
+from .fast_node import fast_classify_node, afast_classify_node
 
-__all__ = ['analyze_image_node', 'classify_image_node']
\ No newline at end of file
+__all__ = [
+    'analyze_image_node',
+    'aanalyze_image_node',
+    'classify_image_node',
+    'aclassify_image_node',
+    'fast_classify_node',
+    'afast_classify_node',
+]
\ No newline at end of file
@@ -1,29 +1,13 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from models.schemas import GraphState, ImageAnalysis
+from services.llm_clients import get_structured_llm
+from services.call_policy import get_call_policy
+from services.blob_store import get_blob_store
 import config
 
 
-def analyze_image_node(state: GraphState) -> GraphState:
-    """
-    Node that performs detailed image analysis using OpenAI's vision model.
-    
-    Args:
-        state: Current graph state containing image data
-        
-    Returns:
-        Updated state with analysis results
-    """
-    try:
-        # Initialize the OpenAI model with structured output
-        llm = ChatOpenAI(
-            model=config.OPENAI_MODEL,
-            api_key=config.OPENAI_API_KEY,
-            temperature=0.9
-        ).with_structured_output(ImageAnalysis)
-        
-        # Create the analysis prompt
-        analysis_prompt = """
+# Analysis prompt shared by the sync and async node variants
+ANALYSIS_PROMPT = """
         Analyze this image in detail. Provide a comprehensive analysis including:
         1. What you see in the image (detailed description)
         2. All objects, features, and elements you can detect
@@ -43,20 +27,82 @@ def analyze_image_node(state: GraphState) -> GraphState:
         Be thorough and objective in your analysis. Focus on observable details
         that could be relevant for legitimate environmental or infrastructure assessment.
         """
+
+
+def _get_analysis_llm(state: GraphState):
+    """Fetch the shared OpenAI client with structured output from the registry"""
+    return get_structured_llm(
+        model=state.model or config.OPENAI_MODEL,
+        temperature=0.9,
+        schema=ImageAnalysis
+    )
+
+
+def _build_analysis_message(state: GraphState) -> HumanMessage:
+    """Create the multimodal message carrying the prompt and the image"""
+    # The pixels are fetched from the blob store only here, as the message is built
+    image_url = {"url": get_blob_store().data_url(state.image_ref)}
+    if state.image_detail:
+        image_url["detail"] = state.image_detail
+    
+    return HumanMessage(
+        content=[
+            {"type": "text", "text": ANALYSIS_PROMPT},
+            {
+                "type": "image_url",
+                "image_url": image_url
+            }
+        ]
+    )
+
+
+def analyze_image_node(state: GraphState) -> GraphState:
+    """
+    Node that performs detailed image analysis using OpenAI's vision model.
+    
+    Args:
+        state: Current graph state containing image data
         
-        # Create message with image
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": analysis_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{state.image_data}"}
-                }
-            ]
-        )
+    Returns:
+        Updated state with analysis results
+    """
+    try:
+        llm = _get_analysis_llm(state)
         
         # Get structured analysis
-        analysis = llm.invoke([message])
+        analysis = get_call_policy().invoke(
+            llm, [_build_analysis_message(state)], "analyze", state.model or config.OPENAI_MODEL, state.deadline
+        )
+        
+        # Update state with analysis
+        state.analysis = analysis
+        
+        return state
+        
+    except Exception as e:
+        state.error = f"Error in image analysis: {str(e)}"
+        state.error_type = type(e).__name__
+        return state
+
+
+async def aanalyze_image_node(state: GraphState) -> GraphState:
+    """
+    Async variant of analyze_image_node used when the graph runs via ainvoke.
+    The OpenAI request is awaited so the event loop stays free meanwhile.
+    
+    Args:
+        state: Current graph state containing image data
+        
+    Returns:
+        Updated state with analysis results
+    """
+    try:
+        llm = _get_analysis_llm(state)
+        
+        # Get structured analysis without blocking the event loop
+        analysis = await get_call_policy().ainvoke(
+            llm, [_build_analysis_message(state)], "analyze", state.model or config.OPENAI_MODEL, state.deadline
+        )
         
         # Update state with analysis
         state.analysis = analysis
@@ -65,4 +111,5 @@ def analyze_image_node(state: GraphState) -> GraphState:
         
     except Exception as e:
         state.error = f"Error in image analysis: {str(e)}"
+        state.error_type = type(e).__name__
         return state
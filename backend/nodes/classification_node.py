@@ -1,46 +1,57 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from models.schemas import GraphState, ClassificationResult
+from services.llm_clients import get_structured_llm
+from services.call_policy import get_call_policy
 import config
 
 
-def classify_image_node(state: GraphState) -> GraphState:
+def _get_classification_llm(state: GraphState):
+    """Fetch the shared OpenAI client with structured output from the registry"""
+    return get_structured_llm(
+        model=state.model or config.OPENAI_MODEL,
+        temperature=0.8,  # Lower temperature for more consistent classifications
+        schema=ClassificationResult
+    )
+
+
+def household_rejection() -> ClassificationResult:
+    """Create simple rejection classification for household/indoor garbage"""
+    return ClassificationResult(
+        category="reject",
+        severity=None,
+        severity_level=None,
+        scale=None,
+        confidence=0.95,  # High confidence for rejection
+        reasoning="Image identified as household/indoor garbage which is not appropriate for environmental monitoring."
+    )
+
+
+def _resolve_without_llm(state: GraphState) -> bool:
     """
-    Node that classifies the image based on analysis and assigns severity score.
+    Handle the cases that need no model call.
     
-    Args:
-        state: Current graph state containing image data and analysis
-        
     Returns:
-        Updated state with classification results
+        True if the state was resolved here and the LLM should be skipped
     """
-    try:
-        if not state.analysis:
-            state.error = "No analysis available for classification"
-            return state
-        
-        # Check for household/indoor garbage first
-        if state.analysis.is_indoor_household:
-            # Create simple rejection classification
-            state.classification = ClassificationResult(
-                category="reject",
-                severity=None,
-                severity_level=None,
-                scale=None,
-                confidence=0.95,  # High confidence for rejection
-                reasoning="Image identified as household/indoor garbage which is not appropriate for environmental monitoring."
-            )
-            return state
-            
-        # Initialize the OpenAI model with structured output
-        llm = ChatOpenAI(
-            model=config.OPENAI_MODEL,
-            api_key=config.OPENAI_API_KEY,
-            temperature=0.8  # Lower temperature for more consistent classifications
-        ).with_structured_output(ClassificationResult)
-        
-        # Create the classification prompt
-        classification_prompt = f"""
+    if not state.analysis:
+        # Keep the analysis node's own error (e.g. a missed deadline) when there is one
+        if state.error:
+            return True
+        state.error = "No analysis available for classification"
+        state.error_type = "MissingAnalysis"
+        return True
+    
+    # Check for household/indoor garbage first
+    if state.analysis.is_indoor_household:
+        state.classification = household_rejection()
+        return True
+    
+    return False
+
+
+def _build_classification_message(state: GraphState) -> HumanMessage:
+    """Create the classification prompt from the analysis results"""
+    classification_prompt = f"""
         Based on the detailed image analysis provided, classify this image into one of these categories:
 
         1. **garbage**: Images showing litter, waste, trash accumulation, illegal dumping, 
@@ -82,24 +93,77 @@ def classify_image_node(state: GraphState) -> GraphState:
         Determine appropriate severity (0-100) and severity_level based on your assessment of the actual impact shown.
         Your confidence should reflect how certain you are of both the category AND severity assessment.
         """
+    
+    return HumanMessage(content=classification_prompt)
+
+
+def apply_classification(state: GraphState, classification: ClassificationResult) -> GraphState:
+    """Validate the model output and store it on the state"""
+    # Validate severity logic - only ensure reject category has null severity
+    if classification.category == "reject":
+        classification.severity = None
+        classification.severity_level = None
+        classification.scale = None
         
-        # Create message for classification
-        message = HumanMessage(content=classification_prompt)
+    # Update state with classification
+    state.classification = classification
+    
+    return state
+
+
+def classify_image_node(state: GraphState) -> GraphState:
+    """
+    Node that classifies the image based on analysis and assigns severity score.
+    
+    Args:
+        state: Current graph state containing image data and analysis
+        
+    Returns:
+        Updated state with classification results
+    """
+    try:
+        if _resolve_without_llm(state):
+            return state
+        
+        llm = _get_classification_llm(state)
         
         # Get structured classification
-        classification = llm.invoke([message])
+        classification = get_call_policy().invoke(
+            llm, [_build_classification_message(state)], "classify", state.model or config.OPENAI_MODEL, state.deadline
+        )
         
-        # Validate severity logic - only ensure reject category has null severity
-        if classification.category == "reject":
-            classification.severity = None
-            classification.severity_level = None
-            classification.scale = None
-            
-        # Update state with classification
-        state.classification = classification
+        return apply_classification(state, classification)
         
+    except Exception as e:
+        state.error = f"Error in image classification: {str(e)}"
+        state.error_type = type(e).__name__
         return state
+
+
+async def aclassify_image_node(state: GraphState) -> GraphState:
+    """
+    Async variant of classify_image_node used when the graph runs via ainvoke.
+    
+    Args:
+        state: Current graph state containing image data and analysis
+        
+    Returns:
+        Updated state with classification results
+    """
+    try:
+        if _resolve_without_llm(state):
+            return state
+        
+        llm = _get_classification_llm(state)
+        
+        # Get structured classification without blocking the event loop
+        classification = await get_call_policy().ainvoke(
+            llm, [_build_classification_message(state)], "classify", state.model or config.OPENAI_MODEL, state.deadline
+        )
+        
+        return apply_classification(state, classification)
         
     except Exception as e:
         state.error = f"Error in image classification: {str(e)}"
+        state.error_type = type(e).__name__
         return state
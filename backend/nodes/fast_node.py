@@ -0,0 +1,133 @@
+from langchain_core.messages import HumanMessage
+from models.schemas import GraphState, FastClassification
+from services.llm_clients import get_structured_llm
+from services.call_policy import get_call_policy
+from services.blob_store import get_blob_store
+from .classification_node import household_rejection, apply_classification
+import config
+
+
+# Single prompt covering both the analysis and the classification stages
+FAST_PROMPT = """
+        Analyze this image in detail and then classify it, in a single response.
+
+        ANALYSIS - describe:
+        1. What you see in the image (detailed description)
+        2. All objects, features, and elements you can detect
+        3. The type of environment shown (IMPORTANT: distinguish between indoor/household vs outdoor/public spaces)
+        4. Lighting conditions
+        5. Image quality assessment
+        6. The environmental or infrastructure issues visible
+        7. Whether this is a legitimate public environmental/infrastructure concern vs household/personal waste
+
+        CLASSIFICATION - based on that analysis, choose one category:
+
+        1. **garbage**: Images showing litter, waste, trash accumulation, illegal dumping,
+           or general pollution from solid waste materials IN PUBLIC/OUTDOOR SPACES ONLY
+        2. **potholes**: Images showing road damage, holes in pavement, street deterioration,
+           or infrastructure damage to roads/sidewalks
+        3. **deforestation**: Images showing cut trees, cleared forest areas, tree stumps,
+           logging activities, or forest destruction
+        4. **reject**: If the image doesn't clearly fit into any of the above categories OR
+           if it shows household/indoor garbage (kitchen waste, home trash, personal spaces)
+
+        IMPORTANT REJECTION CRITERIA:
+        - Indoor/household garbage (kitchen bins, home waste, personal living spaces) → REJECT
+        - Private property waste that's not a public environmental issue → REJECT
+        - Images that appear to be taken mischievously of personal/household items → REJECT
+
+        SEVERITY ASSESSMENT:
+        - Assess the severity on a scale of 0-100 based on the environmental or infrastructure impact
+        - Choose a severity_level from: low, low-high, moderate, moderate-high, high, extreme
+        - Provide scale information describing the size/extent of the issue (e.g., 'small pothole', 'large garbage pile', 'single tree cut', 'extensive forest clearing')
+        - For "reject" category: set severity, severity_level, and scale to null
+
+        Be conservative with category selection - only classify as garbage/potholes/deforestation if clearly evident in PUBLIC spaces.
+        Your confidence should reflect how certain you are of both the category AND severity assessment.
+        """
+
+
+def _get_fast_llm(state: GraphState):
+    """Fetch the shared OpenAI client with structured output from the registry"""
+    return get_structured_llm(
+        model=state.model or config.OPENAI_MODEL,
+        temperature=0.8,
+        schema=FastClassification
+    )
+
+
+def _build_fast_message(state: GraphState) -> HumanMessage:
+    """Create the multimodal message carrying the fused prompt and the image"""
+    image_url = {"url": get_blob_store().data_url(state.image_ref)}
+    if state.image_detail:
+        image_url["detail"] = state.image_detail
+
+    return HumanMessage(
+        content=[
+            {"type": "text", "text": FAST_PROMPT},
+            {"type": "image_url", "image_url": image_url}
+        ]
+    )
+
+
+def _apply_fast_result(state: GraphState, result: FastClassification) -> GraphState:
+    """Store both halves of the fused result, applying the same rules as the two-stage graph"""
+    state.analysis = result.analysis
+
+    if result.analysis.is_indoor_household:
+        state.classification = household_rejection()
+        return state
+
+    return apply_classification(state, result.classification)
+
+
+def fast_classify_node(state: GraphState) -> GraphState:
+    """
+    Node that analyzes and classifies the image with one vision call.
+
+    Args:
+        state: Current graph state containing image data
+
+    Returns:
+        Updated state with analysis and classification results
+    """
+    try:
+        llm = _get_fast_llm(state)
+
+        # Get analysis and classification together
+        result = get_call_policy().invoke(
+            llm, [_build_fast_message(state)], "fast_classify", state.model or config.OPENAI_MODEL, state.deadline
+        )
+
+        return _apply_fast_result(state, result)
+
+    except Exception as e:
+        state.error = f"Error in fast classification: {str(e)}"
+        state.error_type = type(e).__name__
+        return state
+
+
+async def afast_classify_node(state: GraphState) -> GraphState:
+    """
+    Async variant of fast_classify_node used when the graph runs via ainvoke.
+
+    Args:
+        state: Current graph state containing image data
+
+    Returns:
+        Updated state with analysis and classification results
+    """
+    try:
+        llm = _get_fast_llm(state)
+
+        # Get analysis and classification together without blocking the event loop
+        result = await get_call_policy().ainvoke(
+            llm, [_build_fast_message(state)], "fast_classify", state.model or config.OPENAI_MODEL, state.deadline
+        )
+
+        return _apply_fast_result(state, result)
+
+    except Exception as e:
+        state.error = f"Error in fast classification: {str(e)}"
+        state.error_type = type(e).__name__
+        return state
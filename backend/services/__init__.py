@@ -0,0 +1,139 @@
+import importlib
+from typing import TYPE_CHECKING, Any
+
+# Exports are imported on first access (PEP 562), so importing one service does not pull
+# in openai, langchain and langgraph through its siblings; the API process starts faster
+# and only pays for those once the classifier warms up.
+_EXPORTS = {
+    'ResultCache': 'result_cache',
+    'PerceptualHashIndex': 'perceptual_hash',
+    'compute_hash': 'perceptual_hash',
+    'PROFILES': 'preprocessing',
+    'PreparedImage': 'preprocessing',
+    'ImagePreprocessingError': 'preprocessing',
+    'prepare_image': 'preprocessing',
+    'ImageMetadata': 'image_metadata',
+    'read_metadata': 'image_metadata',
+    'apply_orientation': 'image_metadata',
+    'ImageBlobStore': 'blob_store',
+    'BlobStoreFullError': 'blob_store',
+    'BlobNotFoundError': 'blob_store',
+    'get_blob_store': 'blob_store',
+    'ImageDownloader': 'downloader',
+    'ImageDownloadError': 'downloader',
+    'sniff_image_format': 'downloader',
+    'ImageQualityFilter': 'quality',
+    'QualityReport': 'quality',
+    'map_bounded': 'batch',
+    'combine_report_results': 'batch',
+    'JobQueue': 'job_queue',
+    'JobStore': 'job_queue',
+    'JobQueueFullError': 'job_queue',
+    'ReportIndex': 'report_index',
+    'InvalidQueryError': 'report_index',
+    'parse_bbox': 'report_index',
+    'RankedSet': 'ranking',
+    'IncidentIndex': 'incidents',
+    'AnalysisLog': 'analysis_log',
+    'instrument_node': 'metrics',
+    'trace_run': 'metrics',
+    'RunTrace': 'metrics',
+    'graph_run_config': 'llm_callbacks',
+    'record_result': 'metrics',
+    'render_metrics': 'metrics',
+    'RateLimiter': 'rate_limiter',
+    'RateLimitTimeout': 'rate_limiter',
+    'LLMCallPolicy': 'call_policy',
+    'DeadlineExceeded': 'call_policy',
+    'get_call_policy': 'call_policy',
+    'Cassette': 'cassette',
+    'LLMClientRegistry': 'llm_clients',
+    'get_llm_registry': 'llm_clients',
+    'get_structured_llm': 'llm_clients',
+    'close_llm_registry': 'llm_clients',
+}
+
+if TYPE_CHECKING:
+    from .result_cache import ResultCache
+    from .perceptual_hash import PerceptualHashIndex, compute_hash
+    from .preprocessing import PROFILES, PreparedImage, ImagePreprocessingError, prepare_image
+    from .image_metadata import ImageMetadata, read_metadata, apply_orientation
+    from .blob_store import ImageBlobStore, BlobStoreFullError, BlobNotFoundError, get_blob_store
+    from .downloader import ImageDownloader, ImageDownloadError, sniff_image_format
+    from .quality import ImageQualityFilter, QualityReport
+    from .batch import map_bounded, combine_report_results
+    from .job_queue import JobQueue, JobStore, JobQueueFullError
+    from .report_index import ReportIndex, InvalidQueryError, parse_bbox
+    from .ranking import RankedSet
+    from .incidents import IncidentIndex
+    from .analysis_log import AnalysisLog
+    from .metrics import instrument_node, trace_run, RunTrace, record_result, render_metrics
+    from .llm_callbacks import graph_run_config
+    from .rate_limiter import RateLimiter, RateLimitTimeout
+    from .call_policy import LLMCallPolicy, DeadlineExceeded, get_call_policy
+    from .cassette import Cassette
+    from .llm_clients import LLMClientRegistry, get_llm_registry, get_structured_llm, close_llm_registry
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + list(_EXPORTS))
+
+
+__all__ = [
+    'ResultCache',
+    'PerceptualHashIndex',
+    'compute_hash',
+    'PROFILES',
+    'PreparedImage',
+    'ImagePreprocessingError',
+    'prepare_image',
+    'ImageMetadata',
+    'read_metadata',
+    'apply_orientation',
+    'ImageBlobStore',
+    'BlobStoreFullError',
+    'BlobNotFoundError',
+    'get_blob_store',
+    'ImageDownloader',
+    'ImageDownloadError',
+    'sniff_image_format',
+    'ImageQualityFilter',
+    'QualityReport',
+    'map_bounded',
+    'combine_report_results',
+    'JobQueue',
+    'JobStore',
+    'JobQueueFullError',
+    'ReportIndex',
+    'InvalidQueryError',
+    'parse_bbox',
+    'RankedSet',
+    'IncidentIndex',
+    'AnalysisLog',
+    'instrument_node',
+    'trace_run',
+    'RunTrace',
+    'graph_run_config',
+    'record_result',
+    'render_metrics',
+    'RateLimiter',
+    'RateLimitTimeout',
+    'LLMCallPolicy',
+    'DeadlineExceeded',
+    'get_call_policy',
+    'Cassette',
+    'LLMClientRegistry',
+    'get_llm_registry',
+    'get_structured_llm',
+    'close_llm_registry',
+]
\ No newline at end of file
@@ -0,0 +1,262 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+import config
+
+# Graph state fields not kept: the blob handle is dead once the run ends, and the
+# formatted result is stored as the record's "result"
+SKIPPED_STATE_FIELDS = ("image_ref", "formatted_result")
+
+# Tells the writer thread to stop once everything queued before it is written
+_STOP = object()
+
+
+class _Flush:
+    """Queue marker set by the writer thread once every record queued before it is written"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+class AnalysisLog:
+    """
+    Write-behind log of classification runs in SQLite.
+
+    Each record keeps what the API response leaves out: the final graph
+    state without the image (analysis, confidence, reasoning, quality and
+    cascade details), node timings, the OpenAI calls made and the settings
+    the run used. record() only appends to a bounded in-memory queue, so
+    persisting never adds to request latency; a writer thread drains it
+    in batches of up to batch_size records per transaction, which grow on
+    their own while a write is in progress. A full queue drops the record
+    and counts it rather than slowing the request. close() writes
+    everything still queued.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        retention_seconds: float = 0
+    ):
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be at least 1")
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.retention_seconds = retention_seconds
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_runs ("
+            "run_id TEXT PRIMARY KEY, report_id TEXT, created_at REAL NOT NULL, "
+            "source TEXT NOT NULL, category TEXT, record TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS analysis_runs_report "
+            "ON analysis_runs (report_id, created_at) WHERE report_id IS NOT NULL"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS analysis_runs_created ON analysis_runs (created_at)")
+        self._db.commit()
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._last_prune = 0.0
+        self._counts = {
+            "recorded": 0,
+            "dropped": 0,
+            "written": 0,
+            "batches": 0,
+            "largest_batch": 0,
+            "write_errors": 0,
+            "pruned": 0
+        }
+        self._writer = threading.Thread(target=self._run, name="analysis-log-writer", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_config(cls) -> "AnalysisLog":
+        """Build a log from the settings in config.py"""
+        return cls(
+            db_path=config.ANALYSIS_LOG_DB_PATH or ":memory:",
+            max_queue=config.ANALYSIS_LOG_QUEUE_MAX,
+            batch_size=config.ANALYSIS_LOG_BATCH_SIZE,
+            retention_seconds=config.ANALYSIS_LOG_RETENTION_SECONDS
+        )
+
+    def record(
+        self,
+        result: Optional[Dict[str, Any]],
+        state: Any = None,
+        *,
+        report_id: Optional[str] = None,
+        source: str = "graph",
+        timings: Optional[Dict[str, Any]] = None,
+        model_calls: Optional[List[Dict[str, Any]]] = None,
+        settings: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        Queue a run for writing and return its run id, or None when the queue is full.
+
+        state is the final graph state (a GraphState or LangGraph's dict of its
+        fields); it is serialized by the writer thread, off the request path.
+        """
+        run_id = uuid.uuid4().hex
+        entry = (run_id, report_id, time.time(), source, result, state, timings, model_calls, settings)
+        if self._closed:
+            return None
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self._counts["dropped"] += 1
+            return None
+        with self._lock:
+            self._counts["recorded"] += 1
+        return run_id
+
+    @staticmethod
+    def _serialize(entry: Tuple) -> Tuple:
+        run_id, report_id, created_at, source, result, state, timings, model_calls, settings = entry
+        if state is not None:
+            fields = state.__dict__ if isinstance(state, BaseModel) else state
+            state = {name: value for name, value in fields.items() if name not in SKIPPED_STATE_FIELDS}
+        record = {
+            "result": result,
+            "state": state,
+            "timings": timings,
+            "model_calls": model_calls,
+            "settings": settings
+        }
+        category = (result or {}).get("category")
+        return run_id, report_id, created_at, source, category, json.dumps(record, default=_json_default)
+
+    def _write(self, batch: List[Tuple]) -> None:
+        try:
+            rows = [self._serialize(entry) for entry in batch]
+            with self._lock:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO analysis_runs "
+                        "(run_id, report_id, created_at, source, category, record) VALUES (?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                self._counts["written"] += len(rows)
+                self._counts["batches"] += 1
+                self._counts["largest_batch"] = max(self._counts["largest_batch"], len(rows))
+        except (sqlite3.Error, TypeError, ValueError):
+            with self._lock:
+                self._counts["write_errors"] += 1
+
+    def _prune(self) -> None:
+        """Delete runs older than the retention period, at most once a minute"""
+        now = time.time()
+        if self.retention_seconds <= 0 or now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        try:
+            with self._lock:
+                with self._db:
+                    cursor = self._db.execute(
+                        "DELETE FROM analysis_runs WHERE created_at < ?", (now - self.retention_seconds,)
+                    )
+                self._counts["pruned"] += cursor.rowcount
+        except sqlite3.Error:
+            with self._lock:
+                self._counts["write_errors"] += 1
+
+    def _run(self) -> None:
+        """Writer thread: block for the next record, then write it with whatever else is queued"""
+        while True:
+            try:
+                item = self._queue.get(timeout=60)
+            except queue.Empty:
+                self._prune()
+                continue
+            batch: List[Tuple] = []
+            markers: List[Any] = []
+            while True:
+                if isinstance(item, tuple):
+                    batch.append(item)
+                else:
+                    markers.append(item)
+                if len(batch) >= self.batch_size or item is _STOP:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            self._prune()
+            for marker in markers:
+                if isinstance(marker, _Flush):
+                    marker.done.set()
+            if _STOP in markers:
+                return
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every record queued so far is written; False on timeout"""
+        if not self._writer.is_alive():
+            return self._queue.empty()
+        marker = _Flush()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def get(self, report_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """A report's runs, newest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT run_id, report_id, created_at, source, record FROM analysis_runs "
+                "WHERE report_id = ? ORDER BY created_at DESC LIMIT ?",
+                (report_id, limit)
+            ).fetchall()
+        return [
+            {"run_id": run_id, "report_id": report, "created_at": created_at, "source": source, **json.loads(record)}
+            for run_id, report, created_at, source, record in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "db_path": self.db_path,
+            "queued": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "retention_seconds": self.retention_seconds,
+            **counts
+        }
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Write everything still queued, then close the database"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._writer.join(timeout)
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,74 @@
+import asyncio
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def map_bounded(
+    items: Sequence[T],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: int
+) -> AsyncIterator[Tuple[int, Optional[R], Optional[Exception]]]:
+    """
+    Run worker over items with at most `concurrency` in flight, yielding
+    (index, result, error) in completion order. A failing item yields its
+    exception instead of stopping the others. Closing the iterator early
+    cancels the remaining work.
+    """
+    pending: asyncio.Queue = asyncio.Queue()
+    for entry in enumerate(items):
+        pending.put_nowait(entry)
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def run() -> None:
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                finished.put_nowait((index, await worker(item), None))
+            except Exception as e:
+                finished.put_nowait((index, None, e))
+
+    tasks = [asyncio.create_task(run()) for _ in range(max(1, min(concurrency, len(items))))]
+    try:
+        for _ in range(len(items)):
+            yield await finished.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def combine_report_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the classifications of one report's photos into a single verdict.
+
+    The report takes the most common non-reject category (ties go to the
+    category with the highest severity) and the details of its most severe
+    photo. A report is only rejected when every photo was rejected.
+    """
+    accepted = [result for result in results if result.get("category") not in (None, "reject")]
+    if not accepted:
+        return {"category": "reject", "severity": None, "severity_level": None, "scale": None}
+
+    votes = Counter(result["category"] for result in accepted)
+
+    def max_severity(category: str) -> int:
+        return max((r.get("severity") or 0) for r in accepted if r["category"] == category)
+
+    category = max(votes, key=lambda name: (votes[name], max_severity(name)))
+    worst = max(
+        (result for result in accepted if result["category"] == category),
+        key=lambda result: result.get("severity") or 0
+    )
+    return {
+        "category": category,
+        "severity": worst.get("severity"),
+        "severity_level": worst.get("severity_level"),
+        "scale": worst.get("scale")
+    }
@@ -0,0 +1,122 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .metrics import BLOB_STORE_BYTES, BLOB_STORE_REJECTED
+import config
+
+
+class BlobStoreFullError(RuntimeError):
+    """Raised when admitting another image would exceed the blob store's memory cap"""
+
+
+class BlobNotFoundError(KeyError):
+    """Raised when a handle was never issued or its blob has already been released"""
+
+
+class ImageBlobStore:
+    """
+    Process-local store for the encoded images of in-flight classifications.
+
+    The graph state carries only the short handle returned by put(), so
+    LangGraph and pydantic copy a few bytes per node instead of a multi-MB
+    base64 string, and nodes that do not need the pixels never see them.
+    The store keeps a reference to the caller's (immutable) string rather
+    than a copy; get() returns that same object, and the data URL is only
+    built when the model message is.
+
+    Blobs live until release() (or the end of a hold() block), so every put
+    must be paired with a release. The total size of live blobs is capped
+    at max_bytes; a put that would exceed it fails with BlobStoreFullError
+    instead of letting image memory grow with the request rate.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        self._blobs: Dict[str, str] = {}
+        self._bytes = 0
+        self._peak_bytes = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls) -> "ImageBlobStore":
+        """Build a store from the settings in config.py"""
+        return cls(max_bytes=int(config.BLOB_STORE_MAX_MB * 1024 * 1024))
+
+    def put(self, data: str) -> str:
+        """Admit a base64 image and return its handle; raises BlobStoreFullError over the cap"""
+        size = len(data)
+        with self._lock:
+            if self.max_bytes and self._bytes + size > self.max_bytes:
+                self._counts["rejected"] = self._counts.get("rejected", 0) + 1
+                BLOB_STORE_REJECTED.inc()
+                raise BlobStoreFullError(
+                    f"Image memory budget exhausted ({self._bytes / 2**20:.1f} MB of "
+                    f"{self.max_bytes / 2**20:.1f} MB in use)"
+                )
+            handle = f"blob-{next(self._ids)}"
+            self._blobs[handle] = data
+            self._bytes += size
+            self._peak_bytes = max(self._peak_bytes, self._bytes)
+            self._counts["puts"] = self._counts.get("puts", 0) + 1
+        BLOB_STORE_BYTES.inc(size)
+        return handle
+
+    def get(self, handle: str) -> str:
+        """The base64 image behind a handle (the stored object itself, not a copy)"""
+        try:
+            return self._blobs[handle]
+        except KeyError:
+            raise BlobNotFoundError(f"Image blob {handle} is not in the store (already released?)")
+
+    def data_url(self, handle: str, media_type: str = "image/jpeg") -> str:
+        """The image as a data URL for a vision message; the only place the payload is copied"""
+        return f"data:{media_type};base64,{self.get(handle)}"
+
+    def release(self, handle: str) -> None:
+        """Drop a blob; releasing an unknown or already released handle is a no-op"""
+        with self._lock:
+            data = self._blobs.pop(handle, None)
+            if data is None:
+                return
+            self._bytes -= len(data)
+        BLOB_STORE_BYTES.dec(len(data))
+
+    @contextmanager
+    def hold(self, data: str) -> Iterator[str]:
+        """Keep `data` in the store for the duration of the block and yield its handle"""
+        handle = self.put(data)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        """Live blobs, bytes held against the cap and admission counters"""
+        with self._lock:
+            return {
+                "entries": len(self._blobs),
+                "bytes": self._bytes,
+                "peak_bytes": self._peak_bytes,
+                "max_bytes": self.max_bytes,
+                "puts": self._counts.get("puts", 0),
+                "rejected": self._counts.get("rejected", 0)
+            }
+
+
+_store: Optional[ImageBlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> ImageBlobStore:
+    """Return the process-wide blob store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ImageBlobStore.from_config()
+    return _store
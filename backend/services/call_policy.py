@@ -0,0 +1,318 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from .metrics import LLM_HEDGES, LLM_RETRIES
+from .rate_limiter import attempt_deadline
+import config
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the model call could succeed"""
+
+
+class AttemptTimeout(TimeoutError):
+    """One attempt outlived its per-attempt timeout; retryable while the deadline allows"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Transient failures worth another attempt: timeouts, connection errors,
+    429s and 5xx responses. Validation, parsing, auth and other 4xx errors
+    fail the same way every time and are never retried.
+    """
+    # Imported here so that DeadlineExceeded can be imported without loading the OpenAI SDK
+    import openai
+
+    if isinstance(error, (TimeoutError, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def is_timeout(error: BaseException) -> bool:
+    """An attempt that ran out of time, ours (AttemptTimeout) or the HTTP client's"""
+    import openai
+
+    return isinstance(error, (TimeoutError, httpx.TimeoutException, openai.APITimeoutError))
+
+
+class LLMCallPolicy:
+    """
+    Deadline-aware runner for model calls made by the graph nodes.
+
+    Every attempt is bounded by min(attempt_timeout, time left before the
+    request deadline). Transient errors are retried with jittered
+    exponential backoff while attempts and time remain. With hedging on, an
+    attempt still running after the observed latency percentile for its
+    node and model gets a duplicate request, and whichever answers first
+    wins; the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        attempt_timeout: float = 30.0,
+        max_attempts: int = 3,
+        backoff_seconds: float = 0.5,
+        hedging: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+        window: int = 256
+    ):
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.window = window
+
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        # Sync calls run on helper threads so a hung request can be abandoned at its timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="llm-call")
+
+    @classmethod
+    def from_config(cls) -> "LLMCallPolicy":
+        """Build a policy from the settings in config.py"""
+        return cls(
+            attempt_timeout=config.LLM_ATTEMPT_TIMEOUT_SECONDS,
+            max_attempts=config.LLM_MAX_ATTEMPTS,
+            backoff_seconds=config.LLM_RETRY_BACKOFF_SECONDS,
+            hedging=config.LLM_HEDGING_ENABLED,
+            hedge_percentile=config.LLM_HEDGE_PERCENTILE,
+            hedge_min_samples=config.LLM_HEDGE_MIN_SAMPLES
+        )
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _observe(self, key: Tuple[str, str], seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    @staticmethod
+    def _percentile(samples: List[float], q: float) -> float:
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+    def hedge_delay(self, node: str, model: str) -> Optional[float]:
+        """Seconds after which an attempt gets a hedge, or None until enough latencies are known"""
+        if not self.hedging:
+            return None
+        with self._lock:
+            samples = list(self._latencies.get((node, model), ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return self._percentile(samples, self.hedge_percentile)
+
+    def _attempt_timeout(self, deadline: Optional[float], node: str) -> float:
+        """Timeout for the next attempt, or DeadlineExceeded when no time is left"""
+        if deadline is None:
+            return self.attempt_timeout
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded(f"Deadline exceeded before {node} could call the model")
+        return min(self.attempt_timeout, remaining)
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: Optional[float], node: str) -> float:
+        """
+        Backoff before the next attempt; re-raises when the error or the budget rules out a retry.
+        A timeout with no attempts or time left is DeadlineExceeded, so it surfaces as a 504
+        rather than as the node's fallback verdict.
+        """
+        if not is_retryable(error):
+            raise error
+        if attempt >= self.max_attempts:
+            if is_timeout(error):
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(f"{node} timed out on all {attempt} attempts: {error}") from error
+            raise error
+        delay = random.uniform(0, self.backoff_seconds * 2 ** (attempt - 1))
+        if deadline is not None and time.time() + delay >= deadline:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded(f"Deadline exceeded after {attempt} attempts in {node}: {error}") from error
+        self._count("retries")
+        LLM_RETRIES.labels(node, type(error).__name__).inc()
+        return delay
+
+    def _record_hedge(self, node: str, outcome: str) -> None:
+        self._count(f"hedges_{outcome}")
+        LLM_HEDGES.labels(node, outcome).inc()
+
+    async def _aattempt(self, llm: "Runnable", messages: List[Any], timeout: float, node: str, model: str) -> Any:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        ends_at = started + timeout
+        # Tasks copy the context, so rate-limit waits inside the call stop with the attempt
+        with attempt_deadline(timeout):
+            primary = asyncio.ensure_future(llm.ainvoke(messages))
+        pending = {primary}
+        try:
+            hedge_delay = self.hedge_delay(node, model)
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    with attempt_deadline(ends_at - loop.time()):
+                        pending.add(asyncio.ensure_future(llm.ainvoke(messages)))
+                    self._record_hedge(node, "fired")
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, ends_at - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise AttemptTimeout(f"{node} attempt timed out after {timeout:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._record_hedge(node, "won")
+                        self._observe((node, model), loop.time() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(
+        self,
+        llm: "Runnable",
+        messages: List[Any],
+        node: str,
+        model: str,
+        deadline: Optional[float] = None
+    ) -> Any:
+        """Call llm.ainvoke under the policy; raises DeadlineExceeded or the last non-retryable error"""
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._attempt_timeout(deadline, node)
+            self._count("attempts")
+            try:
+                return await self._aattempt(llm, messages, timeout, node, model)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, node)
+            await asyncio.sleep(delay)
+
+    def _attempt(self, llm: "Runnable", messages: List[Any], timeout: float, node: str, model: str) -> Any:
+        started = time.monotonic()
+        ends_at = started + timeout
+
+        def submit() -> concurrent.futures.Future:
+            # Carry the LangChain run context (callbacks, node metadata) onto the helper thread,
+            # along with the attempt deadline, so an abandoned call stops waiting for a rate-limit slot
+            with attempt_deadline(ends_at - time.monotonic()):
+                return self._executor.submit(contextvars.copy_context().run, llm.invoke, messages)
+
+        primary = submit()
+        pending = {primary}
+        try:
+            hedge_delay = self.hedge_delay(node, model)
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = concurrent.futures.wait(pending, timeout=hedge_delay)
+                if not done:
+                    pending.add(submit())
+                    self._record_hedge(node, "fired")
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=max(0.0, ends_at - time.monotonic()),
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                if not done:
+                    raise AttemptTimeout(f"{node} attempt timed out after {timeout:.1f}s")
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._record_hedge(node, "won")
+                        self._observe((node, model), time.monotonic() - started)
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            # Running threads cannot be interrupted; their results are simply dropped
+            for future in pending:
+                future.cancel()
+
+    def invoke(
+        self,
+        llm: "Runnable",
+        messages: List[Any],
+        node: str,
+        model: str,
+        deadline: Optional[float] = None
+    ) -> Any:
+        """Blocking counterpart of ainvoke"""
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._attempt_timeout(deadline, node)
+            self._count("attempts")
+            try:
+                return self._attempt(llm, messages, timeout, node, model)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline, node)
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Attempt, retry and hedge counters plus observed latency percentiles per node and model"""
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = {key: list(samples) for key, samples in self._latencies.items()}
+
+        return {
+            "attempt_timeout_seconds": self.attempt_timeout,
+            "max_attempts": self.max_attempts,
+            "hedging": self.hedging,
+            "hedge_percentile": self.hedge_percentile,
+            "attempts": counts.get("attempts", 0),
+            "retries": counts.get("retries", 0),
+            "deadline_exceeded": counts.get("deadline_exceeded", 0),
+            "hedges_fired": counts.get("hedges_fired", 0),
+            "hedges_won": counts.get("hedges_won", 0),
+            "latency_seconds": [
+                {
+                    "node": node,
+                    "model": model,
+                    "samples": len(samples),
+                    "p50": round(self._percentile(samples, 50), 3),
+                    "p95": round(self._percentile(samples, 95), 3),
+                    "p99": round(self._percentile(samples, 99), 3),
+                    "hedge_delay": self.hedge_delay(node, model)
+                }
+                for (node, model), samples in latencies.items()
+                if samples
+            ]
+        }
+
+
+_policy: Optional[LLMCallPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_call_policy() -> LLMCallPolicy:
+    """Return the process-wide call policy, creating it on first use"""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = LLMCallPolicy.from_config()
+    return _policy
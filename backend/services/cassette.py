@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .rate_limiter import estimate_tokens
+import config
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+
+
+def _summarize_images(value: Any) -> Any:
+    """The request with base64 data URLs replaced by their digest and size, for reading cassettes"""
+    if isinstance(value, dict):
+        return {key: _summarize_images(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_summarize_images(item) for item in value]
+    if isinstance(value, str) and value.startswith("data:") and "base64," in value:
+        payload = value.partition("base64,")[2]
+        return {
+            "sha256": hashlib.sha256(payload.encode()).hexdigest(),
+            "bytes": len(payload) * 3 // 4
+        }
+    return value
+
+
+def _structured_output(body: Dict[str, Any]) -> Any:
+    """The parsed structured output of a chat completion (JSON content or tool call arguments), if any"""
+    try:
+        message = body["choices"][0]["message"]
+        arguments = message.get("tool_calls") or []
+        text = arguments[0]["function"]["arguments"] if arguments else message.get("content")
+        return json.loads(text)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+class Cassette:
+    """
+    OpenAI responses recorded to files and served back, keyed by a hash of the request.
+
+    The key covers the method, path and canonical JSON body, so it changes
+    with the model, temperature, prompts, output schema and the exact image
+    sent, and stays the same across hosts (a cassette recorded against the
+    benchmark fake replays against any base URL). Each entry is one JSON
+    file holding a readable copy of the request, with images reduced to
+    their digest, the raw response body and its structured output.
+
+    Modes:
+    - "record": every request goes to the API and successful responses are saved
+    - "replay": requests are answered from the files only; an unknown request
+      gets a 404, which the call policy does not retry
+    - "auto": replay known requests and record the rest
+    """
+
+    def __init__(self, directory: str, mode: str = "replay"):
+        if mode not in CASSETTE_MODES or mode == "off":
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        os.makedirs(directory, exist_ok=True)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "recorded": 0}
+
+    @classmethod
+    def from_config(cls) -> Optional["Cassette"]:
+        """The cassette configured in config.py, or None when LLM_CASSETTE_MODE is "off" """
+        if config.LLM_CASSETTE_MODE == "off":
+            return None
+        return cls(config.LLM_CASSETTE_DIR, config.LLM_CASSETTE_MODE)
+
+    @staticmethod
+    def request_key(request: httpx.Request) -> str:
+        """Hex digest of the method, path and canonical body"""
+        body = request.content
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+        except ValueError:
+            pass
+        digest = hashlib.sha256(f"{request.method} {request.url.path}\n".encode())
+        digest.update(body)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """The recorded entry for a request key, counting a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            try:
+                with open(self._path(key)) as file:
+                    entry = json.load(file)
+            except (OSError, ValueError):
+                entry = None
+        with self._lock:
+            if entry is not None:
+                self._entries[key] = entry
+            self._counts["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def store(self, key: str, request: httpx.Request, response: httpx.Response) -> None:
+        """Save a successful response, written to a temporary file and renamed into place"""
+        try:
+            request_body: Any = json.loads(request.content)
+        except ValueError:
+            request_body = base64.b64encode(request.content).decode()
+        try:
+            response_body = response.json()
+        except ValueError:
+            return
+        entry = {
+            "key": key,
+            "request": {
+                "method": request.method,
+                "path": request.url.path,
+                "body": _summarize_images(request_body)
+            },
+            "response": {
+                "status_code": response.status_code,
+                "body": response_body
+            },
+            "structured": _structured_output(response_body)
+        }
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as file:
+            json.dump(entry, file, indent=1, sort_keys=True)
+        os.replace(temporary, self._path(key))
+        with self._lock:
+            self._entries[key] = entry
+            self._counts["recorded"] += 1
+
+    @staticmethod
+    def replayed(entry: Dict[str, Any], request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            entry["response"]["status_code"],
+            headers={"content-type": "application/json", "x-cassette-key": entry["key"]},
+            content=json.dumps(entry["response"]["body"]).encode(),
+            request=request
+        )
+
+    def missing(self, key: str, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            404,
+            headers={"content-type": "application/json"},
+            content=json.dumps({"error": {
+                "message": f"No cassette entry {key} in {self.directory}",
+                "type": "cassette_miss",
+                "code": "cassette_miss"
+            }}).encode(),
+            request=request
+        )
+
+    def should_record(self, request: httpx.Request, response: httpx.Response) -> bool:
+        """Only complete, successful JSON responses are saved; streamed ones pass through"""
+        return response.status_code < 400 and not estimate_tokens(request.content)[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            loaded = len(self._entries)
+        return {"mode": self.mode, "directory": self.directory, "entries_loaded": loaded, **counts}
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport answering from a Cassette and recording what it passes on"""
+
+    def __init__(self, wrapped: httpx.BaseTransport, cassette: Cassette):
+        self.wrapped = wrapped
+        self.cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = self.cassette.request_key(request)
+        if self.cassette.mode != "record":
+            entry = self.cassette.lookup(key)
+            if entry is not None:
+                return self.cassette.replayed(entry, request)
+            if self.cassette.mode == "replay":
+                return self.cassette.missing(key, request)
+        response = self.wrapped.handle_request(request)
+        if self.cassette.should_record(request, response):
+            response.read()
+            self.cassette.store(key, request, response)
+        return response
+
+    def close(self) -> None:
+        self.wrapped.close()
+
+
+class CassetteAsyncTransport(httpx.AsyncBaseTransport):
+    """Asynchronous counterpart of CassetteTransport"""
+
+    def __init__(self, wrapped: httpx.AsyncBaseTransport, cassette: Cassette):
+        self.wrapped = wrapped
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = self.cassette.request_key(request)
+        if self.cassette.mode != "record":
+            entry = self.cassette.lookup(key)
+            if entry is not None:
+                return self.cassette.replayed(entry, request)
+            if self.cassette.mode == "replay":
+                return self.cassette.missing(key, request)
+        response = await self.wrapped.handle_async_request(request)
+        if self.cassette.should_record(request, response):
+            await response.aread()
+            await asyncio.to_thread(self.cassette.store, key, request, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self.wrapped.aclose()
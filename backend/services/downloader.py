@@ -0,0 +1,265 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+from .preprocessing import PreparedImage, prepare_image
+from .metrics import DOWNLOAD_BYTES, DOWNLOAD_CACHE, DOWNLOAD_REJECTED, DOWNLOAD_SECONDS
+import config
+
+
+# Bytes needed to recognise every supported container from its signature
+SNIFF_BYTES = 32
+
+
+class ImageDownloadError(Exception):
+    """Raised when an image URL cannot be fetched or does not hold an image"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Identify an image container from its leading magic bytes, without decoding it"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if head[:2] == b"BM":
+        return "bmp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "avif"
+    return None
+
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+@dataclass
+class _CacheEntry:
+    """A prepared image and the validators needed to revalidate it"""
+
+    image: PreparedImage
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh_until: float
+    size: int
+
+
+class ImageDownloader:
+    """
+    Fetches image URLs into model-ready PreparedImages.
+
+    Downloads stream over the shared, pooled httpx client (keep-alive
+    connections are kept per host), abort as soon as the body is known to
+    exceed max_bytes, and are rejected from their first bytes when they are
+    not a supported image container, before any decode.
+
+    Prepared results are kept in a small LRU keyed by URL and preprocessing
+    profile, together with the response's ETag/Last-Modified. Within the
+    response's max-age (capped by max_fresh_seconds) a URL is served without
+    a request; afterwards it is revalidated with a conditional GET, so a 304
+    costs neither the transfer nor the re-decode.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        max_bytes: int = 20 * 1024 * 1024,
+        cache_max_bytes: int = 64 * 1024 * 1024,
+        max_fresh_seconds: float = 3600.0,
+        prepare: Callable[[bytes], PreparedImage] = prepare_image
+    ):
+        self.client = client
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.max_fresh_seconds = max_fresh_seconds
+        self.prepare = prepare
+
+        self._cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, client: httpx.AsyncClient) -> "ImageDownloader":
+        """Build a downloader over `client` from the settings in config.py"""
+        return cls(
+            client,
+            max_bytes=int(config.DOWNLOAD_MAX_MB * 1024 * 1024),
+            cache_max_bytes=int(config.DOWNLOAD_CACHE_MAX_MB * 1024 * 1024) if config.DOWNLOAD_CACHE_ENABLED else 0,
+            max_fresh_seconds=config.DOWNLOAD_CACHE_MAX_FRESH_SECONDS
+        )
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _reject(self, reason: str, message: str, status_code: int = 400) -> ImageDownloadError:
+        self._count(f"rejected:{reason}")
+        DOWNLOAD_REJECTED.labels(reason).inc()
+        return ImageDownloadError(message, status_code)
+
+    @staticmethod
+    def _cache_key(url: str) -> str:
+        return f"{config.IMAGE_PROFILE}:{url}"
+
+    def _lookup(self, key: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _store(self, key: str, entry: _CacheEntry) -> None:
+        if entry.size > self.cache_max_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_bytes -= previous.size
+            self._cache[key] = entry
+            self._cache_bytes += entry.size
+            while self._cache_bytes > self.cache_max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.size
+
+    def _freshness(self, headers: httpx.Headers) -> Optional[float]:
+        """Seconds the response may be reused without revalidation; None when it must not be cached"""
+        cache_control = headers.get("cache-control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            return 0.0
+        match = _MAX_AGE.search(cache_control)
+        if match:
+            return min(float(match.group(1)), self.max_fresh_seconds)
+        return 0.0
+
+    async def _read_capped(self, response: httpx.Response) -> bytes:
+        """Read the body in chunks, failing fast on oversized or non-image content"""
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            raise self._reject("too_large", f"Image exceeds the {self.max_bytes // (1024 * 1024)} MB download limit")
+
+        chunks = []
+        received = 0
+        sniffed = False
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            DOWNLOAD_BYTES.inc(len(chunk))
+            if received > self.max_bytes:
+                raise self._reject("too_large", f"Image exceeds the {self.max_bytes // (1024 * 1024)} MB download limit")
+            if not sniffed and received >= SNIFF_BYTES:
+                sniffed = True
+                if sniff_image_format(b"".join(chunks)[:SNIFF_BYTES]) is None:
+                    content_type = response.headers.get("content-type", "").lower()
+                    raise self._reject(
+                        "not_image", f"URL does not contain a valid image. Content-Type: {content_type}"
+                    )
+
+        content = b"".join(chunks)
+        if not content:
+            raise self._reject("empty", "Downloaded content is empty")
+        if not sniffed and sniff_image_format(content) is None:
+            content_type = response.headers.get("content-type", "").lower()
+            raise self._reject("not_image", f"URL does not contain a valid image. Content-Type: {content_type}")
+        return content
+
+    async def fetch(self, url: str, deadline: Optional[float] = None) -> PreparedImage:
+        """
+        Download (or reuse) the image at `url` and prepare it for the model.
+
+        Args:
+            url: Image URL
+            deadline: Epoch seconds the whole download must finish by; the
+                client's per-phase timeouts still apply
+
+        Raises:
+            ImageDownloadError: fetch failed, too large, empty or not an image
+            ImagePreprocessingError: the bytes looked like an image but could not be decoded
+        """
+        key = self._cache_key(url)
+        entry = self._lookup(key) if self.cache_max_bytes else None
+        if entry is not None and time.time() < entry.fresh_until:
+            self._count("cache:fresh")
+            DOWNLOAD_CACHE.labels("fresh").inc()
+            return entry.image
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            with DOWNLOAD_SECONDS.time():
+                async with asyncio.timeout(timeout):
+                    async with self.client.stream("GET", url, headers=headers) as response:
+                        if response.status_code == 304 and entry is not None:
+                            self._count("cache:not_modified")
+                            DOWNLOAD_CACHE.labels("not_modified").inc()
+                            freshness = self._freshness(response.headers)
+                            entry.fresh_until = time.time() + (freshness or 0.0)
+                            return entry.image
+                        response.raise_for_status()
+                        content = await self._read_capped(response)
+                        response_headers = response.headers
+        except TimeoutError:
+            # Only the request deadline bounds the whole download, so this is the caller's timeout
+            raise self._reject("timeout", "Image download did not finish within the request deadline", 504)
+        except httpx.HTTPError as e:
+            raise self._reject("http_error", f"Failed to download image: {str(e)}")
+
+        outcome = "changed" if entry is not None else "miss"
+        self._count(f"cache:{outcome}")
+        DOWNLOAD_CACHE.labels(outcome).inc()
+
+        # Decode and downscale off the event loop
+        image = await asyncio.to_thread(self.prepare, content)
+
+        freshness = self._freshness(response_headers)
+        etag = response_headers.get("etag")
+        last_modified = response_headers.get("last-modified")
+        if self.cache_max_bytes and freshness is not None and (etag or last_modified or freshness > 0):
+            self._store(key, _CacheEntry(
+                image=image,
+                etag=etag,
+                last_modified=last_modified,
+                fresh_until=time.time() + freshness,
+                size=len(image.base64)
+            ))
+        return image
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache outcomes, rejection reasons and cache occupancy"""
+        with self._lock:
+            counts = dict(self._counts)
+            entries, cache_bytes = len(self._cache), self._cache_bytes
+
+        return {
+            "max_download_bytes": self.max_bytes,
+            "cache": {
+                "enabled": self.cache_max_bytes > 0,
+                "entries": entries,
+                "bytes": cache_bytes,
+                "max_bytes": self.cache_max_bytes,
+                **{key.split(":", 1)[1]: value for key, value in counts.items() if key.startswith("cache:")}
+            },
+            "rejected": {key.split(":", 1)[1]: value for key, value in counts.items() if key.startswith("rejected:")}
+        }
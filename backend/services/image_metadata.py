@@ -0,0 +1,129 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Tuple
+
+from PIL import ExifTags, Image
+
+# EXIF orientation values and the transpose that turns the stored pixels upright
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Capture times further ahead than this are clock errors, not photos from the future
+MAX_CLOCK_SKEW_SECONDS = 86400
+
+
+@dataclass(frozen=True)
+class ImageMetadata:
+    """Where, when and which way up a photo was taken, as far as its EXIF says"""
+
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    captured_at: Optional[float] = None
+    orientation: int = 1
+
+    @property
+    def location(self) -> Optional[Tuple[float, float]]:
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+    @property
+    def rotated(self) -> bool:
+        """Whether the stored pixels must be transposed to display upright"""
+        return self.orientation in ORIENTATION_TRANSPOSE
+
+
+def _degrees(value: Any, ref: Any, negative: str) -> Optional[float]:
+    """Degrees/minutes/seconds rationals plus an N/S or E/W reference to signed decimal degrees"""
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    decimal = degrees + minutes / 60 + seconds / 3600
+    if not math.isfinite(decimal):
+        return None
+    return -decimal if str(ref).upper().startswith(negative) else decimal
+
+
+def _gps_location(gps: dict) -> Tuple[Optional[float], Optional[float]]:
+    latitude = _degrees(gps.get(ExifTags.GPS.GPSLatitude), gps.get(ExifTags.GPS.GPSLatitudeRef), "S")
+    longitude = _degrees(gps.get(ExifTags.GPS.GPSLongitude), gps.get(ExifTags.GPS.GPSLongitudeRef), "W")
+    # Cameras without a fix write zeros; (0, 0) is open ocean, not a report
+    if latitude is None or longitude is None or (latitude == 0 and longitude == 0):
+        return None, None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None, None
+    return latitude, longitude
+
+
+def _gps_time(gps: dict) -> Optional[float]:
+    """GPS date and time stamp, which is always UTC"""
+    date, clock = gps.get(ExifTags.GPS.GPSDateStamp), gps.get(ExifTags.GPS.GPSTimeStamp)
+    if not date or not clock:
+        return None
+    try:
+        hours, minutes, seconds = (float(part) for part in clock)
+        day = datetime.strptime(str(date).strip(), "%Y:%m:%d").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return (day + timedelta(hours=hours, minutes=minutes, seconds=seconds)).timestamp()
+
+
+def _original_time(exif_ifd: dict) -> Optional[float]:
+    """DateTimeOriginal with its OffsetTimeOriginal; without an offset the time is taken as UTC"""
+    value = exif_ifd.get(ExifTags.Base.DateTimeOriginal)
+    if not value:
+        return None
+    offset = str(exif_ifd.get(ExifTags.Base.OffsetTimeOriginal) or "+00:00").strip()
+    try:
+        return datetime.strptime(f"{str(value).strip()} {offset}", "%Y:%m:%d %H:%M:%S %z").timestamp()
+    except ValueError:
+        return None
+
+
+def read_metadata(image: Image.Image, now: Optional[float] = None) -> ImageMetadata:
+    """
+    Read GPS position, capture time and orientation from an opened image.
+
+    Only the EXIF block parsed with the header is used, so this costs no pixel
+    decode and can run before load(). Missing or malformed tags are left
+    unset rather than failing the image.
+    """
+    try:
+        exif = image.getexif()
+    except Exception:
+        return ImageMetadata()
+    if not exif:
+        return ImageMetadata()
+
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    try:
+        gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+        exif_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    except Exception:
+        gps, exif_ifd = {}, {}
+
+    latitude, longitude = _gps_location(gps)
+    captured_at = _gps_time(gps) or _original_time(exif_ifd)
+    if captured_at is not None and now is not None and captured_at > now + MAX_CLOCK_SKEW_SECONDS:
+        captured_at = None
+    return ImageMetadata(
+        latitude=latitude,
+        longitude=longitude,
+        captured_at=captured_at,
+        orientation=orientation if orientation in ORIENTATION_TRANSPOSE else 1
+    )
+
+
+def apply_orientation(image: Image.Image, orientation: int) -> Image.Image:
+    """Transpose pixels stored sideways or mirrored so they display upright"""
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return image.transpose(method) if method is not None else image
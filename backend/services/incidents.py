@@ -0,0 +1,293 @@
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.schemas import ClassificationResult
+import config
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+# Report ids remembered per incident (its count keeps growing past this)
+MAX_REPORT_IDS = 50
+
+
+def haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+@dataclass
+class Incident:
+    """Reports of one category within the radius and time window of each other"""
+
+    id: str
+    category: str
+    lat: float
+    lng: float
+    first_seen: float
+    last_seen: float
+    reports: int = 0
+    report_ids: List[str] = field(default_factory=list)
+    # Latest confident classification of any of its photos, and when it was made
+    result: Optional[Dict[str, Any]] = None
+    confidence: Optional[float] = None
+    classified_at: Optional[float] = None
+    updated_at: float = 0.0
+
+    def public_view(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "category": self.category,
+            "lat": round(self.lat, 6),
+            "lng": round(self.lng, 6),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "reports": self.reports,
+            "report_ids": list(self.report_ids),
+            "result": self.result,
+            "confidence": self.confidence,
+            "classified_at": self.classified_at
+        }
+
+
+class IncidentIndex:
+    """
+    Incremental spatio-temporal clustering of reports into incidents.
+
+    A report joins the nearest incident of the same category whose centroid
+    is within radius_meters and whose reports span its capture time give or
+    take window_seconds; otherwise it starts a new incident. Incidents sit
+    in a grid of cells one radius tall (and one radius wide at the cell
+    row's latitude), so a lookup only compares against the incidents of the
+    3x3 cells around the point. Centroids are running means and move cells
+    as they drift.
+
+    An incident remembers its latest confident classification. A new photo
+    of it can then be answered from that result, or confirmed by a cheaper
+    model, instead of running the full pipeline (see reusable()).
+    Incidents that saw no report for window_seconds are dropped, oldest first,
+    as are the least recently updated ones beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        radius_meters: float = 75.0,
+        window_seconds: float = 3 * 86400,
+        max_entries: int = 100000,
+        reuse_confidence: float = 0.85,
+        reuse_seconds: float = 86400
+    ):
+        self.radius_meters = radius_meters
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.reuse_confidence = reuse_confidence
+        self.reuse_seconds = reuse_seconds
+
+        self._cell_degrees = radius_meters / METERS_PER_DEGREE
+        self._incidents: "OrderedDict[str, Incident]" = OrderedDict()
+        self._cells: Dict[Tuple[int, int], Dict[str, Incident]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls) -> "IncidentIndex":
+        """Build an index from the settings in config.py"""
+        return cls(
+            radius_meters=config.INCIDENT_RADIUS_METERS,
+            window_seconds=config.INCIDENT_WINDOW_SECONDS,
+            max_entries=config.INCIDENT_MAX_ENTRIES,
+            reuse_confidence=config.INCIDENT_REUSE_CONFIDENCE,
+            reuse_seconds=config.INCIDENT_REUSE_SECONDS
+        )
+
+    def __len__(self) -> int:
+        return len(self._incidents)
+
+    def _count(self, key: str) -> None:
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _row_width(self, row: int) -> float:
+        """Cell width in degrees of longitude for a cell row, so cells are about one radius wide"""
+        latitude = min(abs((row + 0.5) * self._cell_degrees), 89.0)
+        return self._cell_degrees / math.cos(math.radians(latitude))
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = math.floor(lat / self._cell_degrees)
+        return row, math.floor(lng / self._row_width(row))
+
+    def _nearest(self, lat: float, lng: float, captured_at: float, category: str) -> Optional[Incident]:
+        row = math.floor(lat / self._cell_degrees)
+        best, best_distance = None, self.radius_meters
+        for candidate_row in (row - 1, row, row + 1):
+            column = math.floor(lng / self._row_width(candidate_row))
+            for candidate_column in (column - 1, column, column + 1):
+                for incident in self._cells.get((candidate_row, candidate_column), {}).values():
+                    if incident.category != category:
+                        continue
+                    if not incident.first_seen - self.window_seconds <= captured_at <= incident.last_seen + self.window_seconds:
+                        continue
+                    distance = haversine_meters(lat, lng, incident.lat, incident.lng)
+                    if distance <= best_distance:
+                        best, best_distance = incident, distance
+        return best
+
+    def _expire(self, now: float) -> None:
+        # Updated incidents move to the end, so the stale ones are at the front
+        while self._incidents:
+            incident = next(iter(self._incidents.values()))
+            if incident.updated_at >= now - self.window_seconds and len(self._incidents) <= self.max_entries:
+                break
+            self._drop(incident)
+            self._count("expired")
+
+    def _drop(self, incident: Incident) -> None:
+        self._incidents.pop(incident.id, None)
+        key = self._cell(incident.lat, incident.lng)
+        cell = self._cells.get(key)
+        if cell is not None:
+            cell.pop(incident.id, None)
+            if not cell:
+                del self._cells[key]
+
+    def match(
+        self,
+        lat: float,
+        lng: float,
+        category: str,
+        captured_at: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """The incident a report at this place and time would join, without adding it"""
+        now = time.time()
+        with self._lock:
+            incident = self._nearest(lat, lng, captured_at or now, category)
+            return incident.public_view() if incident is not None else None
+
+    def reusable(
+        self,
+        lat: float,
+        lng: float,
+        category: str,
+        captured_at: Optional[float] = None
+    ) -> Optional[Tuple[str, ClassificationResult]]:
+        """
+        The incident a report would join and its classification, when that was
+        made within reuse_seconds with at least reuse_confidence; else None.
+        """
+        now = time.time()
+        with self._lock:
+            incident = self._nearest(lat, lng, captured_at or now, category)
+            if (
+                incident is None
+                or incident.result is None
+                or incident.confidence is None
+                or incident.confidence < self.reuse_confidence
+                or now - incident.classified_at > self.reuse_seconds
+            ):
+                self._count("reuse_misses")
+                return None
+            self._count("reuse_hits")
+            return incident.id, ClassificationResult(
+                **incident.result,
+                confidence=incident.confidence,
+                reasoning=f"Confirmed by incident {incident.id} ({incident.reports} reports nearby)."
+            )
+
+    def add(
+        self,
+        lat: float,
+        lng: float,
+        category: str,
+        captured_at: Optional[float] = None,
+        report_id: Optional[str] = None,
+        classification: Optional[ClassificationResult] = None
+    ) -> Dict[str, Any]:
+        """
+        Attach a report to its incident, or start a new one, and return the incident.
+
+        A classification at or above reuse_confidence becomes the incident's
+        reusable result.
+        """
+        now = time.time()
+        captured_at = captured_at or now
+        with self._lock:
+            self._expire(now)
+            incident = self._nearest(lat, lng, captured_at, category)
+            if incident is None:
+                incident = Incident(
+                    id=f"incident-{next(self._ids)}",
+                    category=category,
+                    lat=lat,
+                    lng=lng,
+                    first_seen=captured_at,
+                    last_seen=captured_at
+                )
+                self._cells.setdefault(self._cell(lat, lng), {})[incident.id] = incident
+                self._count("created")
+            else:
+                # Running-mean centroid; re-file the incident if it drifted into another cell
+                old_cell = self._cell(incident.lat, incident.lng)
+                incident.lat += (lat - incident.lat) / (incident.reports + 1)
+                incident.lng += (lng - incident.lng) / (incident.reports + 1)
+                new_cell = self._cell(incident.lat, incident.lng)
+                if new_cell != old_cell:
+                    self._cells[old_cell].pop(incident.id, None)
+                    if not self._cells[old_cell]:
+                        del self._cells[old_cell]
+                    self._cells.setdefault(new_cell, {})[incident.id] = incident
+                incident.first_seen = min(incident.first_seen, captured_at)
+                incident.last_seen = max(incident.last_seen, captured_at)
+                self._count("attached")
+
+            incident.reports += 1
+            if report_id and report_id not in incident.report_ids:
+                incident.report_ids = (incident.report_ids + [report_id])[-MAX_REPORT_IDS:]
+            if classification is not None and classification.confidence >= self.reuse_confidence:
+                incident.result = {
+                    "category": classification.category,
+                    "severity": classification.severity,
+                    "severity_level": classification.severity_level,
+                    "scale": classification.scale
+                }
+                incident.confidence = classification.confidence
+                incident.classified_at = now
+            incident.updated_at = now
+            self._incidents[incident.id] = incident
+            self._incidents.move_to_end(incident.id)
+            return incident.public_view()
+
+    def get(self, incident_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            incident = self._incidents.get(incident_id)
+            return incident.public_view() if incident is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Live incidents, clustering settings and attach/reuse counters"""
+        with self._lock:
+            counts = dict(self._counts)
+            live = len(self._incidents)
+            multi = sum(1 for incident in self._incidents.values() if incident.reports > 1)
+        return {
+            "incidents": live,
+            "incidents_with_several_reports": multi,
+            "max_entries": self.max_entries,
+            "radius_meters": self.radius_meters,
+            "window_seconds": self.window_seconds,
+            "reuse_confidence": self.reuse_confidence,
+            "reuse_seconds": self.reuse_seconds,
+            "created": counts.get("created", 0),
+            "attached": counts.get("attached", 0),
+            "expired": counts.get("expired", 0),
+            "reuse_hits": counts.get("reuse_hits", 0),
+            "reuse_misses": counts.get("reuse_misses", 0)
+        }
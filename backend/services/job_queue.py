@@ -0,0 +1,366 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+
+import config
+
+# How often a long-poll re-reads the store, for jobs finished by another process
+LONG_POLL_INTERVAL = 1.0
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at its maximum depth"""
+
+
+class JobStore:
+    """
+    SQLite store for classification jobs and their results.
+
+    The database runs in WAL mode so status reads never wait on the worker
+    writing a result. Jobs that were queued or running when the process
+    stopped are returned by pending() and picked up again on restart.
+    Several processes may share one database: a worker only runs a job
+    once claim() has atomically moved it to running.
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS classification_jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "result TEXT, error TEXT, status_code INTEGER, callback_url TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS classification_jobs_status "
+            "ON classification_jobs (status, created_at)"
+        )
+        self._db.commit()
+
+    def _write(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            self._db.commit()
+        return cursor.rowcount
+
+    def insert(self, job_id: str, payload: Dict[str, Any], callback_url: Optional[str], created_at: float) -> None:
+        self._write(
+            "INSERT INTO classification_jobs (id, status, payload, callback_url, created_at) "
+            "VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(payload), callback_url, created_at)
+        )
+
+    def claim(self, job_id: str, started_at: float, stale_before: float) -> bool:
+        """
+        Move a job to running if it is queued, or running since before stale_before
+        (its worker presumed dead); False when another worker owns or finished it
+        """
+        return self._write(
+            "UPDATE classification_jobs SET status = 'running', started_at = ? "
+            "WHERE id = ? AND (status = 'queued' OR (status = 'running' AND started_at < ?))",
+            (started_at, job_id, stale_before)
+        ) == 1
+
+    def mark_finished(
+        self,
+        job_id: str,
+        result: Optional[Dict[str, Any]],
+        error: Optional[str],
+        status_code: Optional[int],
+        finished_at: float
+    ) -> None:
+        self._write(
+            "UPDATE classification_jobs SET status = ?, result = ?, error = ?, status_code = ?, "
+            "finished_at = ? WHERE id = ?",
+            (
+                "failed" if error else "succeeded",
+                json.dumps(result) if result is not None else None,
+                error,
+                status_code,
+                finished_at,
+                job_id
+            )
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, payload, result, error, status_code, callback_url, "
+                "created_at, started_at, finished_at FROM classification_jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job_id, status, payload, result, error, status_code, callback_url, created_at, started_at, finished_at = row
+        return {
+            "id": job_id,
+            "status": status,
+            "payload": json.loads(payload),
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "status_code": status_code,
+            "callback_url": callback_url,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at
+        }
+
+    def pending(self) -> list:
+        """Jobs left queued or running by a previous process, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM classification_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_finished(self, older_than: float) -> int:
+        """Drop finished jobs older than the cutoff and return how many were removed"""
+        return self._write(
+            "DELETE FROM classification_jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+            (older_than,)
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue with a pool of async workers.
+
+    Submitting only records the job and returns its id; the workers run the
+    handler with at most `workers` jobs in flight, so an upload spike grows
+    the queue instead of opening hundreds of concurrent model calls. Results
+    land in the JobStore, waiters are woken for long-polling and an optional
+    callback URL receives the finished job.
+
+    Every process sharing the store queues the jobs it finds pending on
+    start, but only the one whose claim succeeds runs each of them. A job
+    left running longer than lease_seconds is taken to belong to a dead
+    process and may be claimed again.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        store: Optional[JobStore] = None,
+        workers: int = 4,
+        max_depth: int = 1000,
+        retention_seconds: float = 7 * 86400,
+        lease_seconds: float = 600,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        self.handler = handler
+        self.store = store or JobStore()
+        self.workers = workers
+        self.max_depth = max_depth
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.http_client = http_client
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._waiters: Dict[str, asyncio.Event] = {}
+        self._running = 0
+
+        # Recent timings for queue wait and handler run time percentiles
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+        self._run_times: Deque[float] = deque(maxlen=1000)
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.claims_lost = 0
+        self.callbacks_sent = 0
+        self.callbacks_failed = 0
+
+    @classmethod
+    def from_config(
+        cls,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        http_client: Optional[httpx.AsyncClient] = None
+    ) -> "JobQueue":
+        """Build a queue from the settings in config.py"""
+        return cls(
+            handler=handler,
+            store=JobStore(config.JOB_DB_PATH or ":memory:"),
+            workers=config.JOB_WORKERS,
+            max_depth=config.JOB_QUEUE_MAX_DEPTH,
+            retention_seconds=config.JOB_RETENTION_SECONDS,
+            # A job's deadline bounds its run, so one running well past it has lost its worker
+            lease_seconds=config.JOB_TIMEOUT_SECONDS + 60,
+            http_client=http_client
+        )
+
+    async def start(self) -> None:
+        """Start the workers and queue the jobs a restart interrupted (or other processes have yet to claim)"""
+        self._queue = asyncio.Queue()
+        await asyncio.to_thread(self.store.purge_finished, time.time() - self.retention_seconds)
+        for job_id in await asyncio.to_thread(self.store.pending):
+            self._queue.put_nowait(job_id)
+            self.recovered += 1
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; unfinished jobs stay queued in the store for the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    async def submit(self, payload: Dict[str, Any], callback_url: Optional[str] = None) -> str:
+        """Record a job and queue it, returning its id without waiting for the result"""
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started")
+        if self._queue.qsize() >= self.max_depth:
+            self.rejected += 1
+            raise JobQueueFullError(f"Job queue is full ({self.max_depth} jobs waiting)")
+
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.insert, job_id, payload, callback_url, time.time())
+        self._queue.put_nowait(job_id)
+        self.submitted += 1
+        return job_id
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a job, optionally long-polling until it finishes.
+
+        Args:
+            job_id: Id returned by submit()
+            wait: Seconds to wait for an unfinished job before returning its current state
+        """
+        if wait <= 0:
+            return await asyncio.to_thread(self.store.get, job_id)
+
+        # Register before reading, so a completion between the read and the wait still wakes us
+        event = self._waiters.setdefault(job_id, asyncio.Event())
+        loop = asyncio.get_running_loop()
+        give_up = loop.time() + wait
+        job = await asyncio.to_thread(self.store.get, job_id)
+        while job is not None and job["status"] not in ("succeeded", "failed"):
+            remaining = give_up - loop.time()
+            if remaining <= 0:
+                return job
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(remaining, LONG_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+            job = await asyncio.to_thread(self.store.get, job_id)
+
+        # Finished (possibly by another process) or unknown: release everyone waiting on it here
+        if self._waiters.get(job_id) is event:
+            del self._waiters[job_id]
+        event.set()
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        started_at = time.time()
+        claimed = await asyncio.to_thread(self.store.claim, job_id, started_at, started_at - self.lease_seconds)
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return
+        if not claimed:
+            self.claims_lost += 1
+            if job["status"] == "running":
+                # Owned by another process: try again once its lease runs out, in case that process died
+                asyncio.get_running_loop().call_later(
+                    job["started_at"] + self.lease_seconds - started_at, self._queue.put_nowait, job_id
+                )
+            return
+
+        self._wait_times.append(started_at - job["created_at"])
+
+        result, error, status_code = None, None, None
+        self._running += 1
+        try:
+            result = await self.handler(job["payload"])
+            self.succeeded += 1
+        except Exception as e:
+            error = str(getattr(e, "detail", "") or e)
+            status_code = getattr(e, "status_code", 500)
+            self.failed += 1
+        finally:
+            self._running -= 1
+
+        finished_at = time.time()
+        self._run_times.append(finished_at - started_at)
+        await asyncio.to_thread(self.store.mark_finished, job_id, result, error, status_code, finished_at)
+
+        event = self._waiters.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+        if job["callback_url"]:
+            await self._send_callback(job_id, job["callback_url"])
+
+    async def _send_callback(self, job_id: str, callback_url: str) -> None:
+        """POST the finished job to its callback URL; failures are counted, not retried"""
+        if self.http_client is None:
+            return
+        job = await asyncio.to_thread(self.store.get, job_id)
+        try:
+            response = await self.http_client.post(callback_url, json=self.public_view(job))
+            response.raise_for_status()
+            self.callbacks_sent += 1
+        except httpx.HTTPError:
+            self.callbacks_failed += 1
+
+    @staticmethod
+    def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        """The job fields returned to API clients"""
+        return {key: value for key, value in job.items() if key != "callback_url"}
+
+    @staticmethod
+    def _percentiles(samples: Deque[float]) -> Dict[str, float]:
+        if not samples:
+            return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(samples)
+        return {
+            "avg": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, throughput counters and wait/run time percentiles in seconds"""
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+            "claims_lost": self.claims_lost,
+            "callbacks_sent": self.callbacks_sent,
+            "callbacks_failed": self.callbacks_failed,
+            "wait_seconds": self._percentiles(self._wait_times),
+            "run_seconds": self._percentiles(self._run_times)
+        }
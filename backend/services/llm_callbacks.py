@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .metrics import (
+    IMAGE_BYTES_SENT,
+    LLM_ERRORS,
+    LLM_SECONDS,
+    LLM_TOKENS,
+    RunTrace,
+    _current_trace,
+)
+import config
+
+# Kept apart from metrics.py, which the API imports at startup, so langchain_core
+# only loads with the graph that runs these callbacks.
+
+
+def _image_bytes(messages: List[List[Any]]) -> int:
+    """Decoded size of the base64 data URLs attached to a chat request"""
+    total = 0
+    for conversation in messages:
+        for message in conversation:
+            content = getattr(message, "content", None)
+            if not isinstance(content, list):
+                continue
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    url = part.get("image_url", {}).get("url", "")
+                    _, _, payload = url.partition("base64,")
+                    total += len(payload) * 3 // 4
+    return total
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records OpenAI latency, token usage, image bytes
+    and errors. LangGraph tags every run with the node that started it
+    (metadata "langgraph_node"), which becomes the node label. Calls made
+    inside trace_run() are also added to the run's trace.
+    """
+
+    # Recording is a few dict and counter updates; run it inline rather than in an executor
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[str, str, float, Optional[RunTrace]]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node", "unknown")
+        model = (
+            metadata.get("ls_model_name")
+            or (kwargs.get("invocation_params") or {}).get("model")
+            or "unknown"
+        )
+        with self._lock:
+            self._runs[run_id] = (node, model, time.perf_counter(), _current_trace.get())
+        if config.METRICS_ENABLED:
+            IMAGE_BYTES_SENT.labels(node, model).inc(_image_bytes(messages))
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        node, model, started, trace = run
+        elapsed = time.perf_counter() - started
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+
+        if trace is not None:
+            trace.model_calls.append({
+                "node": node,
+                "model": model,
+                "ms": round(elapsed * 1000, 1),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "error": None
+            })
+        if config.METRICS_ENABLED:
+            LLM_SECONDS.labels(node, model).observe(elapsed)
+            LLM_TOKENS.labels(node, model, "prompt").inc(input_tokens)
+            LLM_TOKENS.labels(node, model, "completion").inc(output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        node, model, started, trace = run
+        elapsed = time.perf_counter() - started
+        if trace is not None:
+            trace.model_calls.append({
+                "node": node,
+                "model": model,
+                "ms": round(elapsed * 1000, 1),
+                "input_tokens": None,
+                "output_tokens": None,
+                "error": type(error).__name__
+            })
+        if config.METRICS_ENABLED:
+            LLM_SECONDS.labels(node, model).observe(elapsed)
+            LLM_ERRORS.labels(node, model, type(error).__name__).inc()
+
+
+_callback_handler = MetricsCallbackHandler()
+
+
+def graph_run_config() -> Dict[str, Any]:
+    """Config for graph.invoke/ainvoke/astream that attaches the metrics callback"""
+    if not config.METRICS_ENABLED and _current_trace.get() is None:
+        return {}
+    return {"callbacks": [_callback_handler]}
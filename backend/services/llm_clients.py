@@ -0,0 +1,165 @@
+import threading
+from typing import Any, Dict, Optional, Tuple, Type
+
+import httpx
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from .cassette import Cassette, CassetteAsyncTransport, CassetteTransport
+from .rate_limiter import RateLimiter, RateLimitedAsyncTransport, RateLimitedTransport
+import config
+
+
+class LLMClientRegistry:
+    """
+    Process-wide registry of structured-output ChatOpenAI clients.
+
+    Clients are keyed by model, temperature and output schema and built once.
+    All of them share one sync and one async httpx client, so keep-alive
+    connections to the OpenAI API are reused across nodes and requests
+    instead of paying a TLS handshake per image. When a RateLimiter is
+    given, both clients send through it, so every model call in the process
+    draws from the same request, token and concurrency budget. A Cassette
+    sits in front of both, recording responses or answering from them.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 50,
+        keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        cassette: Optional[Cassette] = None
+    ):
+        self.pool_size = pool_size
+        self.api_key = api_key
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.cassette = cassette
+
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        transport: httpx.BaseTransport = httpx.HTTPTransport(limits=limits)
+        async_transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(limits=limits)
+        if rate_limiter is not None:
+            transport = RateLimitedTransport(transport, rate_limiter)
+            async_transport = RateLimitedAsyncTransport(async_transport, rate_limiter)
+        if cassette is not None:
+            # Outermost, so replayed calls never wait for a rate-limit slot
+            transport = CassetteTransport(transport, cassette)
+            async_transport = CassetteAsyncTransport(async_transport, cassette)
+        self.http_client = httpx.Client(transport=transport)
+        self.http_async_client = httpx.AsyncClient(transport=async_transport)
+
+        self._clients: Dict[Tuple[str, float, str], Runnable] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @classmethod
+    def from_config(cls) -> "LLMClientRegistry":
+        """Build a registry from the settings in config.py"""
+        return cls(
+            pool_size=config.OPENAI_POOL_SIZE,
+            keepalive_connections=config.OPENAI_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.OPENAI_KEEPALIVE_EXPIRY,
+            api_key=config.OPENAI_API_KEY,
+            base_url=config.OPENAI_BASE_URL,
+            rate_limiter=RateLimiter.from_config() if config.OPENAI_RATE_LIMIT_ENABLED else None,
+            cassette=Cassette.from_config()
+        )
+
+    def get(self, model: str, temperature: float, schema: Type[BaseModel]) -> Runnable:
+        """Return the shared structured-output client for this model, temperature and schema"""
+        key = (model, temperature, f"{schema.__module__}.{schema.__qualname__}")
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+
+            client = ChatOpenAI(
+                model=model,
+                api_key=self.api_key,
+                base_url=self.base_url,
+                temperature=temperature,
+                # Retries and timeouts are applied per node by services.call_policy
+                max_retries=0,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client
+            ).with_structured_output(schema)
+            self._clients[key] = client
+            self.created += 1
+            return client
+
+    @staticmethod
+    def _pool_stats(client: Any) -> Dict[str, int]:
+        """Connection counts from the httpx transport's pool, when it exposes them"""
+        transport = getattr(client, "_transport", None)
+        while hasattr(transport, "wrapped"):
+            transport = transport.wrapped
+        pool = getattr(transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def stats(self) -> Dict[str, Any]:
+        """Client reuse counters and connection pool usage"""
+        with self._lock:
+            clients = [
+                {"model": model, "temperature": temperature, "schema": schema}
+                for model, temperature, schema in self._clients
+            ]
+            created, reused = self.created, self.reused
+
+        return {
+            "pool_size": self.pool_size,
+            "clients": clients,
+            "clients_created": created,
+            "clients_reused": reused,
+            "sync_pool": self._pool_stats(self.http_client),
+            "async_pool": self._pool_stats(self.http_async_client),
+            "rate_limiter": self.rate_limiter.stats() if self.rate_limiter is not None else None,
+            "cassette": self.cassette.stats() if self.cassette is not None else None
+        }
+
+    async def aclose(self) -> None:
+        """Close the shared connection pools"""
+        self.http_client.close()
+        await self.http_async_client.aclose()
+        if self.rate_limiter is not None:
+            self.rate_limiter.close()
+
+
+_registry: Optional[LLMClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_registry() -> LLMClientRegistry:
+    """Return the process-wide registry, creating it on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LLMClientRegistry.from_config()
+    return _registry
+
+
+def get_structured_llm(model: str, temperature: float, schema: Type[BaseModel]) -> Runnable:
+    """Shortcut for get_llm_registry().get(...)"""
+    return get_llm_registry().get(model, temperature, schema)
+
+
+async def close_llm_registry() -> None:
+    """Close the process-wide registry's pools; a later call to get_llm_registry starts fresh"""
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    if registry is not None:
+        await registry.aclose()
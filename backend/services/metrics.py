@@ -0,0 +1,260 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+import config
+
+
+# Node and model-call latencies span a few milliseconds (local gates) to tens of seconds (vision calls)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+NODE_SECONDS = Histogram(
+    "classifier_node_duration_seconds",
+    "Wall time spent in each graph node",
+    ["node"],
+    buckets=LATENCY_BUCKETS
+)
+NODE_ERRORS = Counter(
+    "classifier_node_errors_total",
+    "Errors recorded by graph nodes, by exception class",
+    ["node", "error_class"]
+)
+LLM_SECONDS = Histogram(
+    "classifier_llm_call_duration_seconds",
+    "OpenAI request latency as seen by the node that made it",
+    ["node", "model"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "classifier_llm_tokens_total",
+    "OpenAI tokens consumed, split into prompt and completion",
+    ["node", "model", "kind"]
+)
+LLM_ERRORS = Counter(
+    "classifier_llm_errors_total",
+    "Failed OpenAI requests, by exception class",
+    ["node", "model", "error_class"]
+)
+LLM_RETRIES = Counter(
+    "classifier_llm_retries_total",
+    "OpenAI calls retried after a transient error, by exception class",
+    ["node", "error_class"]
+)
+LLM_HEDGES = Counter(
+    "classifier_llm_hedges_total",
+    "Hedged OpenAI requests fired after the latency percentile, and how many answered first",
+    ["node", "outcome"]
+)
+IMAGE_BYTES_SENT = Counter(
+    "classifier_image_bytes_sent_total",
+    "Decoded image bytes attached to OpenAI requests",
+    ["node", "model"]
+)
+RESULTS = Counter(
+    "classifier_results_total",
+    "Classification results returned, by category and source",
+    ["category", "source"]
+)
+DOWNLOAD_SECONDS = Histogram(
+    "image_download_duration_seconds",
+    "Time to fetch an image from its URL",
+    buckets=LATENCY_BUCKETS
+)
+DOWNLOAD_BYTES = Counter(
+    "image_download_bytes_total",
+    "Bytes fetched from image URLs"
+)
+DOWNLOAD_CACHE = Counter(
+    "image_download_cache_total",
+    "Image URL lookups by cache outcome: fresh, not_modified (304), changed or miss",
+    ["outcome"]
+)
+DOWNLOAD_REJECTED = Counter(
+    "image_download_rejected_total",
+    "Image downloads refused, by reason (too_large, not_image, empty, http_error, timeout)",
+    ["reason"]
+)
+PREPROCESS_SECONDS = Histogram(
+    "image_preprocess_duration_seconds",
+    "Time to decode, downscale and re-encode an image for the model",
+    ["passthrough"],
+    buckets=LATENCY_BUCKETS
+)
+LIMITER_QUEUE_WAIT_SECONDS = Histogram(
+    "openai_limiter_queue_wait_seconds",
+    "Time an OpenAI request waited for a rate-limit slot before being sent",
+    buckets=(0,) + LATENCY_BUCKETS
+)
+LIMITER_THROTTLED = Counter(
+    "openai_limiter_throttled_total",
+    "OpenAI requests that had to wait, by the limit that held them back",
+    ["reason"]
+)
+LIMITER_RATE_LIMITED = Counter(
+    "openai_limiter_rate_limited_responses_total",
+    "429 responses received from the OpenAI API"
+)
+LIMITER_QUEUE_TIMEOUTS = Counter(
+    "openai_limiter_queue_timeouts_total",
+    "OpenAI requests abandoned because no slot freed up before their deadline"
+)
+LIMITER_IN_FLIGHT = Gauge(
+    "openai_limiter_in_flight",
+    "OpenAI requests currently being sent",
+    multiprocess_mode="livesum"
+)
+LIMITER_WAITING = Gauge(
+    "openai_limiter_waiting",
+    "OpenAI requests currently queued for a rate-limit slot",
+    multiprocess_mode="livesum"
+)
+BLOB_STORE_BYTES = Gauge(
+    "classifier_image_blob_bytes",
+    "Encoded image bytes held by in-flight classifications",
+    multiprocess_mode="livesum"
+)
+BLOB_STORE_REJECTED = Counter(
+    "classifier_image_blob_rejected_total",
+    "Classifications refused because the image memory budget was exhausted"
+)
+
+
+class RunTrace:
+    """Node timings and OpenAI calls of one graph run, kept for the analysis log"""
+
+    def __init__(self, cpu_clock: Callable[[], float] = time.thread_time):
+        # Thread CPU time isolates a node from concurrent runs; a process running one
+        # image at a time (benchmarks/replay.py) uses process time to include helper threads
+        self.cpu_clock = cpu_clock
+        self.nodes: List[Dict[str, Any]] = []
+        self.model_calls: List[Dict[str, Any]] = []
+
+
+_current_trace: ContextVar[Optional[RunTrace]] = ContextVar("run_trace", default=None)
+
+
+@contextmanager
+def trace_run(cpu_clock: Callable[[], float] = time.thread_time) -> Iterator[RunTrace]:
+    """
+    Collect what instrumented nodes and the OpenAI callback record while the block runs.
+
+    Graph nodes run in tasks or executor threads that copy the caller's context,
+    so they all append to the trace set here. Inside another trace_run() block
+    the outer trace is reused, so a caller can collect the trace of a graph run
+    it starts.
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        yield outer
+        return
+    trace = RunTrace(cpu_clock)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # An async generator closed from another context, which never saw the trace
+            _current_trace.set(None)
+
+
+def instrument_node(node: str, func: Callable) -> Callable:
+    """
+    Wrap a graph node so its wall time and any error it records are measured.
+
+    Nodes catch their own exceptions and report them through state.error,
+    so a newly set error (with state.error_type as its class) counts as a
+    node error as well as an exception escaping the node. Inside trace_run()
+    the node's wall time, and for sync nodes its thread CPU time, are also
+    added to the run's trace.
+    """
+    if not config.METRICS_ENABLED and not config.ANALYSIS_LOG_ENABLED:
+        return func
+
+    def record(
+        state: Any,
+        had_error: bool,
+        started: float,
+        cpu_started: Optional[float] = None,
+        error_class: Optional[str] = None
+    ) -> None:
+        elapsed = time.perf_counter() - started
+        if error_class is None and not had_error and getattr(state, "error", None):
+            error_class = getattr(state, "error_type", None) or "unknown"
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.nodes.append({
+                "node": node,
+                "ms": round(elapsed * 1000, 2),
+                # Async nodes share their thread with other tasks, so only sync nodes get CPU time
+                "cpu_ms": round((trace.cpu_clock() - cpu_started) * 1000, 2) if cpu_started is not None else None,
+                "error": error_class
+            })
+        if config.METRICS_ENABLED:
+            NODE_SECONDS.labels(node).observe(elapsed)
+            if error_class is not None:
+                NODE_ERRORS.labels(node, error_class).inc()
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state: Any) -> Any:
+            had_error = bool(getattr(state, "error", None))
+            started = time.perf_counter()
+            try:
+                result = await func(state)
+            except Exception as e:
+                record(None, had_error, started, error_class=type(e).__name__)
+                raise
+            record(result, had_error, started)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state: Any) -> Any:
+        had_error = bool(getattr(state, "error", None))
+        started = time.perf_counter()
+        trace = _current_trace.get()
+        cpu_started = trace.cpu_clock() if trace is not None else None
+        try:
+            result = func(state)
+        except Exception as e:
+            record(None, had_error, started, cpu_started, type(e).__name__)
+            raise
+        record(result, had_error, started, cpu_started)
+        return result
+    return wrapper
+
+
+def record_result(result: Dict[str, Any], source: str) -> None:
+    """Count a returned classification by category and by where it came from (graph or cache)"""
+    if config.METRICS_ENABLED:
+        RESULTS.labels(result.get("category") or "unknown", source).inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Prometheus exposition of every metric in this process, or aggregated
+    across worker processes when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
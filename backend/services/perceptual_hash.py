@@ -0,0 +1,389 @@
+import base64
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from models.schemas import ClassificationResult
+import config
+
+
+HASH_BITS = 64
+
+# What a near-duplicate answer is built from; the model's reasoning is not kept
+STORED_FIELDS = ("category", "severity", "severity_level", "scale", "confidence")
+DUPLICATE_REASONING = "Near-duplicate of a previously classified photo"
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis used to compute pHash"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] = np.sqrt(1.0 / n)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _load_grayscale(image_base64: str, size: Tuple[int, int]) -> np.ndarray:
+    """Decode an image straight to a small grayscale array"""
+    image = Image.open(BytesIO(base64.b64decode(image_base64)))
+    # JPEG draft mode decodes at a reduced scale, so full-resolution pixels are never built
+    image.draft("L", (size[0] * 4, size[1] * 4))
+    image = image.convert("L").resize(size, Image.Resampling.BOX)
+    return np.asarray(image, dtype=np.float32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image_base64: str) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail"""
+    pixels = _load_grayscale(image_base64, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image_base64: str) -> int:
+    """64-bit perceptual hash: low-frequency DCT coefficients against their median"""
+    pixels = _load_grayscale(image_base64, (32, 32))
+    coefficients = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8]
+    # The DC term only carries overall brightness, so leave it out of the median
+    median = np.median(coefficients.ravel()[1:])
+    return _bits_to_int(coefficients > median)
+
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+
+def compute_hash(image_base64: str, algorithm: str = "phash") -> int:
+    """Compute the perceptual hash of a base64 image with the given algorithm"""
+    return HASH_FUNCTIONS[algorithm](image_base64)
+
+
+class PerceptualHashIndex:
+    """
+    Near-duplicate index over 64-bit perceptual hashes.
+
+    Uses multi-index hashing: each hash is split into four 16-bit chunks.
+    Two hashes within Hamming distance r must agree on some chunk to within
+    r // 4 bits, so a lookup only probes the chunk values near the query's
+    chunks. Each chunk table is stored CSR-style: slots sorted by chunk value
+    plus an offsets array giving every value's bucket range. Recent inserts
+    sit in a small tail that is scanned directly and folded into the tables
+    once it grows past REBUILD_TAIL entries.
+
+    Stored results are only valid for the model and prompts that produced
+    them, so a saved index records its namespace and is discarded on load
+    when the namespace differs. Only the fields in STORED_FIELDS are kept.
+    With a path, a background thread rewrites the file (one JSON line per
+    entry) every save_every additions, and close() writes it a last time.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+    CHUNK_MASK = (1 << CHUNK_BITS) - 1
+    REBUILD_TAIL = 1024
+
+    def __init__(
+        self,
+        thresholds: Dict[str, int],
+        algorithm: str = "phash",
+        max_entries: int = 500000,
+        path: Optional[str] = None,
+        save_every: int = 100,
+        namespace: str = ""
+    ):
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown perceptual hash algorithm: {algorithm}")
+
+        self.thresholds = dict(thresholds)
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+
+        # Slot-addressed storage; slots are handed out in insertion order
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._categories = np.zeros(1024, dtype=np.int16)
+        self._created = np.zeros(1024, dtype=np.float64)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._results: List[Optional[dict]] = []
+        self._size = 0
+        self._count = 0
+        self._oldest = 0
+
+        # CSR chunk tables covering slots below _indexed
+        self._bucket_offsets = [np.zeros(self.CHUNK_MASK + 2, dtype=np.int64) for _ in range(self.CHUNKS)]
+        self._bucket_slots = [np.zeros(0, dtype=np.int64) for _ in range(self.CHUNKS)]
+        self._indexed = 0
+
+        self._category_codes: Dict[str, int] = {}
+        self._code_thresholds = np.zeros(0, dtype=np.int64)
+        for category in self.thresholds:
+            self._category_code(category)
+
+        # Flip masks for probing chunk values within the per-chunk radius
+        radius = self.max_threshold // self.CHUNKS
+        self._probe_masks = np.array([
+            sum(1 << bit for bit in bits)
+            for flips in range(radius + 1)
+            for bits in itertools.combinations(range(self.CHUNK_BITS), flips)
+        ], dtype=np.uint16)
+
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+        # Saves run on their own thread, off the request path, and one at a time
+        self._save_lock = threading.Lock()
+        self._save_requested = threading.Event()
+        self._closed = False
+        self._saver: Optional[threading.Thread] = None
+        if path:
+            self._saver = threading.Thread(target=self._run_saver, name="phash-index-saver", daemon=True)
+            self._saver.start()
+
+    @classmethod
+    def from_config(cls) -> "PerceptualHashIndex":
+        """Build an index from the settings in config.py"""
+        return cls(
+            thresholds=config.PHASH_THRESHOLDS,
+            algorithm=config.PHASH_ALGORITHM,
+            max_entries=config.PHASH_MAX_ENTRIES,
+            path=config.PHASH_INDEX_PATH or None,
+            namespace=f"{config.OPENAI_MODEL}:{config.PROMPT_VERSION}"
+        )
+
+    @property
+    def max_threshold(self) -> int:
+        return max(self.thresholds.values(), default=0)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def compute_hash(self, image_base64: str) -> int:
+        """Hash an image with this index's algorithm"""
+        return compute_hash(image_base64, self.algorithm)
+
+    def _category_code(self, category: str) -> int:
+        code = self._category_codes.get(category)
+        if code is None:
+            code = len(self._category_codes)
+            self._category_codes[category] = code
+            # Categories without a threshold never match
+            self._code_thresholds = np.append(
+                self._code_thresholds, self.thresholds.get(category, -1)
+            )
+        return code
+
+    def _chunk_values(self, hashes: np.ndarray, chunk: int) -> np.ndarray:
+        return ((hashes >> np.uint64(chunk * self.CHUNK_BITS)) & np.uint64(self.CHUNK_MASK)).astype(np.uint16)
+
+    def _candidate_slots(self, value: int) -> np.ndarray:
+        """Slots whose hash may lie within the search radius of value"""
+        # Slots may repeat across chunks; that is harmless when taking the minimum
+        parts = [np.arange(self._indexed, self._size)]
+        if not self._indexed:
+            return parts[0]
+
+        for chunk in range(self.CHUNKS):
+            chunk_value = (value >> (chunk * self.CHUNK_BITS)) & self.CHUNK_MASK
+            probes = np.uint16(chunk_value) ^ self._probe_masks
+            offsets = self._bucket_offsets[chunk]
+            lo = offsets[probes]
+            lengths = offsets[probes.astype(np.int64) + 1] - lo
+            hit = lengths > 0
+            if not hit.any():
+                continue
+            lo, lengths = lo[hit], lengths[hit]
+
+            # Expand the [lo, hi) ranges into one array of positions
+            starts = np.cumsum(lengths) - lengths
+            positions = np.arange(lengths.sum()) + np.repeat(lo - starts, lengths)
+            parts.append(self._bucket_slots[chunk][positions])
+
+        return np.concatenate(parts)
+
+    def lookup(self, value: int) -> Optional[Tuple[ClassificationResult, int]]:
+        """
+        Find the closest stored result within its category's threshold.
+
+        Returns:
+            (stored classification, Hamming distance) or None if nothing is close enough
+        """
+        with self._lock:
+            slots = self._candidate_slots(value)
+            slots = slots[self._alive[slots]]
+
+            match = None
+            if len(slots):
+                distances = np.bitwise_count(self._hashes[slots] ^ np.uint64(value))
+                allowed = self._code_thresholds[self._categories[slots]]
+                within = distances <= allowed
+                if within.any():
+                    best = np.argmin(np.where(within, distances, HASH_BITS + 1))
+                    match = (self._results[slots[best]], int(distances[best]))
+
+            if match is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        result, distance = match
+        return ClassificationResult(reasoning=DUPLICATE_REASONING, **result), distance
+
+    def add(self, value: int, classification: ClassificationResult) -> None:
+        """Store the classification produced for an image hash"""
+        with self._lock:
+            self._insert(value, classification.model_dump(include=set(STORED_FIELDS)), time.time())
+            if self._size - self._indexed >= self.REBUILD_TAIL:
+                self._rebuild()
+            self._unsaved += 1
+            should_save = self._saver is not None and self._unsaved >= self.save_every
+
+        if should_save:
+            self._save_requested.set()
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._hashes)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        self._hashes = np.resize(self._hashes, capacity)
+        self._categories = np.resize(self._categories, capacity)
+        self._created = np.resize(self._created, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+
+    def _insert(self, value: int, result: dict, created_at: float) -> None:
+        self._grow(self._size + 1)
+        slot = self._size
+        self._hashes[slot] = value
+        self._categories[slot] = self._category_code(result["category"])
+        self._created[slot] = created_at
+        self._alive[slot] = True
+        self._results.append({field: result.get(field) for field in STORED_FIELDS})
+        self._size += 1
+        self._count += 1
+
+        # Drop the oldest entries once the index is full
+        while self._count > self.max_entries:
+            if self._alive[self._oldest]:
+                self._alive[self._oldest] = False
+                self._results[self._oldest] = None
+                self._count -= 1
+            self._oldest += 1
+
+    def _rebuild(self) -> None:
+        """Compact out evicted slots and re-sort the chunk tables"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._hashes = self._hashes[keep]
+        self._categories = self._categories[keep]
+        self._created = self._created[keep]
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._results = [self._results[slot] for slot in keep]
+        self._size = self._count = len(keep)
+        self._oldest = 0
+
+        for chunk in range(self.CHUNKS):
+            values = self._chunk_values(self._hashes, chunk)
+            counts = np.bincount(values, minlength=self.CHUNK_MASK + 1)
+            self._bucket_offsets[chunk] = np.concatenate(([0], np.cumsum(counts)))
+            self._bucket_slots[chunk] = np.argsort(values, kind="stable")
+        self._indexed = self._size
+
+    def _run_saver(self) -> None:
+        while True:
+            self._save_requested.wait()
+            self._save_requested.clear()
+            if self._closed:
+                return
+            try:
+                self.save()
+            except OSError:
+                # Persistence is best effort; the next request or close() tries again
+                pass
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write the index to disk atomically, as a header line and one JSON line per entry"""
+        path = path or self.path
+        if not path:
+            return
+
+        with self._lock:
+            keep = np.flatnonzero(self._alive[:self._size])
+            hashes = self._hashes[keep].tolist()
+            created = self._created[keep].tolist()
+            results = [self._results[slot] for slot in keep]
+            self._unsaved = 0
+
+        with self._save_lock:
+            handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+            try:
+                with os.fdopen(handle, "w") as file:
+                    file.write(json.dumps({"algorithm": self.algorithm, "namespace": self.namespace}) + "\n")
+                    for value, created_at, result in zip(hashes, created, results):
+                        file.write(json.dumps([f"{value:016x}", created_at, result], separators=(",", ":")) + "\n")
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def load(self, path: str) -> None:
+        """Load a previously saved index, skipping it if the hash algorithm or namespace differs"""
+        try:
+            with open(path) as file:
+                header = json.loads(file.readline())
+                # Indexes saved before namespacing carry no namespace and are discarded too
+                if header.get("algorithm") != self.algorithm or header.get("namespace") != self.namespace:
+                    return
+                entries = [json.loads(line) for line in file]
+        except (OSError, ValueError, AttributeError):
+            # Unreadable, or written in an older format
+            return
+
+        with self._lock:
+            for value, created_at, result in entries:
+                self._insert(int(value, 16), result, created_at)
+            self._rebuild()
+
+    def close(self) -> None:
+        """Stop the background saver and write the index a last time"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._saver is not None:
+            self._save_requested.set()
+            self._saver.join()
+        self.save()
+
+    def stats(self) -> Dict[str, object]:
+        """Index size and hit/miss counters for monitoring"""
+        with self._lock:
+            return {
+                "size": self._count,
+                "max_entries": self.max_entries,
+                "algorithm": self.algorithm,
+                "namespace": self.namespace,
+                "thresholds": dict(self.thresholds),
+                "hits": self.hits,
+                "misses": self.misses
+            }
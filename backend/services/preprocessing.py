@@ -0,0 +1,232 @@
+import base64
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from typing import BinaryIO, Optional, Tuple, Union
+
+from PIL import Image
+
+from .image_metadata import ImageMetadata, apply_orientation, read_metadata
+from .metrics import PREPROCESS_SECONDS
+import config
+
+
+class ImagePreprocessingError(ValueError):
+    """Raised when the input bytes cannot be turned into a model-ready image"""
+
+
+@dataclass(frozen=True)
+class PreprocessingProfile:
+    """How far to shrink an image and which vision detail level to request"""
+
+    max_edge: int
+    quality: int
+    detail: str
+    # Compliant JPEGs up to this size are forwarded without re-encoding
+    passthrough_bytes: int
+
+
+# OpenAI "high" detail scales images to fit 2048px and then to a 768px short side,
+# and "low" detail works on a 512px thumbnail, so pixels beyond that are wasted upload
+PROFILES = {
+    "fast": PreprocessingProfile(max_edge=512, quality=80, detail="low", passthrough_bytes=150_000),
+    "standard": PreprocessingProfile(max_edge=1024, quality=85, detail="high", passthrough_bytes=400_000),
+    "accurate": PreprocessingProfile(max_edge=2048, quality=90, detail="high", passthrough_bytes=1_200_000),
+}
+
+
+@dataclass
+class PreparedImage:
+    """A model-ready JPEG plus what was done to produce it"""
+
+    base64: str
+    width: int
+    height: int
+    # Size of the decoded input before downscaling, for resolution checks
+    original_width: int
+    original_height: int
+    detail: str
+    passthrough: bool
+    input_bytes: int
+    output_bytes: int
+    # GPS position, capture time and orientation from the input's EXIF (the output carries no EXIF)
+    metadata: ImageMetadata = ImageMetadata()
+
+    @property
+    def original_size(self) -> Tuple[int, int]:
+        return self.original_width, self.original_height
+
+
+def get_profile(profile: Union[str, PreprocessingProfile, None] = None) -> PreprocessingProfile:
+    """Resolve a profile name (defaulting to config.IMAGE_PROFILE) to its settings"""
+    if isinstance(profile, PreprocessingProfile):
+        return profile
+    name = profile or config.IMAGE_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ImagePreprocessingError(f"Unknown preprocessing profile: {name}")
+
+
+def _normalize_mode(image: Image.Image) -> Image.Image:
+    """Convert to RGB, keeping an alpha band (RGBA/LA) only where there is transparency to composite"""
+    if image.mode == "P" and "transparency" in image.info:
+        return image.convert("RGBA")
+    if image.mode in ("RGB", "RGBA", "LA"):
+        return image
+    return image.convert("RGB")
+
+
+def _flatten_alpha(image: Image.Image) -> Image.Image:
+    """Composite transparent images onto white"""
+    if image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        # The image's own alpha band is the mask, so no separate channel copy is made
+        background.paste(image, mask=image)
+        return background
+    return image
+
+
+def _has_metadata_segments(data: bytes) -> bool:
+    """
+    Whether a JPEG carries APP1-APP15 or comment segments before its scan data.
+
+    These hold EXIF (GPS position, device serial), XMP, ICC and IPTC blocks;
+    only APP0 (JFIF) and the coding segments are safe to forward as-is.
+    """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return True
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0xDA:
+            return False
+        if 0xE1 <= marker <= 0xEF or marker == 0xFE:
+            return True
+        position += 2 + int.from_bytes(data[position + 2:position + 4], "big")
+    return True
+
+
+def _input_size(data: Union[bytes, BinaryIO]) -> int:
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    data.seek(0, 2)
+    size = data.tell()
+    data.seek(0)
+    return size
+
+
+def prepare_image(
+    data: Union[bytes, BinaryIO],
+    profile: Union[str, PreprocessingProfile, None] = None
+) -> PreparedImage:
+    """
+    Turn raw image bytes into a bounded base64 JPEG for the vision model.
+
+    The image is decoded once. JPEGs are downscaled during decode via draft
+    mode, the long edge is capped at the profile's max_edge, and small
+    RGB JPEGs that already fit the profile and carry no EXIF, XMP or
+    other APPn metadata are forwarded untouched; anything with metadata
+    is re-encoded, which drops it.
+    EXIF metadata is read from the header before any pixels are
+    decoded, and the EXIF orientation is applied to the downscaled image.
+
+    A file object (e.g. a spooled upload) is decoded straight from the file,
+    so the encoded input is never held in memory as a whole. Transparency
+    is composited after downscaling, and the base64 payload is encoded from
+    the JPEG encoder's buffer without an intermediate bytes copy.
+
+    Args:
+        data: Raw bytes, or a seekable binary file, of an uploaded or downloaded image
+        profile: Profile name or settings (defaults to config.IMAGE_PROFILE)
+
+    Returns:
+        PreparedImage with the base64 payload and the detail level to request
+    """
+    input_bytes = _input_size(data)
+    if not input_bytes:
+        raise ImagePreprocessingError("Image data is empty")
+
+    settings = get_profile(profile)
+    started = time.perf_counter()
+
+    try:
+        # Only the header is parsed here; pixels are decoded on load()
+        image = Image.open(BytesIO(data) if isinstance(data, (bytes, bytearray)) else data)
+        width, height = image.size
+    except Exception as e:
+        raise ImagePreprocessingError(f"Cannot open image file: {str(e)}")
+    metadata = read_metadata(image, now=time.time())
+
+    # Fast path: already a small, compliant JPEG that displays upright as stored
+    # and carries no EXIF or other metadata that must not leave the server
+    raw: Optional[bytes] = None
+    if (
+        image.format == "JPEG"
+        and image.mode == "RGB"
+        and not metadata.rotated
+        and max(width, height) <= settings.max_edge
+        and input_bytes <= settings.passthrough_bytes
+    ):
+        if isinstance(data, (bytes, bytearray)):
+            raw = bytes(data)
+        else:
+            data.seek(0)
+            raw = data.read()
+            data.seek(0)
+    if raw is not None and not _has_metadata_segments(raw):
+        PREPROCESS_SECONDS.labels("true").observe(time.perf_counter() - started)
+        return PreparedImage(
+            base64=base64.b64encode(raw).decode("ascii"),
+            width=width,
+            height=height,
+            original_width=width,
+            original_height=height,
+            detail=settings.detail,
+            passthrough=True,
+            input_bytes=input_bytes,
+            output_bytes=input_bytes,
+            metadata=metadata
+        )
+
+    try:
+        # Let the JPEG decoder skip DCT scales we would throw away anyway
+        if image.format == "JPEG":
+            image.draft("RGB", (settings.max_edge, settings.max_edge))
+        image.load()
+
+        # Shrink first so the alpha composite and RGB conversion run on the small image
+        image = _normalize_mode(image)
+        if max(image.size) > settings.max_edge:
+            image.thumbnail(
+                (settings.max_edge, settings.max_edge),
+                Image.Resampling.BICUBIC,
+                reducing_gap=2.0
+            )
+        image = _flatten_alpha(image)
+        # Rotating the thumbnail is cheaper than rotating the full image, with the same result
+        image = apply_orientation(image, metadata.orientation)
+
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=settings.quality)
+        output_bytes = buffer.tell()
+        encoded = base64.b64encode(buffer.getbuffer()).decode("ascii")
+    except Exception as e:
+        raise ImagePreprocessingError(f"Cannot decode image file: {str(e)}")
+
+    PREPROCESS_SECONDS.labels("false").observe(time.perf_counter() - started)
+    return PreparedImage(
+        base64=encoded,
+        width=image.width,
+        height=image.height,
+        original_width=width,
+        original_height=height,
+        detail=settings.detail,
+        passthrough=False,
+        input_bytes=input_bytes,
+        output_bytes=output_bytes,
+        metadata=metadata
+    )
@@ -0,0 +1,195 @@
+import base64
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import config
+
+
+# Edge of the downscaled copy the metrics are computed on
+ANALYSIS_EDGE = 256
+
+# 4 bits per channel -> 4096 colour bins for the entropy estimate
+_COLOR_SHIFT = 4
+
+
+@dataclass
+class QualityReport:
+    """Quality metrics of one image and the reasons it is unusable, if any"""
+
+    width: int
+    height: int
+    sharpness: float
+    mean_luminance: float
+    dark_fraction: float
+    bright_fraction: float
+    color_entropy: float
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def usable(self) -> bool:
+        return not self.issues
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "sharpness": round(self.sharpness, 2),
+            "mean_luminance": round(self.mean_luminance, 2),
+            "dark_fraction": round(self.dark_fraction, 4),
+            "bright_fraction": round(self.bright_fraction, 4),
+            "color_entropy": round(self.color_entropy, 3)
+        }
+
+
+def _load_small_rgb(image_base64: str) -> tuple:
+    """Decode to an RGB array no larger than ANALYSIS_EDGE, returning it with the full size"""
+    image = Image.open(BytesIO(base64.b64decode(image_base64)))
+    size = image.size
+    # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale, so the full image is never built
+    image.draft("RGB", (ANALYSIS_EDGE, ANALYSIS_EDGE))
+    image = image.convert("RGB")
+    if max(image.size) > ANALYSIS_EDGE:
+        image.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE), Image.Resampling.BOX)
+    return np.asarray(image), size
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian; low values mean little edge detail (blur)"""
+    laplacian = (
+        4.0 * gray[1:-1, 1:-1]
+        - gray[:-2, 1:-1]
+        - gray[2:, 1:-1]
+        - gray[1:-1, :-2]
+        - gray[1:-1, 2:]
+    )
+    return float(laplacian.var())
+
+
+def color_entropy(rgb: np.ndarray) -> float:
+    """Shannon entropy in bits of the quantized colour histogram (0 to 12)"""
+    quantized = (rgb >> _COLOR_SHIFT).astype(np.uint16)
+    bins = (quantized[..., 0] << 8) | (quantized[..., 1] << 4) | quantized[..., 2]
+    counts = np.bincount(bins.ravel(), minlength=1 << 12)
+    probabilities = counts[counts > 0] / bins.size
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+class ImageQualityFilter:
+    """
+    CPU-only gate that spots images no model call can salvage.
+
+    Metrics are computed with NumPy on a copy downscaled to ANALYSIS_EDGE,
+    so a check takes a few milliseconds: Laplacian-variance sharpness,
+    luminance histogram exposure, source resolution and colour entropy
+    (flat screenshots and blank frames have very few colours). Thresholds
+    are deliberately loose: only clearly unusable images are rejected.
+    """
+
+    def __init__(
+        self,
+        min_edge: int = 160,
+        min_sharpness: float = 15.0,
+        max_dark_fraction: float = 0.95,
+        max_bright_fraction: float = 0.95,
+        min_color_entropy: float = 3.0
+    ):
+        self.min_edge = min_edge
+        self.min_sharpness = min_sharpness
+        self.max_dark_fraction = max_dark_fraction
+        self.max_bright_fraction = max_bright_fraction
+        self.min_color_entropy = min_color_entropy
+
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "ImageQualityFilter":
+        """Build a filter from the settings in config.py"""
+        return cls(
+            min_edge=config.QUALITY_MIN_EDGE,
+            min_sharpness=config.QUALITY_MIN_SHARPNESS,
+            max_dark_fraction=config.QUALITY_MAX_DARK_FRACTION,
+            max_bright_fraction=config.QUALITY_MAX_BRIGHT_FRACTION,
+            min_color_entropy=config.QUALITY_MIN_COLOR_ENTROPY
+        )
+
+    def measure(self, image_base64: str, source_size: Optional[Tuple[int, int]] = None) -> QualityReport:
+        """
+        Compute the quality metrics of a base64 image without judging them.
+
+        source_size is the (width, height) of the image before preprocessing
+        downscaled it; the resolution is reported from it when given, so a
+        profile's max_edge never makes a wide image look too small.
+        """
+        rgb, (width, height) = _load_small_rgb(image_base64)
+        if source_size is not None:
+            width, height = source_size
+
+        # ITU-R BT.601 luma, the same weights PIL uses for convert("L")
+        gray = rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+        pixels = gray.size
+
+        return QualityReport(
+            width=width,
+            height=height,
+            sharpness=laplacian_variance(gray),
+            mean_luminance=float(gray.mean()),
+            dark_fraction=float(histogram[:16].sum() / pixels),
+            bright_fraction=float(histogram[240:].sum() / pixels),
+            color_entropy=color_entropy(rgb)
+        )
+
+    def assess(self, image_base64: str, source_size: Optional[Tuple[int, int]] = None) -> QualityReport:
+        """Measure an image, list the thresholds it fails and count the outcome"""
+        report = self.measure(image_base64, source_size)
+
+        if min(report.width, report.height) < self.min_edge:
+            report.issues.append("too_small")
+        if report.dark_fraction > self.max_dark_fraction:
+            report.issues.append("too_dark")
+        if report.bright_fraction > self.max_bright_fraction:
+            report.issues.append("overexposed")
+        if report.sharpness < self.min_sharpness:
+            report.issues.append("blurry")
+        if report.color_entropy < self.min_color_entropy:
+            report.issues.append("low_color_entropy")
+
+        with self._lock:
+            self._counts["checked"] += 1
+            if report.issues:
+                self._counts["rejected"] += 1
+                for issue in report.issues:
+                    self._counts[f"reason:{issue}"] += 1
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        """Checked/rejected counters, per-reason reject counts and the active thresholds"""
+        with self._lock:
+            counts = dict(self._counts)
+
+        checked = counts.get("checked", 0)
+        rejected = counts.get("rejected", 0)
+        return {
+            "checked": checked,
+            "rejected": rejected,
+            "reject_rate": rejected / checked if checked else 0.0,
+            "reasons": {
+                key.split(":", 1)[1]: value
+                for key, value in counts.items()
+                if key.startswith("reason:")
+            },
+            "thresholds": {
+                "min_edge": self.min_edge,
+                "min_sharpness": self.min_sharpness,
+                "max_dark_fraction": self.max_dark_fraction,
+                "max_bright_fraction": self.max_bright_fraction,
+                "min_color_entropy": self.min_color_entropy
+            }
+        }
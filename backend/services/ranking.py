@@ -0,0 +1,163 @@
+import random
+from typing import Any, Iterable, Iterator, List, Optional
+
+# Enough levels for 2**32 keys at the 1/2 promotion rate
+MAX_LEVELS = 32
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Any, levels: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * levels
+        # Positions each link skips; a link to None reaches one past the last key
+        self.width: List[int] = [1] * levels
+
+
+class RankedSet:
+    """
+    Sorted set of comparable keys with rank and select by position.
+
+    An indexable skip list: every link records how many positions it
+    skips, so insert, remove, rank (how many keys sort before a key) and
+    select (the key at a position) all take O(log n) expected steps, and
+    the first k keys take O(log n + k). Keys must be unique and totally
+    ordered; store (-score, id) tuples to rank by descending score.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self._random = random.Random(seed)
+        self._head = _Node(None, MAX_LEVELS)
+        self._size = 0
+        # Levels in use; the head's links above them are set up when a node first reaches them
+        self._levels = 1
+
+    @classmethod
+    def from_sorted(cls, keys: Iterable[Any], seed: Optional[int] = None) -> "RankedSet":
+        """Build from unique keys already in ascending order in O(n), e.g. when loading a stored ranking"""
+        ranked = cls(seed)
+        last: List[_Node] = [ranked._head] * MAX_LEVELS
+        last_positions = [0] * MAX_LEVELS
+        position = 0
+        for key in keys:
+            position += 1
+            levels = ranked._level()
+            node = _Node(key, levels)
+            for level in range(levels):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_positions[level]
+                last[level] = node
+                last_positions[level] = position
+            ranked._levels = max(ranked._levels, levels)
+        for level in range(ranked._levels):
+            last[level].width[level] = position + 1 - last_positions[level]
+        ranked._size = position
+        return ranked
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: Any) -> bool:
+        node = self._predecessors(key)[0][0].next[0]
+        return node is not None and node.key == key
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.iter_from(0)
+
+    def _level(self) -> int:
+        level = 1
+        while level < MAX_LEVELS and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _predecessors(self, key: Any):
+        """Per level, the last node before key and its position (the head is position 0)"""
+        update: List[_Node] = [self._head] * MAX_LEVELS
+        positions = [0] * MAX_LEVELS
+        node, position = self._head, 0
+        for level in range(self._levels - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            positions[level] = position
+        return update, positions
+
+    def add(self, key: Any) -> bool:
+        """Insert a key; False if it is already present"""
+        update, positions = self._predecessors(key)
+        following = update[0].next[0]
+        if following is not None and following.key == key:
+            return False
+
+        levels = self._level()
+        for level in range(self._levels, levels):
+            self._head.next[level] = None
+            self._head.width[level] = self._size + 1
+        self._levels = max(self._levels, levels)
+
+        node = _Node(key, levels)
+        position = positions[0] + 1
+        for level in range(self._levels):
+            before = update[level]
+            if level < levels:
+                # Split before's link around the new node, which also shifts everything after it by one
+                node.next[level] = before.next[level]
+                node.width[level] = positions[level] + before.width[level] + 1 - position
+                before.next[level] = node
+                before.width[level] = position - positions[level]
+            else:
+                before.width[level] += 1
+        self._size += 1
+        return True
+
+    def remove(self, key: Any) -> bool:
+        """Remove a key; False if it was not present"""
+        update, _ = self._predecessors(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return False
+
+        for level in range(self._levels):
+            before = update[level]
+            if level < len(node.next):
+                before.width[level] += node.width[level] - 1
+                before.next[level] = node.next[level]
+            else:
+                before.width[level] -= 1
+        while self._levels > 1 and self._head.next[self._levels - 1] is None:
+            self._levels -= 1
+        self._size -= 1
+        return True
+
+    def discard(self, key: Any) -> None:
+        self.remove(key)
+
+    def rank(self, key: Any) -> int:
+        """How many keys sort before key (its 0-based index when present)"""
+        return self._predecessors(key)[1][0]
+
+    def _node_at(self, index: int) -> _Node:
+        if not 0 <= index < self._size:
+            raise IndexError("RankedSet index out of range")
+        node, position = self._head, 0
+        for level in range(self._levels - 1, -1, -1):
+            while node.next[level] is not None and position + node.width[level] <= index + 1:
+                position += node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._size
+        return self._node_at(index).key
+
+    def iter_from(self, index: int) -> Iterator[Any]:
+        """Keys in order starting at a 0-based position"""
+        if index >= self._size:
+            return
+        node: Optional[_Node] = self._node_at(max(index, 0))
+        while node is not None:
+            yield node.key
+            node = node.next[0]
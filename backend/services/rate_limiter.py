@@ -0,0 +1,580 @@
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import httpx
+
+from .metrics import (
+    LIMITER_IN_FLIGHT,
+    LIMITER_QUEUE_TIMEOUTS,
+    LIMITER_QUEUE_WAIT_SECONDS,
+    LIMITER_RATE_LIMITED,
+    LIMITER_THROTTLED,
+    LIMITER_WAITING,
+)
+import config
+
+
+# OpenAI bills a 1024x768 "high" detail image at 85 + 4 tiles * 170 tokens; "low" is a flat 85
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+# Completion tokens reserved for requests that do not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 400
+# How often a waiter re-checks while blocked by the concurrency cap
+POLL_SECONDS = 0.025
+# Backoff applied to a 429 that carries no usable retry hint, doubled per consecutive 429
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+
+# Monotonic time by which the current model call attempt must be done, set by the call policy
+_attempt_deadline: ContextVar[Optional[float]] = ContextVar("openai_attempt_deadline", default=None)
+
+
+@contextmanager
+def attempt_deadline(seconds: float) -> Iterator[None]:
+    """
+    Cap rate-limit queueing and 429 retries of the requests made inside at
+    seconds from now. Threads and tasks started inside inherit the cap when
+    they copy the context.
+    """
+    token = _attempt_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _attempt_deadline.reset(token)
+
+
+class RateLimitTimeout(httpx.TimeoutException):
+    """Raised when a model call could not get a rate-limit slot before its queue deadline"""
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as "1s", "6m0s" or "20ms" into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    matched = False
+    for amount, unit in _DURATION_PART.findall(value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}[unit]
+    return seconds if matched else None
+
+
+def _header_float(headers: httpx.Headers, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def estimate_tokens(body: bytes) -> Tuple[int, bool]:
+    """
+    Estimate the tokens a chat completion request will consume, and whether it streams.
+
+    Text is counted at four characters per token, images at their detail-level
+    price, and the completion at max_tokens (or a default reservation).
+    """
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return DEFAULT_COMPLETION_TOKENS, False
+
+    tokens = 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    tokens += len(part.get("text", "")) // 4
+                elif part.get("type") == "image_url":
+                    tokens += IMAGE_TOKENS.get(part.get("image_url", {}).get("detail", "auto"), 765)
+    if payload.get("response_format"):
+        tokens += len(json.dumps(payload["response_format"])) // 4
+    tokens += payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return tokens, bool(payload.get("stream"))
+
+
+class LocalBucketStore:
+    """Bucket state for one process"""
+
+    def __init__(self, initial: Dict[str, float]):
+        self._state = dict(initial)
+        self._lock = threading.Lock()
+
+    def transact(self, update: Callable[[Dict[str, float]], Any]) -> Any:
+        with self._lock:
+            return update(self._state)
+
+    async def atransact(self, update: Callable[[Dict[str, float]], Any]) -> Any:
+        # In-memory and only briefly locked, so it runs on the event loop
+        return self.transact(update)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBucketStore:
+    """
+    Bucket state in a SQLite file, so every worker process on the host draws
+    from one request/token budget. Each update runs in an IMMEDIATE
+    transaction, which serializes the read-modify-write across processes;
+    an update that leaves the state as it was writes nothing. The async
+    path runs transactions on a worker thread, since one may wait for
+    another process's lock.
+    """
+
+    def __init__(self, db_path: str, initial: Dict[str, float], name: str = "openai"):
+        self.name = name
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets (name TEXT PRIMARY KEY, state TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO rate_limit_buckets (name, state) VALUES (?, ?)",
+            (name, json.dumps(initial))
+        )
+
+    def transact(self, update: Callable[[Dict[str, float]], Any]) -> Any:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                (raw,) = self._db.execute(
+                    "SELECT state FROM rate_limit_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                state = json.loads(raw)
+                result = update(state)
+                encoded = json.dumps(state)
+                if encoded != raw:
+                    self._db.execute(
+                        "UPDATE rate_limit_buckets SET state = ? WHERE name = ?", (encoded, self.name)
+                    )
+                self._db.execute("COMMIT")
+                return result
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def atransact(self, update: Callable[[Dict[str, float]], Any]) -> Any:
+        return await asyncio.to_thread(self.transact, update)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class RateLimiter:
+    """
+    Client-side governor for OpenAI calls.
+
+    Combines a token bucket on requests per minute and one on tokens per
+    minute with a cap on concurrent in-flight calls. A call that cannot
+    start waits in line until its deadline instead of failing. Limits set
+    to 0 are learned from the x-ratelimit-limit-* response headers, the
+    buckets are clamped to the x-ratelimit-remaining-* values the API
+    reports, and a 429 pauses every caller until the API's reset hint
+    (or an exponential backoff when there is none).
+
+    The buckets live in a SQLite file when db_path is set, so several
+    worker processes share one budget; the concurrency cap is per process.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_in_flight: int = 16,
+        queue_timeout: float = 60.0,
+        db_path: Optional[str] = None
+    ):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.learn_limits = not requests_per_minute or not tokens_per_minute
+
+        initial = {
+            "rpm": float(requests_per_minute),
+            "tpm": float(tokens_per_minute),
+            "requests": float(requests_per_minute),
+            "tokens": float(tokens_per_minute),
+            "updated_at": time.time(),
+            "paused_until": 0.0,
+            "backoff": 0.0
+        }
+        self.store = SQLiteBucketStore(db_path, initial) if db_path else LocalBucketStore(initial)
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.throttled: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.queue_timeouts = 0
+        self.total_wait_seconds = 0.0
+
+    @classmethod
+    def from_config(cls) -> "RateLimiter":
+        """Build a limiter from the settings in config.py"""
+        return cls(
+            requests_per_minute=config.OPENAI_RPM_LIMIT,
+            tokens_per_minute=config.OPENAI_TPM_LIMIT,
+            max_in_flight=config.OPENAI_MAX_IN_FLIGHT,
+            queue_timeout=config.OPENAI_QUEUE_TIMEOUT_SECONDS,
+            db_path=config.OPENAI_RATE_LIMIT_DB_PATH or None
+        )
+
+    @classmethod
+    def _refilled(cls, state: Dict[str, float], now: float) -> Dict[str, float]:
+        """A refilled copy of the state, leaving the stored one untouched"""
+        current = dict(state)
+        cls._refill(current, now)
+        return current
+
+    @staticmethod
+    def _refill(state: Dict[str, float], now: float) -> None:
+        if not state["rpm"] and not state["tpm"]:
+            # Nothing to refill until the limits are known
+            return
+        elapsed = max(0.0, now - state["updated_at"])
+        state["updated_at"] = now
+        if state["rpm"]:
+            state["requests"] = min(state["rpm"], state["requests"] + elapsed * state["rpm"] / 60)
+        if state["tpm"]:
+            state["tokens"] = min(state["tpm"], state["tokens"] + elapsed * state["tpm"] / 60)
+
+    def _slot_free(self) -> bool:
+        with self._lock:
+            return self.in_flight < self.max_in_flight
+
+    def _taker(self, tokens: int) -> Callable[[Dict[str, float]], Tuple[float, Optional[str]]]:
+        """Update taking one request and `tokens` from the buckets, or returning how long to wait and why"""
+        def take(state: Dict[str, float]) -> Tuple[float, Optional[str]]:
+            now = time.time()
+            if state["paused_until"] > now:
+                return state["paused_until"] - now, "paused"
+            # A caller that has to wait leaves the stored state alone, so polling writes nothing
+            current = self._refilled(state, now)
+            if current["rpm"] and current["requests"] < 1:
+                return (1 - current["requests"]) * 60 / current["rpm"], "requests"
+            # A request larger than the whole bucket only waits for a full bucket
+            needed = min(tokens, current["tpm"]) if current["tpm"] else 0
+            if needed and current["tokens"] < needed:
+                return (needed - current["tokens"]) * 60 / current["tpm"], "tokens"
+            state.update(current)
+            if state["rpm"]:
+                state["requests"] -= 1
+            if state["tpm"]:
+                state["tokens"] -= tokens
+            return 0.0, None
+
+        return take
+
+    def _occupy_slot(self) -> bool:
+        """Count a call that got its budget as in flight; False when another caller filled the last slot meanwhile"""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            self.calls += 1
+        LIMITER_IN_FLIGHT.inc()
+        return True
+
+    def _try_take(self, tokens: int) -> Tuple[float, Optional[str]]:
+        """Take one request and `tokens` from the buckets, or return how long to wait and why"""
+        if not self._slot_free():
+            return POLL_SECONDS, "concurrency"
+        wait, reason = self.store.transact(self._taker(tokens))
+        if reason is None and not self._occupy_slot():
+            # Give the budget back
+            self.store.transact(lambda state: self._refund(state, tokens))
+            return POLL_SECONDS, "concurrency"
+        return wait, reason
+
+    async def _atry_take(self, tokens: int) -> Tuple[float, Optional[str]]:
+        """_try_take with the store transactions kept off the event loop"""
+        if not self._slot_free():
+            return POLL_SECONDS, "concurrency"
+        wait, reason = await self.store.atransact(self._taker(tokens))
+        if reason is None and not self._occupy_slot():
+            await self.store.atransact(lambda state: self._refund(state, tokens))
+            return POLL_SECONDS, "concurrency"
+        return wait, reason
+
+    @staticmethod
+    def _refund(state: Dict[str, float], tokens: int) -> None:
+        if state["rpm"]:
+            state["requests"] = min(state["rpm"], state["requests"] + 1)
+        if state["tpm"]:
+            state["tokens"] = min(state["tpm"], state["tokens"] + tokens)
+
+    def _record_throttle(self, reason: str) -> None:
+        with self._lock:
+            self.throttled[reason] = self.throttled.get(reason, 0) + 1
+        LIMITER_THROTTLED.labels(reason).inc()
+
+    def _enter_queue(self) -> None:
+        with self._lock:
+            self.waiting += 1
+        LIMITER_WAITING.inc()
+
+    def _leave_queue(self) -> None:
+        with self._lock:
+            self.waiting -= 1
+        LIMITER_WAITING.dec()
+
+    def queue_deadline(self) -> float:
+        """Monotonic time a request may wait in line until: queue_timeout, or sooner if its attempt ends first"""
+        deadline = time.monotonic() + self.queue_timeout
+        attempt_ends = _attempt_deadline.get()
+        return deadline if attempt_ends is None else min(deadline, attempt_ends)
+
+    def _timeout(self, waited: float) -> RateLimitTimeout:
+        with self._lock:
+            self.queue_timeouts += 1
+        LIMITER_QUEUE_TIMEOUTS.inc()
+        return RateLimitTimeout(f"No OpenAI rate-limit slot within {waited:.1f}s")
+
+    def _finish_wait(self, waited: float) -> None:
+        with self._lock:
+            self.total_wait_seconds += waited
+        LIMITER_QUEUE_WAIT_SECONDS.observe(waited)
+
+    async def acquire(self, tokens: int, deadline: float) -> None:
+        """Wait (without blocking the event loop) until the call may start or the deadline passes"""
+        started = time.monotonic()
+        first = True
+        self._enter_queue()
+        try:
+            while True:
+                wait, reason = await self._atry_take(tokens)
+                if reason is None:
+                    self._finish_wait(time.monotonic() - started)
+                    return
+                if first:
+                    self._record_throttle(reason)
+                    first = False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timeout(time.monotonic() - started)
+                await asyncio.sleep(min(wait, remaining))
+        finally:
+            self._leave_queue()
+
+    def acquire_sync(self, tokens: int, deadline: float) -> None:
+        """Blocking variant of acquire for the synchronous client"""
+        started = time.monotonic()
+        first = True
+        self._enter_queue()
+        try:
+            while True:
+                wait, reason = self._try_take(tokens)
+                if reason is None:
+                    self._finish_wait(time.monotonic() - started)
+                    return
+                if first:
+                    self._record_throttle(reason)
+                    first = False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timeout(time.monotonic() - started)
+                time.sleep(min(wait, remaining))
+        finally:
+            self._leave_queue()
+
+    def release(self) -> None:
+        """Free the in-flight slot taken by acquire"""
+        with self._lock:
+            self.in_flight -= 1
+        LIMITER_IN_FLIGHT.dec()
+
+    def on_response(self, headers: httpx.Headers, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """Reconcile the token estimate and adapt the buckets to the API's rate-limit headers"""
+        self.store.transact(self._adapter(headers, estimated_tokens, used_tokens))
+
+    async def aon_response(self, headers: httpx.Headers, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """on_response with the store transaction kept off the event loop"""
+        await self.store.atransact(self._adapter(headers, estimated_tokens, used_tokens))
+
+    def _adapter(
+        self,
+        headers: httpx.Headers,
+        estimated_tokens: int,
+        used_tokens: Optional[int]
+    ) -> Callable[[Dict[str, float]], None]:
+        limit_requests = _header_float(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header_float(headers, "x-ratelimit-limit-tokens")
+        remaining_requests = _header_float(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_float(headers, "x-ratelimit-remaining-tokens")
+
+        def adapt(state: Dict[str, float]) -> None:
+            self._refill(state, time.time())
+            state["backoff"] = 0.0
+            if self.learn_limits:
+                if limit_requests and not state["rpm"]:
+                    state["rpm"] = state["requests"] = limit_requests
+                if limit_tokens and not state["tpm"]:
+                    state["tpm"] = state["tokens"] = limit_tokens
+            if used_tokens is not None and state["tpm"]:
+                state["tokens"] -= used_tokens - estimated_tokens
+            # The API's view is authoritative when it has less budget left than we think
+            if remaining_requests is not None and state["rpm"]:
+                state["requests"] = min(state["requests"], remaining_requests)
+            if remaining_tokens is not None and state["tpm"]:
+                state["tokens"] = min(state["tokens"], remaining_tokens)
+
+        return adapt
+
+    def on_rate_limited(self, headers: httpx.Headers) -> float:
+        """Pause every caller after a 429, honouring retry-after or the reset headers; returns the pause"""
+        return self.store.transact(self._pauser(headers))
+
+    async def aon_rate_limited(self, headers: httpx.Headers) -> float:
+        """on_rate_limited with the store transaction kept off the event loop"""
+        return await self.store.atransact(self._pauser(headers))
+
+    def _pauser(self, headers: httpx.Headers) -> Callable[[Dict[str, float]], float]:
+        with self._lock:
+            self.rate_limited += 1
+        LIMITER_RATE_LIMITED.inc()
+        hint = (
+            (_header_float(headers, "retry-after-ms") or 0) / 1000
+            or _header_float(headers, "retry-after")
+            or max(
+                parse_reset(headers.get("x-ratelimit-reset-requests")) or 0,
+                parse_reset(headers.get("x-ratelimit-reset-tokens")) or 0
+            )
+        )
+
+        def pause(state: Dict[str, float]) -> float:
+            now = time.time()
+            if hint:
+                delay = hint
+            else:
+                delay = min(MAX_BACKOFF_SECONDS, max(BASE_BACKOFF_SECONDS, state["backoff"] * 2))
+                state["backoff"] = delay
+            state["paused_until"] = max(state["paused_until"], now + delay)
+            state["requests"] = min(state["requests"], 0.0)
+            return delay
+
+        return pause
+
+    def stats(self) -> Dict[str, Any]:
+        """Budget levels, queue and throttle counters"""
+        state = self.store.transact(lambda state: self._refilled(state, time.time()))
+        with self._lock:
+            return {
+                "requests_per_minute": state["rpm"],
+                "tokens_per_minute": state["tpm"],
+                "requests_available": round(state["requests"], 2),
+                "tokens_available": round(state["tokens"]),
+                "paused_for_seconds": round(max(0.0, state["paused_until"] - time.time()), 3),
+                "shared": isinstance(self.store, SQLiteBucketStore),
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "calls": self.calls,
+                "throttled": dict(self.throttled),
+                "rate_limited_responses": self.rate_limited,
+                "queue_timeouts": self.queue_timeouts,
+                "avg_wait_seconds": self.total_wait_seconds / self.calls if self.calls else 0.0
+            }
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def _used_tokens(response: httpx.Response) -> Optional[int]:
+    try:
+        return int(response.json()["usage"]["total_tokens"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class RateLimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that passes every OpenAI request through a RateLimiter.
+
+    A 429 response pauses the limiter and the request is retried from the
+    queue until its deadline, so throttling turns into waiting rather than a
+    failed classification. The deadline is queue_timeout, cut short by the
+    call policy's attempt deadline so a request never waits past the
+    attempt (or the classification) it belongs to.
+    """
+
+    def __init__(self, wrapped: httpx.AsyncBaseTransport, limiter: RateLimiter):
+        self.wrapped = wrapped
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tokens, streaming = estimate_tokens(request.content)
+        deadline = self.limiter.queue_deadline()
+        while True:
+            await self.limiter.acquire(tokens, deadline)
+            try:
+                response = await self.wrapped.handle_async_request(request)
+                if not streaming:
+                    await response.aread()
+            finally:
+                self.limiter.release()
+
+            if response.status_code == 429:
+                delay = await self.limiter.aon_rate_limited(response.headers)
+                if time.monotonic() + delay < deadline:
+                    await response.aclose()
+                    continue
+                return response
+            if not streaming and response.status_code < 400:
+                await self.limiter.aon_response(response.headers, tokens, _used_tokens(response))
+            return response
+
+    async def aclose(self) -> None:
+        await self.wrapped.aclose()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """Synchronous counterpart of RateLimitedAsyncTransport"""
+
+    def __init__(self, wrapped: httpx.BaseTransport, limiter: RateLimiter):
+        self.wrapped = wrapped
+        self.limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tokens, streaming = estimate_tokens(request.content)
+        deadline = self.limiter.queue_deadline()
+        while True:
+            self.limiter.acquire_sync(tokens, deadline)
+            try:
+                response = self.wrapped.handle_request(request)
+                if not streaming:
+                    response.read()
+            finally:
+                self.limiter.release()
+
+            if response.status_code == 429:
+                delay = self.limiter.on_rate_limited(response.headers)
+                if time.monotonic() + delay < deadline:
+                    response.close()
+                    continue
+                return response
+            if not streaming and response.status_code < 400:
+                self.limiter.on_response(response.headers, tokens, _used_tokens(response))
+            return response
+
+    def close(self) -> None:
+        self.wrapped.close()
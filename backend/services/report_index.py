@@ -0,0 +1,892 @@
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .ranking import RankedSet
+import config
+
+# Web Mercator stops at this latitude; points beyond it are clamped into the edge tiles
+MAX_LATITUDE = 85.05112878
+
+# Cluster cells are this many zoom levels finer than the map zoom: 4x4 cells (~64 px) per 256 px tile
+CLUSTER_CELL_SHIFT = 2
+
+# A bbox may cover at most this many cluster cells, so one request cannot aggregate the whole table
+MAX_CLUSTER_CELLS = 16384
+
+# Relative cost per row visited (measured with SQLite 3.40) of walking the reports table,
+# reading ids from the R*Tree, and reading them with their row joined for filtering
+SCAN_ROW_COST = 1.0
+SEARCH_ID_COST = 0.5
+SEARCH_JOIN_COST = 5.0
+
+# Lookups of existing rows are chunked below SQLite's bound-parameter limit
+_CHUNK = 500
+
+# Longest span of days one GET /stats/days request may cover
+MAX_DAY_RANGE = 366
+
+# (west, south, east, north) in degrees
+BBox = Tuple[float, float, float, float]
+
+
+class InvalidQueryError(ValueError):
+    """Raised for a bbox, zoom or cursor the index cannot answer"""
+
+
+def parse_bbox(value: str) -> BBox:
+    """Parse "west,south,east,north" (lng/lat degrees, as in GeoJSON and Leaflet's toBBoxString)"""
+    try:
+        west, south, east, north = (float(part) for part in value.split(","))
+    except ValueError:
+        raise InvalidQueryError("bbox must be four comma-separated numbers: west,south,east,north")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise InvalidQueryError("bbox must satisfy -180 <= west <= east <= 180 and -90 <= south <= north <= 90")
+    return west, south, east, north
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    """Slippy-map (Web Mercator) tile containing a point at a zoom level"""
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    sin = math.sin(math.radians(lat))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def severity_band(severity: Optional[int]) -> int:
+    """10-point severity band (0, 10, ... 90; 100 falls in 90), or -1 when there is no severity"""
+    if severity is None:
+        return -1
+    return min(max(int(severity), 0), 99) // 10 * 10
+
+
+def _band_label(band: int) -> str:
+    if band < 0:
+        return "unscored"
+    return "90-100" if band == 90 else f"{band}-{band + 9}"
+
+
+def _summarize(rows: Iterable[tuple]) -> Dict[str, Any]:
+    """Count, per-category counts, mean severity and severity histogram from (category, band, count, severity_sum) rows"""
+    count = rated = severity_sum = 0
+    categories: Dict[str, int] = {}
+    bands: Dict[int, int] = {}
+    for category, band, band_count, band_severity in rows:
+        count += band_count
+        categories[category] = categories.get(category, 0) + band_count
+        bands[band] = bands.get(band, 0) + band_count
+        if band >= 0:
+            rated += band_count
+            severity_sum += band_severity
+    return {
+        "count": count,
+        "categories": categories,
+        "mean_severity": round(severity_sum / rated, 1) if rated else None,
+        "severity_histogram": {_band_label(band): bands[band] for band in sorted(bands) if bands[band]}
+    }
+
+
+class ReportIndex:
+    """
+    Spatial index of classified reports for the live map.
+
+    Points live in SQLite: a plain table keyed by report_id, mirrored by
+    triggers into an R*Tree for bounding-box lookups. Next to it, a
+    summary table keeps per-cell counts for every slippy-map zoom level up
+    to max_zoom, split by category and 10-point severity band, with
+    coordinate sums for the cell's centroid. Upserts and deletes apply
+    their +1/-1 deltas to those cells, so cluster queries at low zoom read
+    a few hundred pre-aggregated rows instead of the reports themselves.
+
+    Bounding-box queries page newest first with an id cursor. The cell
+    counts also estimate how many reports a query matches: sparse matches
+    are fetched through the R*Tree, dense ones by walking the table in id
+    order, which stops after one page instead of sorting every match.
+
+    The same writes maintain the dashboard rollups: per-day counts by
+    category and severity band, and per-author report counts, with the
+    authors also kept in a RankedSet for O(log n) leaderboard ranks. Totals
+    and per-region figures are the zoom-0 and region_zoom cells. Reading
+    any of them costs the same however many reports there are.
+
+    A version counter in report_meta is bumped inside every write
+    transaction, so it is shared by all processes using the database:
+    ETags derive from it, and a process reloads its leaderboard from the
+    contributor rollup when another process has written since it last
+    looked.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        max_zoom: int = 14,
+        max_page_size: int = 500,
+        region_zoom: int = 8,
+        day_offset_minutes: int = 0
+    ):
+        if not 0 <= region_zoom <= max_zoom:
+            raise ValueError(f"region_zoom must be between 0 and max_zoom ({max_zoom})")
+        self.db_path = db_path
+        self.max_zoom = max_zoom
+        self.max_page_size = max_page_size
+        self.region_zoom = region_zoom
+        self.day_offset_minutes = day_offset_minutes
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            "id INTEGER PRIMARY KEY, report_id TEXT NOT NULL UNIQUE, lat REAL NOT NULL, lng REAL NOT NULL, "
+            "category TEXT NOT NULL, severity INTEGER, severity_level TEXT, scale TEXT, "
+            "status TEXT NOT NULL, author_id TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS reports_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);"
+            "CREATE TRIGGER IF NOT EXISTS reports_rtree_insert AFTER INSERT ON reports BEGIN "
+            "INSERT INTO reports_rtree VALUES (new.id, new.lat, new.lat, new.lng, new.lng); END;"
+            "CREATE TRIGGER IF NOT EXISTS reports_rtree_update AFTER UPDATE OF lat, lng ON reports BEGIN "
+            "UPDATE reports_rtree SET min_lat = new.lat, max_lat = new.lat, min_lng = new.lng, max_lng = new.lng "
+            "WHERE id = new.id; END;"
+            "CREATE TRIGGER IF NOT EXISTS reports_rtree_delete AFTER DELETE ON reports BEGIN "
+            "DELETE FROM reports_rtree WHERE id = old.id; END;"
+            "CREATE TABLE IF NOT EXISTS report_cells ("
+            "zoom INTEGER NOT NULL, x INTEGER NOT NULL, y INTEGER NOT NULL, category TEXT NOT NULL, "
+            "band INTEGER NOT NULL, count INTEGER NOT NULL, severity_sum INTEGER NOT NULL, "
+            "lat_sum REAL NOT NULL, lng_sum REAL NOT NULL, "
+            "PRIMARY KEY (zoom, x, y, category, band)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS report_days ("
+            "day TEXT NOT NULL, category TEXT NOT NULL, band INTEGER NOT NULL, "
+            "count INTEGER NOT NULL, severity_sum INTEGER NOT NULL, "
+            "PRIMARY KEY (day, category, band)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS report_contributors ("
+            "author_id TEXT PRIMARY KEY, reports INTEGER NOT NULL, severity_sum INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS report_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        # ETags are the database's epoch plus its write counter, so a recreated database never reuses one
+        self._db.executemany(
+            "INSERT OR IGNORE INTO report_meta (key, value) VALUES (?, ?)",
+            [("epoch", uuid.uuid4().hex[:8]), ("version", "0")]
+        )
+        self._db.commit()
+        (self._epoch,) = self._db.execute("SELECT value FROM report_meta WHERE key = 'epoch'").fetchone()
+        self._rebuild_rollups_if_stale()
+
+        self._contributors: Dict[str, Tuple[int, int]] = {}
+        self._ranking = RankedSet()
+        self._version = -1
+        self._load_ranking()
+
+    @classmethod
+    def from_config(cls) -> "ReportIndex":
+        """Build an index from the settings in config.py"""
+        return cls(
+            db_path=config.REPORT_INDEX_DB_PATH or ":memory:",
+            max_zoom=config.REPORT_CLUSTER_MAX_ZOOM,
+            max_page_size=config.REPORT_PAGE_MAX,
+            region_zoom=config.REPORT_REGION_ZOOM,
+            day_offset_minutes=config.REPORT_DAY_UTC_OFFSET_MINUTES
+        )
+
+    def _rebuild_rollups_if_stale(self) -> None:
+        """
+        Recompute the day and contributor rollups from the reports when they were
+        built for another day offset, or by a version of the index without them
+        """
+        stored = self._db.execute("SELECT value FROM report_meta WHERE key = 'day_offset_minutes'").fetchone()
+        if stored is not None and int(stored[0]) == self.day_offset_minutes:
+            return
+        with self._db:
+            self._db.execute("DELETE FROM report_days")
+            self._db.execute("DELETE FROM report_contributors")
+            self._db.execute(
+                "INSERT INTO report_days (day, category, band, count, severity_sum) "
+                "SELECT date(created_at + ?, 'unixepoch'), category, "
+                "CASE WHEN severity IS NULL THEN -1 ELSE MIN(MAX(severity, 0), 99) / 10 * 10 END, "
+                "COUNT(*), COALESCE(SUM(severity), 0) FROM reports GROUP BY 1, 2, 3",
+                (self.day_offset_minutes * 60,)
+            )
+            self._db.execute(
+                "INSERT INTO report_contributors (author_id, reports, severity_sum) "
+                "SELECT author_id, COUNT(*), COALESCE(SUM(severity), 0) FROM reports "
+                "WHERE author_id IS NOT NULL GROUP BY author_id"
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO report_meta (key, value) VALUES ('day_offset_minutes', ?)",
+                (str(self.day_offset_minutes),)
+            )
+            self._bump_version()
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        self._counts[key] = self._counts.get(key, 0) + amount
+
+    def _stored_version(self) -> int:
+        (version,) = self._db.execute("SELECT value FROM report_meta WHERE key = 'version'").fetchone()
+        return int(version)
+
+    def _bump_version(self) -> int:
+        """Advance the shared write counter; called inside the write transaction"""
+        self._db.execute("UPDATE report_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+        return self._stored_version()
+
+    def _load_ranking(self) -> None:
+        """Rebuild the leaderboard from the contributor rollup, reading both in one snapshot"""
+        with self._db:
+            self._db.execute("BEGIN")
+            version = self._stored_version()
+            contributors = self._db.execute(
+                "SELECT author_id, reports, severity_sum FROM report_contributors"
+            ).fetchall()
+        # Leaderboard order is (-reports, -severity_sum, author_id), ascending
+        self._contributors = {author_id: (reports, severity_sum) for author_id, reports, severity_sum in contributors}
+        self._ranking = RankedSet.from_sorted(sorted(
+            (-reports, -severity_sum, author_id) for author_id, (reports, severity_sum) in self._contributors.items()
+        ))
+        self._version = version
+        self._count("ranking_reloads")
+
+    def _sync_ranking(self) -> None:
+        """Reload the leaderboard if another process wrote to the database since it was built"""
+        if self._stored_version() != self._version:
+            self._load_ranking()
+
+    # --- writes ---
+
+    def _existing(self, report_ids: List[str]) -> Dict[str, tuple]:
+        """Stored (lat, lng, category, severity, author_id, created_at) per report id"""
+        rows = {}
+        for start in range(0, len(report_ids), _CHUNK):
+            chunk = report_ids[start:start + _CHUNK]
+            for report_id, *row in self._db.execute(
+                "SELECT report_id, lat, lng, category, severity, author_id, created_at FROM reports "
+                f"WHERE report_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ):
+                rows[report_id] = tuple(row)
+        return rows
+
+    def _cell_deltas(self, changes: Iterable[tuple]) -> Dict[tuple, list]:
+        """
+        Per-cell [count, severity_sum, lat_sum, lng_sum] deltas for every zoom level from
+        (lat, lng, category, severity, author_id, created_at, sign) changes. Only the finest
+        level is computed per report; each coarser level folds the one below it, which
+        shrinks as it goes.
+        """
+        level: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        for lat, lng, category, severity, _, _, sign in changes:
+            x, y = tile_xy(lat, lng, self.max_zoom)
+            delta = level[(x, y, category, severity_band(severity))]
+            delta[0] += sign
+            delta[1] += sign * (severity or 0)
+            delta[2] += sign * lat
+            delta[3] += sign * lng
+
+        deltas: Dict[tuple, list] = {}
+        for zoom in range(self.max_zoom, -1, -1):
+            parent: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0.0, 0.0])
+            for (x, y, category, band), delta in level.items():
+                deltas[(zoom, x, y, category, band)] = delta
+                folded = parent[(x >> 1, y >> 1, category, band)]
+                folded[0] += delta[0]
+                folded[1] += delta[1]
+                folded[2] += delta[2]
+                folded[3] += delta[3]
+            level = parent
+        return deltas
+
+    def _apply_cells(self, deltas: Dict[tuple, list]) -> None:
+        changed = [(*key, *delta) for key, delta in deltas.items() if any(delta)]
+        self._db.executemany(
+            "INSERT INTO report_cells (zoom, x, y, category, band, count, severity_sum, lat_sum, lng_sum) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (zoom, x, y, category, band) DO UPDATE SET "
+            "count = count + excluded.count, severity_sum = severity_sum + excluded.severity_sum, "
+            "lat_sum = lat_sum + excluded.lat_sum, lng_sum = lng_sum + excluded.lng_sum",
+            changed
+        )
+        self._db.executemany(
+            "DELETE FROM report_cells WHERE zoom = ? AND x = ? AND y = ? AND category = ? AND band = ? AND count <= 0",
+            [key for key, delta in deltas.items() if delta[0] < 0]
+        )
+
+    def _day(self, created_at: float) -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime(created_at + self.day_offset_minutes * 60))
+
+    def _rollup_deltas(self, changes: Iterable[tuple]) -> Tuple[Dict[tuple, list], Dict[str, list]]:
+        """[count, severity_sum] deltas per (day, category, band) and per author from the same changes as _cell_deltas"""
+        days: Dict[tuple, list] = defaultdict(lambda: [0, 0])
+        authors: Dict[str, list] = defaultdict(lambda: [0, 0])
+        for _, _, category, severity, author_id, created_at, sign in changes:
+            delta = days[(self._day(created_at), category, severity_band(severity))]
+            delta[0] += sign
+            delta[1] += sign * (severity or 0)
+            if author_id is not None:
+                authors[author_id][0] += sign
+                authors[author_id][1] += sign * (severity or 0)
+        return days, authors
+
+    def _apply_rollups(self, days: Dict[tuple, list], authors: Dict[str, list]) -> None:
+        self._db.executemany(
+            "INSERT INTO report_days (day, category, band, count, severity_sum) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (day, category, band) DO UPDATE SET "
+            "count = count + excluded.count, severity_sum = severity_sum + excluded.severity_sum",
+            [(*key, *delta) for key, delta in days.items() if any(delta)]
+        )
+        self._db.executemany(
+            "DELETE FROM report_days WHERE day = ? AND category = ? AND band = ? AND count <= 0",
+            [key for key, delta in days.items() if delta[0] < 0]
+        )
+        self._db.executemany(
+            "INSERT INTO report_contributors (author_id, reports, severity_sum) VALUES (?, ?, ?) "
+            "ON CONFLICT (author_id) DO UPDATE SET "
+            "reports = reports + excluded.reports, severity_sum = severity_sum + excluded.severity_sum",
+            [(author_id, *delta) for author_id, delta in authors.items() if any(delta)]
+        )
+        self._db.executemany(
+            "DELETE FROM report_contributors WHERE author_id = ? AND reports <= 0",
+            [(author_id,) for author_id, delta in authors.items() if delta[0] < 0]
+        )
+
+    def _rerank(self, authors: Dict[str, list], version: int) -> None:
+        """
+        Move changed authors in the leaderboard once their rollup rows are committed
+        as the given version, or reload it when other writes came in between
+        """
+        if version != self._version + 1:
+            self._load_ranking()
+            return
+        self._version = version
+        for author_id, (reports, severity_sum) in authors.items():
+            if not reports and not severity_sum:
+                continue
+            old_reports, old_severity = self._contributors.pop(author_id, (0, 0))
+            self._ranking.discard((-old_reports, -old_severity, author_id))
+            reports += old_reports
+            severity_sum += old_severity
+            if reports > 0:
+                self._contributors[author_id] = (reports, severity_sum)
+                self._ranking.add((-reports, -severity_sum, author_id))
+
+    def upsert_many(self, reports: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or update reports in one transaction and return how many were written.
+
+        Each report needs report_id, lat, lng and category; severity, severity_level,
+        scale, status, author_id and created_at are optional. Updating keeps the
+        stored status and author when the new values are missing, and the earliest
+        created_at.
+        """
+        now = time.time()
+        rows: Dict[str, Dict[str, Any]] = {}
+        for report in reports:
+            rows[report["report_id"]] = {
+                "report_id": report["report_id"],
+                "lat": float(report["lat"]),
+                "lng": float(report["lng"]),
+                "category": report["category"],
+                "severity": report.get("severity"),
+                "severity_level": report.get("severity_level"),
+                "scale": report.get("scale"),
+                "status": report.get("status"),
+                "author_id": report.get("author_id"),
+                "created_at": report.get("created_at") or now,
+                "updated_at": now
+            }
+        if not rows:
+            return 0
+
+        with self._lock:
+            with self._db:
+                # Take the write lock first, so the stored rows the deltas start from cannot change under us
+                self._db.execute("BEGIN IMMEDIATE")
+                existing = self._existing(list(rows))
+                removed = [(*row, -1) for row in existing.values()]
+                added = []
+                for report_id, row in rows.items():
+                    # The stored author and the earliest created_at survive an update
+                    old = existing.get(report_id)
+                    author_id = row["author_id"] if row["author_id"] is not None or old is None else old[4]
+                    created_at = row["created_at"] if old is None else min(old[5], row["created_at"])
+                    added.append((row["lat"], row["lng"], row["category"], row["severity"], author_id, created_at, 1))
+                deltas = self._cell_deltas(removed + added)
+                days, authors = self._rollup_deltas(removed + added)
+                self._db.executemany(
+                    "INSERT INTO reports (report_id, lat, lng, category, severity, severity_level, scale, "
+                    "status, author_id, created_at, updated_at) VALUES (:report_id, :lat, :lng, :category, "
+                    ":severity, :severity_level, :scale, COALESCE(:status, 'pending_verification'), :author_id, "
+                    ":created_at, :updated_at) ON CONFLICT (report_id) DO UPDATE SET lat = excluded.lat, "
+                    "lng = excluded.lng, category = excluded.category, severity = excluded.severity, "
+                    "severity_level = excluded.severity_level, scale = excluded.scale, "
+                    "status = COALESCE(:status, status), author_id = COALESCE(:author_id, author_id), "
+                    "created_at = MIN(created_at, excluded.created_at), updated_at = excluded.updated_at",
+                    list(rows.values())
+                )
+                self._apply_cells(deltas)
+                self._apply_rollups(days, authors)
+                version = self._bump_version()
+            self._rerank(authors, version)
+            self._count("upserts", len(rows))
+        return len(rows)
+
+    def upsert(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert or update one report and return it as stored"""
+        self.upsert_many([report])
+        return self.get(report["report_id"])
+
+    def delete(self, report_id: str) -> bool:
+        """Remove a report (e.g. rejected on reclassification); False if it was not indexed"""
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                existing = self._existing([report_id])
+                if not existing:
+                    return False
+                removed = [(*existing[report_id], -1)]
+                deltas = self._cell_deltas(removed)
+                days, authors = self._rollup_deltas(removed)
+                self._db.execute("DELETE FROM reports WHERE report_id = ?", (report_id,))
+                self._apply_cells(deltas)
+                self._apply_rollups(days, authors)
+                version = self._bump_version()
+            self._rerank(authors, version)
+            self._count("deletes")
+        return True
+
+    def index_result(
+        self,
+        report_id: str,
+        result: Dict[str, Any],
+        lat: float,
+        lng: float,
+        author_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Index a report's classification; a "reject" verdict removes it from the map instead"""
+        if result.get("category", "reject") == "reject":
+            self.delete(report_id)
+            return None
+        return self.upsert({
+            "report_id": report_id,
+            "lat": lat,
+            "lng": lng,
+            "category": result["category"],
+            "severity": result.get("severity"),
+            "severity_level": result.get("severity_level"),
+            "scale": result.get("scale"),
+            "author_id": author_id
+        })
+
+    # --- reads ---
+
+    _COLUMNS = (
+        "id", "report_id", "lat", "lng", "category", "severity", "severity_level", "scale",
+        "status", "author_id", "created_at", "updated_at"
+    )
+
+    def _record(self, row: tuple) -> Dict[str, Any]:
+        record = dict(zip(self._COLUMNS, row))
+        record.pop("id")
+        return record
+
+    def get(self, report_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM reports WHERE report_id = ?", (report_id,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def _cell_range(self, bbox: BBox, zoom: int) -> Tuple[int, int, int, int]:
+        west, south, east, north = bbox
+        x0, y0 = tile_xy(north, west, zoom)
+        x1, y1 = tile_xy(south, east, zoom)
+        return x0, x1, y0, y1
+
+    def _cell_filter(self, category: Optional[str], min_severity: Optional[int]) -> Tuple[List[str], list]:
+        conditions, params = [], []
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if min_severity is not None:
+            conditions.append("band >= ?")
+            params.append(severity_band(min_severity))
+        return conditions, params
+
+    def estimate(
+        self,
+        bbox: BBox,
+        category: Optional[str] = None,
+        min_severity: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """
+        Upper bounds on the reports inside a bbox and on those also matching the
+        filters, from the cells of the coarsest level that resolves the bbox into
+        at least 8x8 cells (or the finest stored level for smaller boxes).
+        """
+        west, south, east, north = bbox
+        span = max(east - west, 1e-9)
+        zoom = min(max(0, math.ceil(math.log2(360.0 * 8 / span))), self.max_zoom)
+        x0, x1, y0, y1 = self._cell_range(bbox, zoom)
+        conditions, params = self._cell_filter(category, min_severity)
+        matching = f"SUM(CASE WHEN {' AND '.join(conditions)} THEN count ELSE 0 END)" if conditions else "SUM(count)"
+        with self._lock:
+            inside, matches = self._db.execute(
+                f"SELECT COALESCE(SUM(count), 0), COALESCE({matching}, 0) FROM report_cells "
+                "WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?",
+                [*params, zoom, x0, x1, y0, y1]
+            ).fetchone()
+        return inside, matches
+
+    def _scan(self, bbox: BBox, filters: List[str], values: list, below: Optional[int], floor: Optional[int], count: int) -> List[tuple]:
+        """Walk the table newest first, checking every row against the bbox and filters"""
+        west, south, east, north = bbox
+        conditions = ["lat BETWEEN ? AND ?", "lng BETWEEN ? AND ?", *filters]
+        params = [south, north, west, east, *values]
+        if below is not None:
+            conditions.append("id < ?")
+            params.append(below)
+        if floor is not None:
+            conditions.append("id >= ?")
+            params.append(floor)
+        return self._db.execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM reports WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT ?",
+            [*params, count]
+        ).fetchall()
+
+    def _search(self, bbox: BBox, filters: List[str], values: list, below: Optional[int], count: int) -> List[tuple]:
+        """Collect the R*Tree's hits in the bbox, newest first; rows are only read to apply filters or for the page"""
+        west, south, east, north = bbox
+        conditions = ["t.min_lat <= ?", "t.max_lat >= ?", "t.min_lng <= ?", "t.max_lng >= ?"]
+        params = [north, south, east, west]
+        if below is not None:
+            conditions.append("t.id < ?")
+            params.append(below)
+        if filters:
+            # Filters need each hit's row; join it and sort only the ids that pass
+            conditions.extend(f"r.{condition}" for condition in filters)
+            ids = self._db.execute(
+                "SELECT r.id FROM reports_rtree t JOIN reports r ON r.id = t.id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY r.id DESC LIMIT ?",
+                [*params, *values, count]
+            ).fetchall()
+        else:
+            ids = self._db.execute(
+                f"SELECT t.id FROM reports_rtree t WHERE {' AND '.join(conditions)} ORDER BY t.id DESC LIMIT ?",
+                [*params, count]
+            ).fetchall()
+        if not ids:
+            return []
+        return self._db.execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM reports WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id DESC",
+            [row[0] for row in ids]
+        ).fetchall()
+
+    def query(
+        self,
+        bbox: BBox,
+        category: Optional[str] = None,
+        min_severity: Optional[int] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Reports inside a bbox, newest first, one page at a time.
+
+        Pass the returned next_cursor back to get the following page; it is
+        None on the last page. Filters are exact; bbox edges are exact to the
+        R*Tree's single precision (well under a metre).
+        """
+        limit = max(1, min(limit, self.max_page_size))
+        before = None
+        if cursor:
+            try:
+                before = int(cursor)
+            except ValueError:
+                raise InvalidQueryError("cursor must be a value returned as next_cursor")
+
+        filters, values = [], []
+        if category:
+            filters.append("category = ?")
+            values.append(category)
+        if min_severity is not None:
+            filters.append("severity >= ?")
+            values.append(min_severity)
+
+        # Walking the table newest first visits about limit * total / matches rows, the
+        # R*Tree visits every report inside the bbox; the cell counts say which is cheaper.
+        # They are upper bounds, so the walk gives up after a few times the expected rows
+        # and the R*Tree fills the rest of the page below the point where it stopped.
+        inside, matches = self.estimate(bbox, category, min_severity)
+        total = self.count()
+        scan_cost = SCAN_ROW_COST * limit * total / max(matches, 1)
+        search_cost = (SEARCH_JOIN_COST if filters else SEARCH_ID_COST) * inside
+        scan = scan_cost < search_cost
+        with self._lock:
+            if scan:
+                budget = 4 * limit * total // max(matches, 1)
+                floor_row = self._db.execute(
+                    "SELECT id FROM reports" + (" WHERE id < ?" if before is not None else "")
+                    + " ORDER BY id DESC LIMIT 1 OFFSET ?",
+                    [before, budget] if before is not None else [budget]
+                ).fetchone()
+                floor = floor_row[0] if floor_row else None
+                rows = self._scan(bbox, filters, values, before, floor, limit + 1)
+                if len(rows) <= limit and floor is not None:
+                    rows += self._search(bbox, filters, values, floor, limit + 1 - len(rows))
+                    self._count("queries_fallback")
+            else:
+                rows = self._search(bbox, filters, values, before, limit + 1)
+            self._count("queries_scan" if scan else "queries_rtree")
+
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        reports = [self._record(row) for row in rows[:limit]]
+        return {"reports": reports, "count": len(reports), "next_cursor": next_cursor}
+
+    def clusters(
+        self,
+        bbox: BBox,
+        zoom: int,
+        category: Optional[str] = None,
+        min_severity: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Cluster summaries for a map view: one entry per non-empty cell of a grid
+        CLUSTER_CELL_SHIFT levels finer than the map zoom, with its count,
+        centroid, per-category counts, mean severity and the highest 10-point
+        severity band present (e.g. 80 for 80-100).
+
+        Read from the pre-aggregated cells only. min_severity is applied per
+        band, so it is exact for multiples of 10 and otherwise rounds down.
+        """
+        max_map_zoom = self.max_zoom - CLUSTER_CELL_SHIFT
+        if not 0 <= zoom <= max_map_zoom:
+            raise InvalidQueryError(
+                f"Clusters are available for zoom 0-{max_map_zoom}; query individual reports above that"
+            )
+        cell_zoom = zoom + CLUSTER_CELL_SHIFT
+        x0, x1, y0, y1 = self._cell_range(bbox, cell_zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_CLUSTER_CELLS:
+            raise InvalidQueryError(f"bbox covers more than {MAX_CLUSTER_CELLS} cells at zoom {zoom}; zoom in or shrink it")
+
+        conditions, params = self._cell_filter(category, min_severity)
+        # Bands are summed away in SQL; only one row per cell and category reaches Python
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT x, y, category, SUM(count), SUM(severity_sum), "
+                "SUM(CASE WHEN band >= 0 THEN count ELSE 0 END), SUM(lat_sum), SUM(lng_sum), MAX(band) "
+                "FROM report_cells WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?"
+                f"{''.join(' AND ' + condition for condition in conditions)} GROUP BY x, y, category",
+                [cell_zoom, x0, x1, y0, y1, *params]
+            ).fetchall()
+            self._count("cluster_queries")
+
+        cells: Dict[Tuple[int, int], list] = {}
+        for x, y, row_category, count, severity_sum, rated, lat_sum, lng_sum, max_band in rows:
+            cell = cells.get((x, y))
+            if cell is None:
+                cell = cells[(x, y)] = [0, 0, 0, 0.0, 0.0, -1, {}]
+            cell[0] += count
+            cell[1] += severity_sum
+            cell[2] += rated
+            cell[3] += lat_sum
+            cell[4] += lng_sum
+            cell[5] = max(cell[5], max_band)
+            cell[6][row_category] = count
+
+        clusters = []
+        for (x, y), (count, severity_sum, rated, lat_sum, lng_sum, max_band, categories) in cells.items():
+            if count <= 0:
+                continue
+            clusters.append({
+                "x": x,
+                "y": y,
+                "count": count,
+                "lat": round(lat_sum / count, 6),
+                "lng": round(lng_sum / count, 6),
+                "categories": categories,
+                "mean_severity": round(severity_sum / rated, 1) if rated else None,
+                "max_severity_band": max_band if max_band >= 0 else None
+            })
+        clusters.sort(key=lambda cell: cell["count"], reverse=True)
+        return {
+            "zoom": zoom,
+            "cell_zoom": cell_zoom,
+            "clusters": clusters,
+            "total": sum(cell["count"] for cell in clusters)
+        }
+
+    # --- dashboard rollups ---
+
+    def etag(self) -> str:
+        """Quoted ETag that changes with every write to the index, by any process"""
+        with self._lock:
+            version = self._stored_version()
+        return f'"{self._epoch}-{version}"'
+
+    def summary(self) -> Dict[str, Any]:
+        """Report count, mean severity and severity histogram overall and per category, plus the contributor count"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT category, band, count, severity_sum FROM report_cells WHERE zoom = 0 ORDER BY category, band"
+            ).fetchall()
+            self._sync_ranking()
+            contributors = len(self._ranking)
+            self._count("rollup_queries")
+        by_category: Dict[str, List[tuple]] = defaultdict(list)
+        for row in rows:
+            by_category[row[0]].append(row)
+        summary = _summarize(rows)
+        summary["by_category"] = {}
+        for category, category_rows in by_category.items():
+            rollup = _summarize(category_rows)
+            del rollup["categories"]
+            summary["by_category"][category] = rollup
+        summary["contributors"] = contributors
+        return summary
+
+    def regions(self, category: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Rollups per region, busiest first. A region is a slippy-map tile at
+        region_zoom (about 150 km across at zoom 8), named "zoom/x/y".
+        """
+        conditions, params = self._cell_filter(category, None)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT x, y, category, band, count, severity_sum, lat_sum, lng_sum FROM report_cells "
+                f"WHERE zoom = ?{''.join(' AND ' + condition for condition in conditions)}",
+                [self.region_zoom, *params]
+            ).fetchall()
+            self._count("rollup_queries")
+
+        cells: Dict[Tuple[int, int], list] = defaultdict(lambda: [[], 0.0, 0.0])
+        for x, y, row_category, band, count, severity_sum, lat_sum, lng_sum in rows:
+            cell = cells[(x, y)]
+            cell[0].append((row_category, band, count, severity_sum))
+            cell[1] += lat_sum
+            cell[2] += lng_sum
+
+        regions = []
+        for (x, y), (cell_rows, lat_sum, lng_sum) in cells.items():
+            rollup = _summarize(cell_rows)
+            if rollup["count"] <= 0:
+                continue
+            regions.append({
+                "region": f"{self.region_zoom}/{x}/{y}",
+                "lat": round(lat_sum / rollup["count"], 4),
+                "lng": round(lng_sum / rollup["count"], 4),
+                **rollup
+            })
+        regions.sort(key=lambda region: region["count"], reverse=True)
+        total = len(regions)
+        if limit is not None:
+            regions = regions[:max(1, min(limit, self.max_page_size))]
+        return {"zoom": self.region_zoom, "regions": regions, "total": total}
+
+    def days(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Rollups per day from start to end inclusive (YYYY-MM-DD, in the index's
+        day offset), one entry per day including empty ones. Defaults to the
+        30 days ending today.
+        """
+        try:
+            last = date.fromisoformat(end) if end else date.fromisoformat(self._day(time.time()))
+            first = date.fromisoformat(start) if start else last - timedelta(days=29)
+        except ValueError:
+            raise InvalidQueryError("start and end must be dates formatted YYYY-MM-DD")
+        if first > last:
+            raise InvalidQueryError("start must not be after end")
+        if (last - first).days >= MAX_DAY_RANGE:
+            raise InvalidQueryError(f"At most {MAX_DAY_RANGE} days per request")
+
+        conditions, params = self._cell_filter(category, None)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT day, category, band, count, severity_sum FROM report_days WHERE day BETWEEN ? AND ?"
+                f"{''.join(' AND ' + condition for condition in conditions)}",
+                [first.isoformat(), last.isoformat(), *params]
+            ).fetchall()
+            self._count("rollup_queries")
+
+        by_day: Dict[str, List[tuple]] = defaultdict(list)
+        for day, *row in rows:
+            by_day[day].append(tuple(row))
+        days = []
+        for offset in range((last - first).days + 1):
+            day = (first + timedelta(days=offset)).isoformat()
+            days.append({"day": day, **_summarize(by_day.get(day, ()))})
+        return {
+            "start": first.isoformat(),
+            "end": last.isoformat(),
+            "utc_offset_minutes": self.day_offset_minutes,
+            "days": days
+        }
+
+    def leaderboard(self, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        """Top contributors by indexed reports (ties broken by total severity), from the given 0-based rank"""
+        limit = max(1, min(limit, self.max_page_size))
+        offset = max(0, offset)
+        with self._lock:
+            self._sync_ranking()
+            entries = []
+            for rank, (reports, severity_sum, author_id) in enumerate(self._ranking.iter_from(offset), offset + 1):
+                entries.append({"rank": rank, "author_id": author_id, "reports": -reports, "severity_sum": -severity_sum})
+                if len(entries) == limit:
+                    break
+            total = len(self._ranking)
+            self._count("rollup_queries")
+        return {"contributors": entries, "total": total}
+
+    def contributor(self, author_id: str) -> Optional[Dict[str, Any]]:
+        """An author's leaderboard rank and report totals, or None if none of their reports is indexed"""
+        with self._lock:
+            self._sync_ranking()
+            totals = self._contributors.get(author_id)
+            if totals is None:
+                return None
+            reports, severity_sum = totals
+            rank = self._ranking.rank((-reports, -severity_sum, author_id)) + 1
+            total = len(self._ranking)
+            self._count("rollup_queries")
+        return {"author_id": author_id, "rank": rank, "reports": reports, "severity_sum": severity_sum, "total": total}
+
+    def count(self) -> int:
+        """Indexed reports, read from the single zoom-0 cell rows"""
+        with self._lock:
+            (total,) = self._db.execute("SELECT COALESCE(SUM(count), 0) FROM report_cells WHERE zoom = 0").fetchone()
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Indexed reports, summary cells and query counters by access path"""
+        with self._lock:
+            (cells,) = self._db.execute("SELECT COUNT(*) FROM report_cells").fetchone()
+            self._sync_ranking()
+            counts = dict(self._counts)
+        return {
+            "reports": self.count(),
+            "cells": cells,
+            "max_zoom": self.max_zoom,
+            "region_zoom": self.region_zoom,
+            "contributors": len(self._ranking),
+            "version": self._version,
+            "upserts": counts.get("upserts", 0),
+            "deletes": counts.get("deletes", 0),
+            "queries_rtree": counts.get("queries_rtree", 0),
+            "queries_scan": counts.get("queries_scan", 0),
+            "queries_fallback": counts.get("queries_fallback", 0),
+            "cluster_queries": counts.get("cluster_queries", 0),
+            "rollup_queries": counts.get("rollup_queries", 0),
+            "ranking_reloads": counts.get("ranking_reloads", 0)
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import config
+
+
+class ResultCache:
+    """
+    Content-addressed cache for classification results.
+
+    Entries live in a bounded in-memory LRU with a TTL. An optional SQLite
+    tier persists them across restarts and lets several uvicorn workers
+    share one cache file.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 86400,
+        db_path: Optional[str] = None,
+        namespace: str = ""
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.namespace = namespace
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if db_path:
+            self._db = self._open_db(db_path)
+
+    @classmethod
+    def from_config(cls) -> "ResultCache":
+        """Build a cache from the settings in config.py"""
+        return cls(
+            max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.RESULT_CACHE_TTL_SECONDS,
+            db_path=config.RESULT_CACHE_DB_PATH or None,
+            namespace=f"{config.OPENAI_MODEL}:{config.PROMPT_VERSION}"
+        )
+
+    @staticmethod
+    def _open_db(db_path: str) -> sqlite3.Connection:
+        """Open the persistent tier in WAL mode so several processes can share it"""
+        db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS classification_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        db.commit()
+        return db
+
+    def make_key(self, image_base64: str, variant: str = "") -> str:
+        """
+        Derive the cache key from the normalized image.
+
+        The base64 payload is a deterministic encoding of the normalized JPEG
+        bytes, so hashing it directly avoids a decode. The namespace carries
+        the model name and prompt version so a prompt change misses old entries;
+        the variant separates results produced by different graph modes.
+        """
+        digest = hashlib.sha256()
+        digest.update(self.namespace.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(variant.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_base64.encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a result in memory, then in the persistent tier"""
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+
+        value = self._get_disk(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a result in memory and in the persistent tier"""
+        now = time.time()
+        self._set_memory(key, value, now)
+        self._set_disk(key, value, now)
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Async lookup; the SQLite tier is queried in a worker thread"""
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+
+        if self._db is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+            if value is not None:
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        """Async store; the SQLite tier is written in a worker thread"""
+        now = time.time()
+        self._set_memory(key, value, now)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, value, now)
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, created_at = entry
+            if time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return dict(value)
+
+    def _set_memory(self, key: str, value: Dict[str, Any], created_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (dict(value), created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM classification_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        value_json, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            with self._db_lock:
+                self._db.execute("DELETE FROM classification_cache WHERE key = ?", (key,))
+                self._db.commit()
+            with self._lock:
+                self.expirations += 1
+            return None
+
+        value = json.loads(value_json)
+        # Promote to memory so the next lookup stays in-process
+        self._set_memory(key, value, created_at)
+        with self._lock:
+            self.disk_hits += 1
+        return value
+
+    def _set_disk(self, key: str, value: Dict[str, Any], created_at: float) -> None:
+        if self._db is None:
+            return
+
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO classification_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), created_at)
+            )
+            self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from both tiers and return how many were removed"""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+
+        with self._lock:
+            expired = [key for key, (_, created_at) in self._entries.items() if created_at < cutoff]
+            for key in expired:
+                del self._entries[key]
+            removed += len(expired)
+            self.expirations += len(expired)
+
+        if self._db is not None:
+            with self._db_lock:
+                cursor = self._db.execute(
+                    "DELETE FROM classification_cache WHERE created_at < ?", (cutoff,)
+                )
+                self._db.commit()
+            removed += cursor.rowcount
+
+        return removed
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM classification_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for monitoring"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self._db is not None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+    def close(self) -> None:
+        """Close the persistent tier"""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
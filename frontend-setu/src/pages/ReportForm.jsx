@@ -16,8 +16,11 @@ import Navbar from "../components/Navbar";
 import MapDisplay from "../components/MapDisplay";
 import "../styles/ReportForm.css";
 
-// Your Render ML API Endpoint
-const ML_API_URL = "https://setu-backend-ghi8.onrender.com/classify";
+// Your Render ML API Endpoint (batch variant classifies every photo of the report)
+const ML_API_URL = "https://setu-backend-ghi8.onrender.com/classify-batch";
+// Deadline per photo (sent to the API) and for the whole request (enforced here)
+const ML_PHOTO_TIMEOUT_SECONDS = 45;
+const ML_REQUEST_TIMEOUT_MS = 120000;
 
 const ReportForm = () => {
   const { user } = useAuth();
@@ -106,11 +109,28 @@ const ReportForm = () => {
       });
 
       setLoadingMessage("Analyzing incident with AI...");
-      const firstPhotoURL = photoURLs[0];
       const mlResponse = await fetch(ML_API_URL, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ image_url: firstPhotoURL }),
+        headers: {
+          "Content-Type": "application/json",
+          "X-Request-Timeout": String(ML_PHOTO_TIMEOUT_SECONDS),
+        },
+        body: JSON.stringify({
+          images: photoURLs.map((url) => ({
+            image_url: url,
+            report_id: docRef.id,
+            declared_category: category.toLowerCase(),
+            // Lets the backend put the classified report on its map index
+            location,
+            author_id: user.uid,
+          })),
+        }),
+        signal: AbortSignal.timeout(ML_REQUEST_TIMEOUT_MS),
+      }).catch((err) => {
+        if (err.name === "TimeoutError") {
+          throw new Error("AI analysis timed out, please try again");
+        }
+        throw err;
       });
 
       if (!mlResponse.ok) {
@@ -122,7 +142,19 @@ const ReportForm = () => {
         );
       }
 
-      const analysisResult = await mlResponse.json();
+      // The batch endpoint streams NDJSON; the "report" line holds the combined verdict
+      const lines = (await mlResponse.text())
+        .split("\n")
+        .filter(Boolean)
+        .map((line) => JSON.parse(line));
+      const reportLine = lines.find((line) => line.type === "report");
+      if (!reportLine || !reportLine.result) {
+        const failedItem = lines.find((line) => line.error);
+        throw new Error(
+          `AI analysis failed: ${failedItem?.error || "Unknown server error"}`
+        );
+      }
+      const analysisResult = reportLine.result;
 
       // UPDATED: Check for 'reject' status
       if (analysisResult.category === "reject") {